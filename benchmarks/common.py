@@ -0,0 +1,122 @@
+"""Helpers shared by the benchmarks."""
+
+import asyncio
+import statistics
+import time
+from typing import NamedTuple
+
+from starlette.types import ASGIApp, Message
+
+
+class Response(NamedTuple):
+    """Status and timings of a request, in seconds."""
+
+    status: int
+    ttfb: float
+    total: float
+
+
+async def call(
+    app: ASGIApp,
+    path: str,
+    body: bytes = b"{}",
+    headers: list[tuple[bytes, bytes]] | None = None,
+    method: str = "POST",
+) -> tuple[float, float]:
+    """Call an ASGI application once, in-process.
+
+    Returns:
+        The time to first body byte and the total time of the request in seconds.
+    """
+    response = await request(app, path, body, headers, method)
+    return response.ttfb, response.total
+
+
+async def request(  # noqa: PLR0913, PLR0917
+    app: ASGIApp,
+    path: str,
+    body: bytes = b"{}",
+    headers: list[tuple[bytes, bytes]] | None = None,
+    method: str = "POST",
+    marker: bytes = b"",
+) -> Response:
+    """Call an ASGI application once, in-process.
+
+    Args:
+        app: The application.
+        path: The path of the request.
+        body: The body of the request.
+        headers: Headers added to the JSON content type.
+        method: The method of the request.
+        marker: Bytes of the body of which the first occurrence is timed, e.g. the
+            first data event of a stream. The first body byte by default.
+
+    Returns:
+        The status, the time to the marker and the total time of the request.
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), *(headers or [])],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 8000),
+        "state": {},
+    }
+    status = 0
+    first_byte = 0.0
+    body_sent = False
+
+    async def receive() -> Message:
+        nonlocal body_sent
+        if body_sent:
+            await asyncio.Event().wait()
+        body_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message: Message) -> None:
+        nonlocal status, first_byte
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif (
+            message["type"] == "http.response.body"
+            and not first_byte
+            and marker in message.get("body", b"")
+        ):
+            first_byte = time.perf_counter()
+
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    end = time.perf_counter()
+
+    return Response(status, first_byte - start, end - start)
+
+
+async def measure(
+    app: ASGIApp,
+    path: str,
+    requests: int,
+    body: bytes = b"{}",
+    headers: list[tuple[bytes, bytes]] | None = None,
+) -> dict[str, float]:
+    """Call the route sequentially and summarize the latencies in microseconds."""
+    # Warmup builds the middleware stack
+    await call(app, path, body, headers)
+
+    ttfb, total = [], []
+    for _ in range(requests):
+        first, elapsed = await call(app, path, body, headers)
+        ttfb.append(first * 1e6)
+        total.append(elapsed * 1e6)
+
+    return {
+        "mean_us": statistics.fmean(total),
+        "p50_us": statistics.median(total),
+        "ttfb_p50_us": statistics.median(ttfb),
+    }
@@ -0,0 +1,110 @@
+"""Cold start regression check of the CLI.
+
+Runs `fastagent --help` and `fastagent setup` in fresh interpreters and fails when
+the median wall time exceeds its budget, or when a command loads a module of the
+agent stack it does not need. `setup` runs in a temporary directory with a
+configuration without database, so that it only measures the imports.
+
+Usage:
+    python benchmarks/import_time.py --runs 10 --help-budget 0.5 --setup-budget 0.8
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Modules only the server needs
+SERVER_MODULES = (
+    "asyncpg",
+    "fastapi",
+    "granian",
+    "langchain_core",
+    "langserve",
+    "questionary",
+)
+
+SCRIPT = """
+import json, sys
+from fastagent.cli import app
+try:
+    app({args!r})
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps(sorted(m for m in sys.modules if "." not in m)))
+"""
+
+COMMANDS = {
+    "help": ["--help"],
+    "setup": ["setup"],
+}
+
+
+def run(args: list[str], cwd: str) -> tuple[float, set[str]]:
+    """Run a command in a fresh interpreter.
+
+    Returns:
+        The wall time in seconds and the top level modules it loaded.
+    """
+    env = {**os.environ, "DB_USER": "fastagent", "DB_PASSWORD": "fastagent"}
+    start = time.perf_counter()
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", SCRIPT.format(args=args)],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed = time.perf_counter() - start
+
+    return elapsed, set(json.loads(result.stderr.splitlines()[-1]))
+
+
+def main(args: argparse.Namespace) -> int:
+    """Measure each command against its budget.
+
+    Returns:
+        The exit code, 1 if a command is over budget.
+    """
+    budgets = {"help": args.help_budget, "setup": args.setup_budget}
+    failed = False
+
+    with tempfile.TemporaryDirectory() as directory:
+        Path(directory, "fastagent.toml").write_text('[project]\nname = "bench"\n')
+
+        for name, command in COMMANDS.items():
+            timings = []
+            for _ in range(args.runs):
+                elapsed, modules = run(command, directory)
+                timings.append(elapsed)
+
+            median = statistics.median(timings)
+            loaded = sorted(modules.intersection(SERVER_MODULES))
+            ok = median <= budgets[name] and not loaded
+            failed = failed or not ok
+            print(  # noqa: T201
+                f"{name:<6}"
+                f" median={median * 1e3:>7.1f}ms"
+                f" min={min(timings) * 1e3:>7.1f}ms"
+                f" budget={budgets[name] * 1e3:>7.1f}ms"
+                f" server_modules={','.join(loaded) or '-'}"
+                f" {'ok' if ok else 'FAIL'}"
+            )
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--help-budget", type=float, default=0.5, help="seconds")
+    parser.add_argument("--setup-budget", type=float, default=0.8, help="seconds")
+    args = parser.parse_args()
+
+    sys.exit(main(args))
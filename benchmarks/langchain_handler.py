@@ -0,0 +1,64 @@
+"""Benchmark of the langserve handler construction.
+
+Compares building the `APIHandler` on every request, as the langchain router used
+to do through a dependency, with the handler shared by `create_langchain_router`.
+The runnable is a trivial echo so that the numbers reflect the per-request cost
+of the handler.
+
+Usage:
+    python benchmarks/langchain_handler.py --requests 5000
+"""
+
+import argparse
+import asyncio
+from typing import Annotated
+
+from common import measure
+from fastapi import APIRouter, Depends, FastAPI, Request, Response
+from langchain_core.runnables import Runnable, RunnableLambda
+from langserve import APIHandler
+
+from fastagent.integrations import create_langchain_router
+
+
+def create_legacy_router(runnable: Runnable, prefix: str = "/v1") -> APIRouter:
+    """Previous router building a handler for each request."""
+    router = APIRouter(prefix=prefix)
+
+    async def _get_invoke_handler() -> APIHandler:
+        return APIHandler(runnable, path="/agents")
+
+    @router.post("/agents/invoke")
+    async def invoke_agents_handler(
+        request: Request, runnable: Annotated[APIHandler, Depends(_get_invoke_handler)]
+    ) -> Response:
+        return await runnable.invoke(request)
+
+    return router
+
+
+async def main(requests: int) -> None:
+    """Run the benchmark for both routers."""
+    runnable = RunnableLambda(lambda x: x)
+    body = b'{"input": "hello"}'
+
+    for name, router in (
+        ("per request", create_legacy_router(runnable)),
+        ("shared", create_langchain_router(runnable)),
+    ):
+        app = FastAPI()
+        app.include_router(router)
+        result = await measure(app, "/v1/agents/invoke", requests, body)
+        print(  # noqa: T201
+            f"{name:<12}"
+            f" mean={result['mean_us']:>9.1f}us"
+            f" p50={result['p50_us']:>9.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests))
@@ -0,0 +1,192 @@
+"""Load test of the login endpoint.
+
+Compares the previous login handler, which loaded the full user and token models,
+with the current one fetching only the id and password hash. The database is
+simulated by a pool of `--connections` connections answering each statement after
+`--rtt` milliseconds, argon2 runs for real on the password executor.
+
+Usage:
+    python benchmarks/login.py --logins 100 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import UTC, datetime, timedelta
+from types import TracebackType
+
+from common import call
+from fastapi import APIRouter, FastAPI, HTTPException, Request, status
+
+from fastagent.internal.data.tokens import AuthenticationTokenCreate, Scope, new_token
+from fastagent.internal.data.users import get_user_by_email
+from fastagent.internal.security import (
+    hash_password,
+    password_executor,
+    verify_password_async,
+)
+from fastagent.routers import tokens
+
+EMAIL = "user@example.com"
+PASSWORD = "correct horse battery staple"  # noqa: S105
+BODY = f'{{"email": "{EMAIL}", "password": "{PASSWORD}"}}'.encode()
+
+
+class FakeConnection:
+    """Connection answering the login statements after a fixed delay."""
+
+    def __init__(self: "FakeConnection", rtt: float, password_hash: bytes) -> None:
+        """Initialize the connection."""
+        self.rtt = rtt
+        self.password_hash = password_hash
+        self.statements = 0
+
+    async def fetchrow(self: "FakeConnection", query: str, *_: object, **__: object):  # noqa: ANN201
+        """Return the user row matching the selected columns."""
+        self.statements += 1
+        await asyncio.sleep(self.rtt)
+        row = {"id": 1, "password_hash": self.password_hash}
+        if "created_at" in query:
+            row |= {
+                "created_at": datetime.now(UTC),
+                "name": "user",
+                "email": EMAIL,
+                "version": 1,
+            }
+            return row
+        return (row["id"], row["password_hash"])
+
+    async def execute(self: "FakeConnection", *_: object, **__: object) -> str:
+        """Pretend to insert the token."""
+        self.statements += 1
+        await asyncio.sleep(self.rtt)
+        return "INSERT 0 1"
+
+
+class FakePool:
+    """Pool with a fixed number of connections, recording the time they are held."""
+
+    def __init__(self: "FakePool", size: int, rtt: float, password_hash: bytes) -> None:
+        """Initialize the pool."""
+        self._idle = asyncio.Queue()
+        self.connections = [FakeConnection(rtt, password_hash) for _ in range(size)]
+        for conn in self.connections:
+            self._idle.put_nowait(conn)
+        self.checkouts = 0
+        self.held = 0.0
+
+    def acquire(self: "FakePool") -> "_Acquire":
+        """Acquire a connection."""
+        return _Acquire(self)
+
+
+class _Acquire:
+    def __init__(self: "_Acquire", pool: FakePool) -> None:
+        self.pool = pool
+        self.conn: FakeConnection | None = None
+        self.start = 0.0
+
+    async def __aenter__(self: "_Acquire") -> FakeConnection:
+        self.conn = await self.pool._idle.get()  # noqa: SLF001
+        self.pool.checkouts += 1
+        self.start = time.perf_counter()
+        return self.conn
+
+    async def __aexit__(
+        self: "_Acquire",
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.pool.held += time.perf_counter() - self.start
+        self.pool._idle.put_nowait(self.conn)  # noqa: SLF001
+
+
+def create_legacy_router() -> APIRouter:
+    """Previous login handler."""
+    router = APIRouter(prefix="/v1")
+
+    @router.post("/tokens/authentication", status_code=status.HTTP_201_CREATED)
+    async def create_authentication_token_handler(
+        payload: AuthenticationTokenCreate, request: Request
+    ) -> dict[str, str]:
+        async with request.app.async_pool.acquire() as conn:
+            user = await get_user_by_email(conn, payload.email)
+
+        valid = await verify_password_async(
+            payload.password.get_secret_value(), user.password_hash.get_secret_value()
+        )
+        if not valid:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+        async with request.app.async_pool.acquire() as conn:
+            token = await new_token(
+                conn, user_id=user.id, scope=Scope.AUTHENTICATION, ttl=timedelta(days=1)
+            )
+
+        return {
+            "expiry": token.expiry.isoformat(),
+            "token": token.plain_text.get_secret_value(),
+        }
+
+    return router
+
+
+async def run(
+    router: APIRouter, pool: FakePool, logins: int, concurrency: int
+) -> float:
+    """Send the logins with a fixed number of concurrent clients.
+
+    Returns:
+        The elapsed time in seconds.
+    """
+    app = FastAPI()
+    app.include_router(router)
+    app.async_pool = pool
+
+    remaining = logins
+
+    async def client() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await call(app, "/v1/tokens/authentication", BODY)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Run the load test for both handlers."""
+    password_executor.configure(
+        "thread", max_workers=args.hash_workers, max_pending=args.concurrency
+    )
+    password_executor.start()
+    password_hash = hash_password(PASSWORD)
+
+    for name, router in (("legacy", create_legacy_router()), ("lean", tokens.router)):
+        pool = FakePool(args.connections, args.rtt / 1000, password_hash)
+        elapsed = await run(router, pool, args.logins, args.concurrency)
+        statements = sum(conn.statements for conn in pool.connections)
+        print(  # noqa: T201
+            f"{name:<8}"
+            f" logins/s={args.logins / elapsed:>8.1f}"
+            f" checkouts/login={pool.checkouts / args.logins:.1f}"
+            f" statements/login={statements / args.logins:.1f}"
+            f" conn_held/login={pool.held / args.logins * 1e3:.2f}ms"
+        )
+
+    password_executor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--rtt", type=float, default=1.0, help="milliseconds")
+    parser.add_argument("--hash-workers", type=int, default=4)
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
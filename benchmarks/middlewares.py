@@ -0,0 +1,238 @@
+"""Microbenchmark of the middleware stack.
+
+Compares the `BaseHTTPMiddleware` based stack fastagent used to ship with the pure
+ASGI middlewares. The applications are called in-process, without any network, so
+the numbers only reflect the cost of the middlewares themselves.
+
+The bearer requests resolve their token from an in-memory pool that answers like
+the database, without the cost of a query.
+
+Usage:
+    python benchmarks/middlewares.py --requests 20000
+"""
+
+import argparse
+import asyncio
+import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from common import measure
+from fastapi import HTTPException, status
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from fastagent.internal.data.tokens import TOKEN_LENGTH, generate_token
+from fastagent.internal.data.tokens import Scope as TokenScope
+from fastagent.internal.data.users import AnnonymousUser, get_user_for_token
+from fastagent.internal.server.context import Context
+from fastagent.internal.server.middlewares import (
+    AuthenticationMiddleware,
+    MaxSizeMiddleware,
+    RequestLoggingMiddleware,
+)
+
+STREAM_CHUNKS = 20
+STREAM_DELAY = 0.001
+
+TOKEN, _ = generate_token()
+
+
+class LegacyMaxSizeMiddleware(BaseHTTPMiddleware):
+    """Previous body size middleware, calling the app without `dispatch`."""
+
+    def __init__(self, app: ASGIApp, *, max_size: int | None = None) -> None:
+        """Initialize the middleware."""
+        super().__init__(app)
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Call the middleware."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        total_size = 0
+
+        async def rcv() -> Message:
+            """Receive a message."""
+            nonlocal total_size
+            message = await receive()
+
+            chunk_size = len(message.get("body", b""))
+            total_size += chunk_size
+
+            if self.max_size is not None and total_size > self.max_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail="Payload too large",
+                )
+
+            return message
+
+        await self.app(scope, rcv, send)
+
+
+class LegacyRequestLoggingMiddleware(BaseHTTPMiddleware):
+    """Previous request logging middleware."""
+
+    def __init__(self, app: ASGIApp, logger: logging.Logger) -> None:
+        """Initialize the middleware."""
+        super().__init__(app)
+        self.logger = logger
+
+    async def dispatch(
+        self, request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        """Dispatch the request."""
+        self.logger.info("received request", extra={"request": request})
+        return await call_next(request)
+
+
+class LegacyAuthenticationMiddleware(BaseHTTPMiddleware):
+    """Previous authentication middleware, querying the database on every request."""
+
+    async def dispatch(
+        self, request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        """Dispatch the request."""
+        authorization = request.headers.get("Authorization")
+
+        if authorization is None or authorization == "":
+            request.state.context = Context(user=AnnonymousUser)
+        elif not authorization.startswith("Bearer "):
+            return JSONResponse(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                content={
+                    "detail": "Invalid token format, Token should start with 'Bearer '"
+                },
+                headers={"Vary": "Authorization"},
+            )
+        else:
+            token = authorization.split(" ")[1]
+
+            if len(token) != TOKEN_LENGTH:
+                return JSONResponse(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    content={"detail": "Invalid token format"},
+                    headers={"Vary": "Authorization"},
+                )
+
+            async with request.app.async_pool.acquire() as conn:
+                try:
+                    user = await get_user_for_token(
+                        conn, TokenScope.AUTHENTICATION, token
+                    )
+                except ValueError:
+                    return JSONResponse(
+                        status_code=status.HTTP_401_UNAUTHORIZED,
+                        content={"detail": "Invalid token"},
+                        headers={"Vary": "Authorization"},
+                    )
+
+            request.state.context = Context(user=user)
+
+        response = await call_next(request)
+        response.headers["Vary"] = "Authorization"
+        request.state.context = None
+        return response
+
+
+class MemoryConnection:
+    """Connection answering the token lookups with the same user."""
+
+    async def fetchrow(self, *_: Any, **__: Any) -> dict[str, Any]:  # noqa: ANN401
+        """Return the row of the user owning the token."""
+        return {
+            "id": 1,
+            "created_at": datetime.now(UTC),
+            "name": "bench",
+            "email": "bench@example.com",
+            "password_hash": b"",
+            "version": 1,
+            "expiry": datetime.now(UTC) + timedelta(hours=1),
+        }
+
+
+class MemoryPool:
+    """Pool of in-memory connections, standing in for the database pool."""
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[MemoryConnection]:
+        """Acquire a connection."""
+        yield MemoryConnection()
+
+
+async def json_endpoint(request: Request) -> JSONResponse:
+    """Return a small JSON payload."""
+    return JSONResponse({"output": "hello", "user": request.state.context.user.id})
+
+
+async def stream_endpoint(_: Request) -> StreamingResponse:
+    """Stream server sent events with a small delay between chunks."""
+
+    async def events() -> AsyncIterator[bytes]:
+        for index in range(STREAM_CHUNKS):
+            yield f"event: data\ndata: {index}\n\n".encode()
+            await asyncio.sleep(STREAM_DELAY)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def build_app(*, legacy: bool) -> Starlette:
+    """Build an application with the legacy or the current middleware stack."""
+    logger = logging.getLogger("benchmark")
+    logger.disabled = True
+
+    app = Starlette(
+        routes=[
+            Route("/json", json_endpoint, methods=["POST"]),
+            Route("/stream", stream_endpoint, methods=["POST"]),
+        ]
+    )
+    app.async_pool = MemoryPool()
+
+    if legacy:
+        app.add_middleware(LegacyMaxSizeMiddleware, max_size=1024 * 1024)
+        app.add_middleware(LegacyRequestLoggingMiddleware, logger=logger)
+        app.add_middleware(LegacyAuthenticationMiddleware)
+    else:
+        app.add_middleware(MaxSizeMiddleware, max_size=1024 * 1024)
+        app.add_middleware(RequestLoggingMiddleware, logger=logger)
+        app.add_middleware(AuthenticationMiddleware)
+
+    return app
+
+
+async def main(requests: int) -> None:
+    """Run the benchmark for both stacks."""
+    bearer = [(b"authorization", f"Bearer {TOKEN}".encode())]
+    scenarios = (
+        ("/json", "anonymous", requests, None),
+        ("/json", "bearer", requests, bearer),
+        ("/stream", "anonymous", max(1, requests // 100), None),
+    )
+    for path, user, count, headers in scenarios:
+        for name, legacy in (("BaseHTTPMiddleware", True), ("pure ASGI", False)):
+            app = build_app(legacy=legacy)
+            result = await measure(app, path, count, headers=headers)
+            print(  # noqa: T201
+                f"{path:<8} {user:<10} {name:<20}"
+                f" mean={result['mean_us']:>9.1f}us"
+                f" p50={result['p50_us']:>9.1f}us"
+                f" ttfb_p50={result['ttfb_p50_us']:>9.1f}us"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests))
@@ -0,0 +1,315 @@
+"""Benchmark suite of the request hot paths.
+
+Drives the application of `FastAgentServer` in-process, with the middlewares and
+routers it is configured with, and measures the throughput and the latencies of:
+
+- `healthcheck`: the healthcheck route.
+- `invoke_anonymous`: an invoke of the echo agent without authentication.
+- `stream_ttfc`: the time to the first data event of a stream of the echo agent.
+- `invoke_bearer`: an invoke authenticated with a bearer token.
+- `login`: the creation of an authentication token, argon2 included.
+
+The authenticated scenarios need a PostgreSQL database, they are skipped without
+`--dsn`. The tables are created if needed and a new user is added on each run.
+
+The results are written as JSON to `--output` with the environment of the run, and
+compared with the results of a previous run given with `--baseline`.
+
+Usage:
+    python benchmarks/suite.py --requests 5000 --concurrency 16 --output base.json
+    python benchmarks/suite.py --dsn postgresql://localhost/bench --baseline base.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import uuid
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime, timedelta
+from importlib.metadata import version
+from pathlib import Path
+
+from common import request
+from fastapi import FastAPI
+from langchain_core.runnables import RunnableGenerator
+
+from fastagent.configuration import Config
+from fastagent.internal.data.database import init_database, setup_postgresql_database
+from fastagent.internal.data.tokens import Scope, new_token
+from fastagent.internal.data.users import (
+    UserCreate,
+    get_credentials_by_email,
+    insert_user,
+)
+from fastagent.internal.log import shutdown_logger
+from fastagent.internal.security import hash_password, password_executor
+from fastagent.server import FastAgentServer
+
+PASSWORD = "correct horse battery staple"  # noqa: S105
+TEXT = "The quick brown fox jumps over the lazy dog"
+
+# The server reads the database credentials on creation, even without database
+os.environ.setdefault("DB_USER", "fastagent")
+os.environ.setdefault("DB_PASSWORD", "fastagent")
+
+
+async def _echo(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Stream the words of the input back, one chunk per word."""
+    async for text in chunks:
+        for word in text.split():
+            yield f"{word} "
+
+
+# Served by the benchmarked servers as `__main__:agent`
+agent = RunnableGenerator(_echo)
+
+
+def create_api(args: argparse.Namespace, *, authentication: bool) -> FastAPI:
+    """Configure a server serving the echo agent.
+
+    Returns:
+        The application of the server.
+    """
+    # The application is a class attribute, each server gets a new one
+    FastAgentServer._api = FastAPI()  # noqa: SLF001
+    configuration = Config.model_validate(
+        {
+            "project": {"app": "__main__:agent"},
+            "server": {"log_level": args.log_level},
+            "security": {
+                "authentication": "stateful-postgresql" if authentication else None,
+                "password_workers": args.hash_workers,
+                "password_max_pending": args.concurrency,
+            },
+        }
+    )
+    server = FastAgentServer(configuration, "prod")
+
+    return server._api  # noqa: SLF001
+
+
+async def run_scenario(  # noqa: PLR0913
+    app: FastAPI,
+    path: str,
+    requests: int,
+    concurrency: int,
+    *,
+    body: bytes = b"{}",
+    headers: list[tuple[bytes, bytes]] | None = None,
+    method: str = "POST",
+    marker: bytes = b"",
+) -> dict[str, float]:
+    """Send the requests with a fixed number of concurrent clients.
+
+    With a marker, the latency is the time to its first occurrence in the body,
+    otherwise the time of the whole request.
+
+    Returns:
+        The throughput, the latencies in milliseconds and the number of errors.
+    """
+    # Warmup builds the middleware stack and checks the scenario
+    response = await request(app, path, body, headers, method, marker)
+    if response.status >= 400:  # noqa: PLR2004
+        msg = f"{method} {path} failed with status {response.status}"
+        raise RuntimeError(msg)
+
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def client() -> None:
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            response = await request(app, path, body, headers, method, marker)
+            if response.status >= 400:  # noqa: PLR2004
+                errors += 1
+            latencies.append(response.ttfb if marker else response.total)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "rps": requests / elapsed,
+        "mean_ms": statistics.fmean(latencies) * 1e3,
+        "p50_ms": percentiles[49] * 1e3,
+        "p99_ms": percentiles[98] * 1e3,
+        "errors": errors,
+    }
+
+
+async def anonymous_scenarios(args: argparse.Namespace) -> dict[str, dict]:
+    """Run the scenarios of the server without authentication."""
+    app = create_api(args, authentication=False)
+    body = json.dumps({"input": " ".join([TEXT] * args.words)}).encode()
+
+    return {
+        "healthcheck": await run_scenario(
+            app, "/v1/healthcheck", args.requests, args.concurrency, method="GET"
+        ),
+        "invoke_anonymous": await run_scenario(
+            app, "/v1/agents/invoke", args.requests, args.concurrency, body=body
+        ),
+        "stream_ttfc": await run_scenario(
+            app,
+            "/v1/agents/stream",
+            args.requests,
+            args.concurrency,
+            body=body,
+            marker=b"event: data",
+        ),
+    }
+
+
+async def authenticated_scenarios(args: argparse.Namespace) -> dict[str, dict]:
+    """Run the scenarios of the server with authentication, on the database."""
+    app = create_api(args, authentication=True)
+    await setup_postgresql_database(args.dsn)
+    app.async_pool = await init_database(
+        args.dsn, max_size=args.connections, min_size=args.connections
+    )
+    password_executor.start()
+
+    try:
+        email = f"bench-{uuid.uuid4().hex}@example.com"
+        async with app.async_pool.acquire() as conn:
+            user = UserCreate(name="bench", email=email, password=PASSWORD)
+            await insert_user(conn, user, hash_password(PASSWORD))
+            user_id, _ = await get_credentials_by_email(conn, email)
+            token = await new_token(
+                conn,
+                user_id=user_id,
+                ttl=timedelta(hours=1),
+                scope=Scope.AUTHENTICATION,
+            )
+
+        bearer = f"Bearer {token.plain_text.get_secret_value()}".encode()
+        body = json.dumps({"input": " ".join([TEXT] * args.words)}).encode()
+        credentials = json.dumps({"email": email, "password": PASSWORD}).encode()
+
+        return {
+            "invoke_bearer": await run_scenario(
+                app,
+                "/v1/agents/invoke",
+                args.requests,
+                args.concurrency,
+                body=body,
+                headers=[(b"authorization", bearer)],
+            ),
+            "login": await run_scenario(
+                app,
+                "/v1/tokens/authentication",
+                args.logins,
+                args.concurrency,
+                body=credentials,
+            ),
+        }
+    finally:
+        password_executor.shutdown()
+        await app.async_pool.close()
+
+
+def environment() -> dict[str, str | None]:
+    """Describe the environment of the run, to compare runs of the same setup."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "date": datetime.now(UTC).isoformat(),
+        "commit": commit,
+        "fastagent": version("fastagent"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": str(os.cpu_count()),
+    }
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict]) -> None:
+    """Print the changes of the throughput and of the p99 latency."""
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        print(  # noqa: T201
+            f"{name:<18}"
+            f" rps {(result['rps'] / before['rps'] - 1) * 100:>+7.1f}%"
+            f" p99 {(result['p99_ms'] / before['p99_ms'] - 1) * 100:>+7.1f}%"
+        )
+
+
+async def run(args: argparse.Namespace) -> dict[str, dict]:
+    """Run the scenarios.
+
+    Returns:
+        The results of each scenario.
+    """
+    results = await anonymous_scenarios(args)
+    if args.dsn:
+        results |= await authenticated_scenarios(args)
+    shutdown_logger()
+
+    return results
+
+
+def report(args: argparse.Namespace, results: dict[str, dict]) -> None:
+    """Print and write the results, and compare them with the baseline."""
+    for name, result in results.items():
+        print(  # noqa: T201
+            f"{name:<18}"
+            f" rps={result['rps']:>9.1f}"
+            f" p50={result['p50_ms']:>8.3f}ms"
+            f" p99={result['p99_ms']:>8.3f}ms"
+            f" errors={result['errors']}"
+        )
+    if not args.dsn:
+        print("invoke_bearer and login skipped, no --dsn")  # noqa: T201
+
+    Path(args.output).write_text(
+        json.dumps(
+            {
+                "environment": environment(),
+                "parameters": vars(args) | {"dsn": bool(args.dsn)},
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        print(f"Compared with {args.baseline}")  # noqa: T201
+        compare(results, baseline["results"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--words", type=int, default=4, help="input of the agent")
+    parser.add_argument("--dsn", default=os.environ.get("FASTAGENT_BENCH_DSN"))
+    parser.add_argument("--connections", type=int, default=10)
+    parser.add_argument("--hash-workers", type=int, default=2)
+    parser.add_argument("--log-level", default="warning")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="results of a previous run")
+    args = parser.parse_args()
+
+    report(args, asyncio.run(run(args)))
@@ -1,17 +1,14 @@
-"""FastAgent CLI."""
+"""FastAgent CLI.
+
+Each command imports what it needs when it runs, so that `fastagent --help` and the
+commands not serving the agent do not load the server, the agent frameworks or the
+database driver.
+"""
 
-import asyncio
 from pathlib import Path
+from typing import Annotated
 
-import questionary
 import typer
-from rich.console import Console
-from rich.panel import Panel
-
-from fastagent.configuration import Config
-from fastagent.internal.data import setup_postgresql_database
-from fastagent.internal.settings import Settings
-from fastagent.server import FastAgentServer
 
 app = typer.Typer(
     name="fastagent",
@@ -29,6 +26,12 @@ def init(name: str | None = None, template: str | None = None) -> None:
 
     Current configuration options: project name, authentication (PostgreSQL or None), agent framework (LangChain).
     """  # noqa: E501
+    import questionary
+    from rich.console import Console
+    from rich.panel import Panel
+
+    from fastagent.configuration import Config
+
     console = Console()
 
     console.print(Panel.fit("Welcome to FastAgent 🚀", style="bold green"))
@@ -85,6 +88,13 @@ def setup() -> None:
 
     This command will create the user and token tables in the database if they don't exist.
     """  # noqa: E501
+    import asyncio
+
+    from rich.console import Console
+
+    from fastagent.configuration import Config
+    from fastagent.internal.settings import Settings
+
     console = Console()
 
     console.print("[bold green]Setting up the project...[/bold green]")
@@ -102,16 +112,66 @@ def setup() -> None:
         port=config.storage.port,
     )
 
-    if (
-        config.storage.database
-        and config.security.authentication == "stateful-postgresql"
+    response_cache = config.cache.enabled and config.cache.postgresql
+
+    if config.storage.database and (
+        config.security.authentication == "stateful-postgresql"
+        or response_cache
+        or config.storage.checkpoints
+        or config.storage.conversations
     ):
         console.print(
             f"[bold green]Setting up the user and token tables in the {config.storage.database} database...[/bold green]"  # noqa: E501
         )
 
         if config.storage.database == "postgresql":
-            asyncio.run(setup_postgresql_database(dsn))
+            from fastagent.internal.data.database import setup_postgresql_database
+
+            asyncio.run(
+                setup_postgresql_database(
+                    dsn,
+                    response_cache=response_cache,
+                    checkpoints=config.storage.checkpoints,
+                    conversations=config.storage.conversations,
+                )
+            )
+
+
+@app.command()
+def reap_tokens(batch_size: int = 1000) -> None:
+    """Delete the expired tokens from the database.
+
+    Tokens are deleted in small batches so that the table is never locked for long.
+    """
+    import asyncio
+
+    from rich.console import Console
+
+    from fastagent.configuration import Config
+    from fastagent.internal.data.database import reap_postgresql_tokens
+    from fastagent.internal.settings import Settings
+
+    console = Console()
+
+    try:
+        config = Config.from_file(path="fastagent.toml")
+    except FileNotFoundError:
+        console.print("[bold red]❌ Configuration file not found![/bold red]")
+        return
+
+    if config.storage.database != "postgresql":
+        console.print("[bold red]❌ No database configured![/bold red]")
+        return
+
+    settings = Settings()
+    dsn = settings.database.get_dsn(
+        name=config.storage.name,
+        host=config.storage.host,
+        port=config.storage.port,
+    )
+
+    deleted = asyncio.run(reap_postgresql_tokens(dsn, batch_size))
+    console.print(f"[bold green]✅ Deleted {deleted} expired tokens[/bold green]")
 
 
 @app.command()
@@ -120,6 +180,12 @@ def dev() -> None:
 
     The server will match the configuration you have set in the `fastagent.toml` or `.fastagent.toml` file.
     """  # noqa: E501
+    from rich.console import Console
+    from rich.panel import Panel
+
+    from fastagent.configuration import Config
+    from fastagent.server import FastAgentServer
+
     console = Console()
 
     config = Config.from_file(path="fastagent.toml")
@@ -137,9 +203,130 @@ def dev() -> None:
     server.serve()
 
 
+@app.command()
+def bench(  # noqa: C901, PLR0913, PLR0917
+    inputs: Path,
+    endpoint: str = "invoke",
+    concurrency: int = 64,
+    rate: float = 0.0,
+    duration: float = 30.0,
+    requests: int = 0,
+    batch_size: int = 8,
+    timeout: float = 60.0,
+    host: str | None = None,
+    port: int | None = None,
+    email: Annotated[str | None, typer.Option(envvar="FASTAGENT_EMAIL")] = None,
+    password: Annotated[str | None, typer.Option(envvar="FASTAGENT_PASSWORD")] = None,
+    output: Path | None = None,
+) -> None:
+    """Load test a running server with the inputs of a JSON lines file.
+
+    The inputs are sent in turn to the invoke, batch or stream endpoint by `concurrency` connections, as fast as possible, or at `rate` requests per second. The run stops after `duration` seconds, or once `requests` requests were sent.
+
+    The server address is read from the `fastagent.toml` file. With authentication, the user logs in with `--email` and `--password`, or the FASTAGENT_EMAIL and FASTAGENT_PASSWORD environment variables.
+    """  # noqa: E501
+    import json
+
+    import uvloop
+    from rich.console import Console
+    from rich.table import Table
+
+    from fastagent.configuration import Config
+    from fastagent.internal import bench as loadgen
+
+    console = Console()
+
+    try:
+        config = Config.from_file(path="fastagent.toml")
+    except FileNotFoundError:
+        console.print("[bold red]❌ Configuration file not found![/bold red]")
+        return
+
+    if endpoint not in loadgen.ENDPOINTS:
+        console.print(
+            f"[bold red]❌ Unknown endpoint {endpoint}, choose one of {', '.join(loadgen.ENDPOINTS)}![/bold red]"  # noqa: E501
+        )
+        return
+
+    # A server listening on all interfaces is reached through the loopback
+    host = host or config.server.host
+    if host in {"0.0.0.0", "::"}:  # noqa: S104
+        host = "127.0.0.1"
+    port = port or config.server.port
+
+    try:
+        bodies = loadgen.encode_bodies(
+            loadgen.load_inputs(inputs), endpoint, batch_size
+        )
+    except (OSError, loadgen.BenchError) as e:
+        console.print(f"[bold red]❌ {e}[/bold red]")
+        return
+
+    async def main() -> loadgen.Results:
+        token = None
+        if config.security.authentication:
+            if not email or not password:
+                msg = "The server requires authentication, set an email and a password"
+                raise loadgen.BenchError(msg)
+            token = await loadgen.login(host, port, email, password)
+
+        return await loadgen.run(
+            host,
+            port,
+            endpoint,
+            bodies,
+            concurrency=concurrency,
+            rate=rate,
+            duration=duration,
+            max_requests=requests,
+            request_timeout=timeout,
+            token=token,
+        )
+
+    console.print(
+        f"[bold green]Sending {endpoint} requests to http://{host}:{port} with {concurrency} connections...[/bold green]"  # noqa: E501
+    )
+
+    try:
+        summary = uvloop.run(main()).summary()
+    except (OSError, loadgen.BenchError) as e:
+        console.print(f"[bold red]❌ {e}[/bold red]")
+        return
+
+    console.print(
+        f"{summary['requests']} requests in {summary['elapsed_s']:.1f}s, "
+        f"[bold]{summary['throughput_rps']:.1f}[/bold] successful requests/s"
+    )
+
+    if summary["latency_ms"]:
+        table = Table("ms", *summary["latency_ms"])
+        for name, key in (
+            ("latency", "latency_ms"),
+            ("first token", "time_to_first_token_ms"),
+        ):
+            if summary[key]:
+                table.add_row(name, *(f"{v:.2f}" for v in summary[key].values()))
+        console.print(table)
+
+    if summary["errors"]:
+        errors = Table("error", "count")
+        for error, count in summary["errors"].items():
+            errors.add_row(error, str(count))
+        console.print(errors)
+
+    if output is not None:
+        output.write_text(json.dumps(summary, indent=2))
+
+
 @app.command()
 def run() -> None:
     """Run the FastAgent CLI."""
+    from rich.console import Console
+    from rich.panel import Panel
+
+    from fastagent.configuration import Config
+    from fastagent.server import FastAgentServer
+
     console = Console()
 
     config = Config.from_file(path="fastagent.toml")
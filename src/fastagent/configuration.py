@@ -1,5 +1,6 @@
 """Configuration for the project."""
 
+import os
 import tomllib
 from pathlib import Path
 from typing import Literal
@@ -15,34 +16,139 @@ class Project(BaseModel):
 
     App is the entrypoint to the application in the format `module:attribute`.
 
-    For langchain this is typically `app.main:chain`. where chain is the LangChain Runnable.
-    """  # noqa: E501
+    For langchain this is typically `app.main:chain`. where chain is the LangChain
+    Runnable.
+
+    Config modifier is an optional function in the same format, called on each request
+    to update the runnable config from the request (`(config, request) -> config`).
+
+    DSPy programs are synchronous, they run on `dspy_workers` threads per worker. Up
+    to `dspy_max_pending` calls wait for a thread, the next ones are rejected with a
+    503.
+
+    Preload lists import strings loaded by the main process before the workers are
+    forked, e.g. `app.models:load` to load a model or a tokenizer once. Functions are
+    called without arguments, modules are imported. The workers share the memory of
+    the preloaded objects instead of loading them each.
+    """
 
     name: str = Field(default="fastagent")
     framework: Literal["langchain", "langgraph", "dspy"] = Field(default="langchain")
     app: str = Field(default="app.main:api")
+    config_modifier: str | None = Field(default=None)
+    preload: list[str] = Field(default=[])
+    dspy_workers: int = Field(default=8, ge=1)
+    dspy_max_pending: int = Field(default=64, ge=0)
 
 
 class Storage(BaseModel):
-    """Storage configuration."""
+    """Storage configuration.
+
+    `max_connections` is shared by all the workers, the other pool options apply to
+    the pool of each worker. `pool_min_size` connections are opened before a worker
+    starts serving requests.
+
+    Session parameters are set on each new connection, e.g. `statement_timeout`.
+
+    With `checkpoints`, the threads of a langgraph graph are persisted in the database.
+    The checkpoints of a run are written together at the end of the run, or once
+    `checkpoint_batch_size` checkpoints and writes are waiting.
+
+    With `conversations`, the inputs and outputs of the agents are stored in the
+    database. Messages are buffered and written every `conversation_flush_interval`
+    seconds, or once `conversation_flush_size` messages are waiting. Messages are
+    dropped when `conversation_buffer_size` messages are already waiting, streamed
+    outputs are truncated beyond `conversation_max_message_bytes`. Conversations are
+    scoped to their user, a client cannot add messages to the conversation of another
+    user by sending its id.
+    """
 
     database: Literal["postgresql"] | None = Field(default=None)
     name: str | None = Field(default=None)
     host: str | None = Field(default=None)
     port: int | None = Field(default=None)
+    max_connections: int = Field(default=50, ge=1)
+    pool_min_size: int = Field(default=10, ge=0)
+    max_inactive_connection_lifetime: float = Field(default=300.0, ge=0)
+    statement_cache_size: int = Field(default=100, ge=0)
+    command_timeout: float | None = Field(default=None, gt=0)
+    max_queries: int = Field(default=50_000, ge=1)
+    session_parameters: dict[str, str] = Field(default={})
+    checkpoints: bool = Field(default=False)
+    checkpoint_batch_size: int = Field(default=100, ge=1)
+    conversations: bool = Field(default=False)
+    conversation_buffer_size: int = Field(default=10_000, ge=1)
+    conversation_flush_size: int = Field(default=500, ge=1)
+    conversation_flush_interval: float = Field(default=1.0, gt=0)
+    conversation_max_message_bytes: int = Field(default=1024 * 1024, ge=0)
 
 
 class Server(BaseModel):
     """Server configuration.
 
     Main configuration for granian server.
+
+    Workers are separate processes, `auto` starts one worker per available core.
+    Threads and threading mode are forwarded to the granian runtime of each worker.
+
+    Logs are written by a background thread when `log_queue_size` is positive, logs
+    are dropped when the queue is full. `log_sample_rate` is the fraction of requests
+    logged.
+
+    Metrics are served in the Prometheus format on `/metrics` when enabled. With
+    several workers, each worker writes its metrics every `metrics_interval` seconds
+    in `metrics_dir` (a temporary directory by default) to aggregate them.
+
+    Responses larger than `compression_min_size` bytes are compressed with zstd, when
+    the `zstandard` package is installed, or gzip when compression is enabled. Server
+    sent events are never compressed. Bodies larger than `compression_offload_size`
+    bytes are compressed in a thread to keep the event loop responsive.
     """
 
     port: int = Field(default=8000)
     host: str = Field(default="127.0.0.1")
-    workers: int = Field(default=1)
+    workers: int | Literal["auto"] = Field(default=1)
+    threads: int = Field(default=1, ge=1)
+    blocking_threads: int | None = Field(default=None)
+    threading_mode: Literal["runtime", "workers"] = Field(default="workers")
     logging: bool = Field(default=True)
     log_level: Literal["debug", "info", "warning", "error"] = Field(default="info")
+    log_format: Literal["text", "json"] = Field(default="text")
+    log_queue_size: int = Field(default=10_000, ge=0)
+    log_sample_rate: float = Field(default=1.0, ge=0, le=1)
+    metrics: bool = Field(default=False)
+    metrics_interval: float = Field(default=5.0, gt=0)
+    metrics_dir: str | None = Field(default=None)
+    compression: bool = Field(default=False)
+    compression_min_size: int = Field(default=1024, ge=0)
+    compression_offload_size: int = Field(default=256 * 1024, ge=0)
+    gzip_level: int = Field(default=6, ge=1, le=9)
+    zstd_level: int = Field(default=3, ge=1, le=22)
+
+    def get_workers(self: "Server") -> int:
+        """Get the number of worker processes to spawn.
+
+        Returns:
+            The number of workers, resolving `auto` to the number of usable cores.
+        """
+        if self.workers != "auto":
+            return max(1, self.workers)
+
+        if hasattr(os, "sched_getaffinity"):
+            return len(os.sched_getaffinity(0))
+
+        return os.cpu_count() or 1
+
+
+class RateLimit(BaseModel):
+    """Token bucket rate limit.
+
+    Each client can send `burst` requests at once, and `rate` requests per second on
+    average.
+    """
+
+    rate: float = Field(gt=0)
+    burst: int = Field(default=1, ge=1)
 
 
 class Security(BaseModel):
@@ -53,15 +159,131 @@ class Security(BaseModel):
     Choosing a authentication will require a database or backend service.
 
     Currently only supports Postgresql.
+
+    Resolved tokens are cached by each worker, a cache size of 0 disables the cache.
+
+    Passwords are hashed on a dedicated pool of threads or processes per worker,
+    requests are rejected once `password_max_pending` operations are waiting.
+
+    Expired tokens are deleted every `token_reaper_interval` seconds, 0 disables the
+    background reaper.
+
+    Rate limits apply per route group (`agents`, `tokens` or `users`), per user or per
+    IP address for anonymous clients. The `memory` store limits each worker on its
+    own, the `shared` store shares the limits between the workers of the host.
     """
 
     authentication: Literal["stateful-postgresql"] | None = Field(default=None)
+    token_cache_size: int = Field(default=10_000, ge=0)
+    token_cache_ttl: float = Field(default=60.0, ge=0)
+    token_cache_negative_ttl: float = Field(default=5.0, ge=0)
+    password_executor: Literal["thread", "process"] = Field(default="thread")
+    password_workers: int = Field(default=2, ge=1)
+    password_max_pending: int = Field(default=64, ge=0)
+    token_reaper_interval: float = Field(default=3600.0, ge=0)
+    token_reaper_batch_size: int = Field(default=1000, ge=1)
+    rate_limits: dict[Literal["agents", "tokens", "users"], RateLimit] = Field(
+        default={}
+    )
+    rate_limit_store: Literal["memory", "shared"] = Field(default="memory")
     allowed_origins: list[str] = Field(default=["*"])
     allow_credentials: bool = Field(default=False)
     ssl_cert: str | None = Field(default=None)
     ssl_key: str | None = Field(default=None)
 
 
+class Cache(BaseModel):
+    """Response cache configuration.
+
+    Caches the responses of the invoke endpoint for deterministic agents, keyed on the
+    input, the `configurable` config and, with `per_user`, the user. The config is
+    keyed once updated by the config modifier of the project, so a value it derives
+    from the request, like a tenant, must be set in `configurable`.
+
+    Each worker keeps up to `max_entries` responses and `max_bytes` bytes in memory,
+    responses larger than `max_entry_bytes` are not cached. With `postgresql`, the
+    responses are also stored in the database and shared by all the workers.
+
+    Clients bypass the cache with `Cache-Control: no-cache` (refresh the entry) or
+    `Cache-Control: no-store` (neither read nor store).
+
+    With `coalesce`, identical concurrent invoke requests share a single execution of
+    the runnable, whether the cache is enabled or not.
+    """
+
+    enabled: bool = Field(default=False)
+    ttl: float = Field(default=300.0, gt=0)
+    max_entries: int = Field(default=1024, ge=0)
+    max_bytes: int = Field(default=64 * 1024 * 1024, ge=0)
+    max_entry_bytes: int = Field(default=1024 * 1024, ge=0)
+    per_user: bool = Field(default=True)
+    postgresql: bool = Field(default=False)
+    coalesce: bool = Field(default=False)
+
+
+class Limit(BaseModel):
+    """Admission limit of an agent endpoint.
+
+    At most `max_concurrency` requests run at once, 0 disables the limit. Up to
+    `max_queue` requests wait up to `queue_timeout` seconds for a slot, the other
+    requests are rejected with a 503 status code.
+    """
+
+    max_concurrency: int = Field(default=0, ge=0)
+    max_queue: int = Field(default=0, ge=0)
+    queue_timeout: float = Field(default=10.0, gt=0)
+
+
+class Admission(BaseModel):
+    """Admission control configuration.
+
+    Limits of each agent endpoint, applied per worker. The other endpoints, like the
+    healthcheck and the authentication, are never limited.
+
+    Rejected clients are asked to retry after `retry_after` seconds.
+
+    The streamed batch endpoint runs at most `batch_concurrency` items of a batch at
+    once, and sends each result as soon as it completes.
+    """
+
+    invoke: Limit = Field(default=Limit())
+    batch: Limit = Field(default=Limit())
+    batch_stream: Limit = Field(default=Limit())
+    stream: Limit = Field(default=Limit())
+    batch_concurrency: int = Field(default=8, ge=1)
+    retry_after: int = Field(default=1, ge=0)
+
+
+class Streaming(BaseModel):
+    """Streaming configuration of the stream endpoints.
+
+    The events waiting to be sent are written together, up to `coalesce_bytes` bytes
+    per write. With a positive `coalesce_window`, a write also waits up to this many
+    seconds for more events, trading latency for fewer writes.
+
+    A comment is sent every `heartbeat_interval` seconds so that the proxies do not
+    close idle streams.
+
+    Each stream buffers at most `buffer_size` events. Once full, the agent waits for
+    the client with the `wait` policy. With the `close` policy, it waits at most
+    `slow_consumer_timeout` seconds, then the stream ends with an error event after
+    the buffered events.
+
+    The WebSocket endpoint runs at most `websocket_max_runs` runs at once on each
+    connection, and closes the connections without any run for
+    `websocket_idle_timeout` seconds.
+    """
+
+    coalesce_window: float = Field(default=0.0, ge=0)
+    coalesce_bytes: int = Field(default=16 * 1024, ge=1)
+    heartbeat_interval: float = Field(default=15.0, gt=0)
+    buffer_size: int = Field(default=256, ge=1)
+    slow_consumer: Literal["wait", "close"] = Field(default="wait")
+    slow_consumer_timeout: float = Field(default=1.0, gt=0)
+    websocket_idle_timeout: float = Field(default=300.0, gt=0)
+    websocket_max_runs: int = Field(default=16, ge=1)
+
+
 class Config(BaseModel):
     """Configuration for the project.
 
@@ -74,6 +296,9 @@ class Config(BaseModel):
     security: Security = Field(default=Security())
     storage: Storage = Field(default=Storage())
     server: Server = Field(default=Server())
+    cache: Cache = Field(default=Cache())
+    admission: Admission = Field(default=Admission())
+    streaming: Streaming = Field(default=Streaming())
 
     @classmethod
     def from_file(cls: type["Config"], path: str = "fastagent.toml") -> "Config":
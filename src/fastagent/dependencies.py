@@ -1,21 +1,31 @@
 """Dependencies."""
 
-from fastapi import Depends, HTTPException, Request, status
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, WebSocketException, status
+from starlette.requests import HTTPConnection
 
 from fastagent.internal.data.users import is_anonymous
+from fastagent.internal.settings import Settings, get_settings
 
 
-def require_auth(request: Request) -> None:
+def require_auth(connection: HTTPConnection) -> None:
     """Raise an error if the user is anonymous.
 
     Args:
-        request: The request.
+        connection: The request or the WebSocket connection.
 
     Raises:
-        HTTPException: If the user is anonymous.
+        HTTPException: If the user of a request is anonymous.
+        WebSocketException: If the user of a WebSocket connection is anonymous.
     """
-    if request.state.context is None or is_anonymous(request.state.context.user):
+    context = connection.state.context
+    if context is None or is_anonymous(context.user):
+        if connection.scope["type"] == "websocket":
+            raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
 
 require_auth_dependency = Depends(require_auth)
+
+SettingsDependency = Annotated[Settings, Depends(get_settings)]
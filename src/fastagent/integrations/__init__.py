@@ -1,3 +1,23 @@
-from fastagent.integrations.langchain import create_langchain_router
+"""Routers serving the agents of each framework.
 
-__all__ = ["create_langchain_router"]
+The routers are imported on first access, so that serving a framework does not load
+the others.
+"""
+
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from fastagent.integrations.langchain import AgentSession, create_langchain_router
+
+__all__ = ["AgentSession", "create_langchain_router"]
+
+
+def __getattr__(name: str) -> Any:  # noqa: ANN401
+    """Import the langchain router on first access."""
+    if name in __all__:
+        from fastagent.integrations import langchain  # noqa: PLC0415
+
+        return getattr(langchain, name)
+
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
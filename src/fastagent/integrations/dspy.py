@@ -0,0 +1,142 @@
+"""Program router."""
+
+import asyncio
+import functools
+import json
+from typing import TYPE_CHECKING, Any
+
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+from fastagent.internal.data.conversations import (
+    CONVERSATION_HEADER,
+    ConversationRecorder,
+    conversation_id,
+    request_user_id,
+)
+from fastagent.internal.executor import (
+    ExecutorBusyError,
+    ProgramExecutor,
+    program_executor,
+)
+from fastagent.internal.metrics import RUNNABLE_DURATION
+
+if TYPE_CHECKING:
+    import dspy
+
+
+class ProgramRequest(BaseModel):
+    """Invoke request of a program, the input holds the keyword arguments."""
+
+    input: dict[str, Any] = Field(default={})
+
+
+class ProgramBatchRequest(BaseModel):
+    """Batch request of a program."""
+
+    inputs: list[dict[str, Any]] = Field(min_length=1)
+
+
+def _output(prediction: object) -> object:
+    """Convert the prediction of a program to JSON compatible data."""
+    to_dict = getattr(prediction, "toDict", None)
+    if callable(to_dict):
+        prediction = to_dict()
+
+    return jsonable_encoder(prediction)
+
+
+async def _run(
+    program: "dspy.Module", executor: ProgramExecutor, inputs: dict[str, Any]
+) -> object:
+    """Run the program on the executor.
+
+    Raises:
+        HTTPException: The executor is saturated.
+    """
+    try:
+        # The inputs are bound first, an input may be named like an argument of run
+        prediction = await executor.run(functools.partial(program, **inputs))
+    except ExecutorBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        ) from e
+
+    return _output(prediction)
+
+
+def create_dspy_router(
+    program: "dspy.Module",
+    prefix: str = "/v1",
+    executor: ProgramExecutor = program_executor,
+    recorder: ConversationRecorder | None = None,
+) -> APIRouter:
+    """Create a router for the program.
+
+    DSPy programs are synchronous, they run on the threads of the executor so that
+    the event loop keeps serving other requests.
+
+    Args:
+        program: The program to serve.
+        prefix: The prefix of the routes.
+        executor: The executor running the program.
+        recorder: Optional recorder of the inputs and outputs.
+
+    Returns:
+        The router serving the program.
+    """
+    router = APIRouter(prefix=prefix, tags=["agent"])
+
+    @router.post("/agents/invoke")
+    async def invoke_agents_handler(
+        payload: ProgramRequest, request: Request
+    ) -> Response:
+        """Handle invoke request."""
+        with RUNNABLE_DURATION.time("invoke"):
+            output = await _run(program, executor, payload.input)
+
+        response = JSONResponse({"output": output})
+        if recorder is not None:
+            conversation = conversation_id(request)
+            recorder.record_exchange(
+                conversation,
+                request_user_id(request),
+                "invoke",
+                json.dumps(jsonable_encoder(payload.input)),
+                response.body.decode(),
+            )
+            response.headers[CONVERSATION_HEADER] = str(conversation)
+
+        return response
+
+    @router.post("/agents/batch")
+    async def batch_agents_handler(payload: ProgramBatchRequest) -> dict[str, Any]:
+        """Handle batch request.
+
+        The inputs are fanned out over the threads of the executor. A batch takes at
+        most as many threads as the executor has, so that it does not starve the
+        other requests.
+        """
+        semaphore = asyncio.Semaphore(executor.max_workers)
+
+        async def run(inputs: dict[str, Any]) -> object:
+            async with semaphore:
+                return await _run(program, executor, inputs)
+
+        tasks = [asyncio.ensure_future(run(inputs)) for inputs in payload.inputs]
+        try:
+            with RUNNABLE_DURATION.time("batch"):
+                outputs = await asyncio.gather(*tasks)
+        except BaseException:
+            # The items waiting for a thread are not started
+            for task in tasks:
+                task.cancel()
+            raise
+
+        return {"output": outputs}
+
+    return router
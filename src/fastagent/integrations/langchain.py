@@ -1,39 +1,947 @@
 """Agent router."""
 
-from typing import Annotated
+import asyncio
+import contextlib
+import functools
+import itertools
+import json
+import logging
+import math
+import time
+import uuid
+from collections.abc import AsyncIterator, Iterable
+from typing import Annotated, Any, Literal
 
-from fastapi import APIRouter, Depends, Request, Response
-from langchain_core.runnables import Runnable
+from fastapi import APIRouter, HTTPException, Request, Response, WebSocket, status
+from fastapi.exceptions import RequestValidationError
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import get_config_list
 from langserve import APIHandler
+from langserve.api_handler import (
+    PerRequestConfigModifier,
+    _unpack_input,
+    _unpack_request_config,
+    _update_config_with_defaults,
+)
+from langserve.serialization import WellKnownLCSerializer
+from langserve.validation import BatchRequestShallowValidator
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 from sse_starlette import EventSourceResponse
+from sse_starlette.sse import ensure_bytes
+from starlette.responses import StreamingResponse
 
+from fastagent.internal.admission import AdmissionRejectedError, ConcurrencyLimiter
+from fastagent.internal.coalescing import Coalescer
+from fastagent.internal.data.conversations import (
+    CONVERSATION_HEADER,
+    ConversationRecorder,
+    conversation_id,
+    request_user_id,
+)
+from fastagent.internal.data.responses import ResponseCache, cache_key
+from fastagent.internal.metrics import RUNNABLE_DURATION, TIME_TO_FIRST_CHUNK
+from fastagent.internal.ratelimit import RateLimiter
+from fastagent.internal.server import BEARER_SUBPROTOCOL, rate_limit_key
+from fastagent.internal.streaming import (
+    EventStreamer,
+    SlowConsumerError,
+    event_streamer,
+)
 
-def create_langchain_router(runnable: Runnable, prefix: str = "/v1") -> APIRouter:
-    """Create a router for the agent."""
+logger = logging.getLogger("_fastagent.langchain")
+
+# Config keys the clients can set, the default of langserve
+CONFIG_KEYS = ("configurable",)
+
+serializer = WellKnownLCSerializer()
+
+# Encoding of the langserve events, as done by the event source response
+encode_event = functools.partial(ensure_bytes, sep="\r\n")
+
+
+async def _instrument_stream(
+    events: AsyncIterator[dict], route: str, start: float
+) -> AsyncIterator[dict]:
+    """Record the time to the first event and the duration of the stream.
+
+    Langserve sends its first event once the runnable produced its first chunk.
+    """
+    first = True
+    try:
+        # Closing the stream closes the stream of langserve, and the runnable
+        async with contextlib.aclosing(events):
+            async for event in events:
+                if first:
+                    TIME_TO_FIRST_CHUNK.observe(time.perf_counter() - start, route)
+                    first = False
+                yield event
+    finally:
+        RUNNABLE_DURATION.observe(time.perf_counter() - start, "stream")
+
+
+async def _invoke(handler: APIHandler, request: Request) -> Response:
+    """Invoke the runnable and record its execution time."""
+    with RUNNABLE_DURATION.time("invoke"):
+        return await handler.invoke(request)
+
+
+def _copy_response(response: Response) -> Response:
+    """Copy a response shared between coalesced requests."""
+    return Response(
+        content=response.body,
+        status_code=response.status_code,
+        headers=response.headers,
+    )
+
+
+async def _invoke_key(
+    request: Request,
+    payload: Any,  # noqa: ANN401
+    config_model: type[BaseModel] | None,
+    per_req_config_modifier: PerRequestConfigModifier | None,
+    *,
+    per_user: bool,
+) -> bytes:
+    """Compute the cache key of an invoke request.
+
+    The config is derived from the request like the langserve handler does, so that
+    the values set by the config modifier are part of the key.
+
+    Raises:
+        ValidationError: The config of the body is not valid.
+        HTTPException: The config modifier rejected the request.
+    """
+    context = getattr(request.state, "context", None)
+    user_id = context.user.id if per_user and context is not None else None
+
+    if per_req_config_modifier is None:
+        return cache_key(payload, user_id)
+
+    config = payload.get("config") if isinstance(payload, dict) else None
+    config = await _unpack_request_config(
+        config if isinstance(config, dict) else {},
+        config_keys=CONFIG_KEYS,
+        model=config_model,
+        request=request,
+        per_req_config_modifier=per_req_config_modifier,
+        server_config=None,
+    )
+    return cache_key(payload, user_id, config)
+
+
+async def _shared_invoke(  # noqa: C901, PLR0913
+    handler: APIHandler,
+    request: Request,
+    cache: ResponseCache | None,
+    coalescer: Coalescer | None,
+    *,
+    per_user: bool,
+    config_model: type[BaseModel] | None = None,
+    per_req_config_modifier: PerRequestConfigModifier | None = None,
+) -> Response:
+    """Serve the invoke request from the cache or from a shared execution.
+
+    Identical concurrent requests share a single execution of the runnable when a
+    coalescer is given, the response is cached once by the shared execution.
+
+    With a config modifier, the key covers the config it derives from the request,
+    e.g. from its headers, so the modifier is also called before the handler runs.
+
+    The outcome is reported in the `Cache-Status` header (RFC 9211). Cached and
+    shared bodies are replayed as is, including the run id of the original response.
+
+    Args:
+        handler: The langserve handler.
+        request: The request.
+        cache: The response cache.
+        coalescer: The coalescer of the concurrent executions.
+        per_user: Scope the entries and executions to the authenticated user.
+        config_model: The model validating the config, with a config modifier.
+        per_req_config_modifier: Optional function updating the config from the
+            request.
+
+    Returns:
+        The response.
+    """
+    cache_control = request.headers.get("Cache-Control", "").lower()
+
+    if "no-store" in cache_control:
+        response = await _invoke(handler, request)
+        response.headers["Cache-Status"] = "fastagent; fwd=bypass"
+        return response
+
+    try:
+        # The decoded body is kept on the request and reused by the handler
+        payload = await request.json()
+    except json.JSONDecodeError:
+        return await _invoke(handler, request)
+
+    try:
+        key = await _invoke_key(
+            request,
+            payload,
+            config_model,
+            per_req_config_modifier,
+            per_user=per_user,
+        )
+    except (ValidationError, HTTPException):
+        # The handler responds with the error
+        return await _invoke(handler, request)
+    pool = getattr(request.app, "async_pool", None)
+
+    forward = "miss"
+    if cache is not None and "no-cache" in cache_control:
+        forward = "request"
+    elif cache is not None:
+        cached = await cache.get(key, pool)
+
+        if cached is not None:
+            body, tier = cached
+            return Response(
+                content=body,
+                media_type="application/json",
+                headers={"Cache-Status": f"fastagent; hit; detail={tier}"},
+            )
+
+    async def execute() -> tuple[Response, bool]:
+        response = await _invoke(handler, request)
+        stored = (
+            cache is not None
+            and response.status_code == status.HTTP_200_OK
+            and await cache.set(key, response.body, pool)
+        )
+        return response, stored
+
+    shared = False
+    if coalescer is None:
+        response, stored = await execute()
+    else:
+        (response, stored), shared = await coalescer.run(key, execute)
+        if shared:
+            response = _copy_response(response)
+
+    if cache is None and not shared:
+        return response
+
+    cache_status = f"fastagent; fwd={forward}"
+    if stored:
+        cache_status += "; stored"
+    if shared:
+        cache_status += "; collapsed"
+    response.headers["Cache-Status"] = cache_status
+
+    return response
+
+
+async def _batch_items(
+    request: Request,
+    config_model: type[BaseModel],
+    run_name: str,
+    per_req_config_modifier: PerRequestConfigModifier | None,
+) -> tuple[list[Any], list[RunnableConfig]]:
+    """Decode the inputs and configs of a batch request like langserve does.
+
+    Raises:
+        RequestValidationError: The body is not a valid batch request.
+        HTTPException: The config is not a dict or a list, or the number of configs
+            does not match the number of inputs.
+    """
+    try:
+        body = BatchRequestShallowValidator.model_validate(await request.json())
+    except json.JSONDecodeError:
+        raise RequestValidationError(errors=["Invalid JSON body"]) from None
+    except ValidationError as e:
+        raise RequestValidationError(e.errors()) from e
+
+    if not isinstance(body.inputs, list):
+        raise RequestValidationError(errors=["Value for 'inputs' must be a list"])
+
+    if body.config is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Value for 'config' key must be a dict or list if provided",
+        )
+
+    client_configs = body.config if isinstance(body.config, list) else [body.config]
+
+    if isinstance(body.config, list) and len(body.config) != len(body.inputs):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Number of configs ({len(body.config)}) must match number of "
+            f"inputs ({len(body.inputs)})",
+        )
+
+    try:
+        configs = [
+            await _unpack_request_config(
+                config,
+                config_keys=CONFIG_KEYS,
+                model=config_model,
+                request=request,
+                per_req_config_modifier=per_req_config_modifier,
+                server_config=None,
+            )
+            for config in client_configs
+        ]
+    except ValidationError as e:
+        raise RequestValidationError(e.errors()) from e
+
+    return body.inputs, [
+        _update_config_with_defaults(run_name, config, request, endpoint="batch")
+        for config in get_config_list(
+            configs if isinstance(body.config, list) else configs[0], len(body.inputs)
+        )
+    ]
+
+
+async def _run_item(
+    runnable: Runnable,
+    input_: object,
+    config: RunnableConfig,
+) -> dict[str, Any]:
+    """Run the runnable on a single item of a batch.
+
+    Returns:
+        The output and run id of the item, or its error.
+    """
+    try:
+        validated = runnable.with_config(config).input_schema.model_validate(input_)
+    except ValidationError as e:
+        return {
+            "error": {
+                "status_code": status.HTTP_422_UNPROCESSABLE_ENTITY,
+                "message": "Invalid input",
+                "detail": e.errors(include_url=False, include_context=False),
+            }
+        }
+
+    try:
+        output = await runnable.ainvoke(_unpack_input(validated), config)
+    except Exception:
+        logger.exception("Batch item failed")
+        return {
+            "error": {
+                "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                "message": "Internal Server Error",
+            }
+        }
+
+    return {"output": output, "metadata": {"run_id": str(config["run_id"])}}
+
+
+async def _run_as_completed(
+    runnable: Runnable,
+    items: Iterable[tuple[Any, RunnableConfig]],
+    max_concurrency: int,
+) -> AsyncIterator[dict[str, Any]]:
+    """Run the items of a batch and yield their results as soon as they complete.
+
+    At most `max_concurrency` items run at once, a new item starts each time one
+    completes, so that only the outputs of the running items are held in memory. The
+    running items are cancelled when the client disconnects.
+    """
+    items = enumerate(items)
+    pending: dict[asyncio.Task, int] = {}
+
+    try:
+        while True:
+            for index, (input_, config) in itertools.islice(
+                items, max_concurrency - len(pending)
+            ):
+                task = asyncio.ensure_future(_run_item(runnable, input_, config))
+                pending[task] = index
+
+            if not pending:
+                return
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield {"index": pending.pop(task), **task.result()}
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _stream_batch(  # noqa: PLR0913
+    request: Request,
+    runnable: Runnable,
+    config_model: type[BaseModel],
+    run_name: str,
+    per_req_config_modifier: PerRequestConfigModifier | None,
+    *,
+    max_concurrency: int,
+) -> Response:
+    """Stream the results of a batch request as they complete.
+
+    Results are sent as server sent events when the client accepts
+    `text/event-stream`, as newline delimited JSON otherwise. Each result carries the
+    index of its input, and either the output or the error of the item.
+
+    Clients can lower the concurrency with the `max_concurrency` query parameter.
+    """
+    inputs, configs = await _batch_items(
+        request, config_model, run_name, per_req_config_modifier
+    )
+
+    try:
+        requested = int(request.query_params.get("max_concurrency", max_concurrency))
+    except ValueError:
+        requested = max_concurrency
+    max_concurrency = min(max(requested, 1), max_concurrency)
+
+    results = _run_as_completed(
+        runnable, zip(inputs, configs, strict=True), max_concurrency
+    )
+
+    async def timed(
+        results: AsyncIterator[dict[str, Any]],
+    ) -> AsyncIterator[dict[str, Any]]:
+        with RUNNABLE_DURATION.time("batch_stream"):
+            async for result in results:
+                yield result
+
+    if "text/event-stream" in request.headers.get("Accept", ""):
+
+        async def events() -> AsyncIterator[dict[str, str]]:
+            async for result in timed(results):
+                yield {"event": "data", "data": serializer.dumps(result).decode()}
+            yield {"event": "end"}
+
+        return EventSourceResponse(events())
+
+    async def lines() -> AsyncIterator[bytes]:
+        async for result in timed(results):
+            yield serializer.dumps(result) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def _request_input(request: Request) -> str | None:
+    """Get the input of a request already decoded by the handler, as JSON."""
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError:
+        return None
+
+    return json.dumps(payload.get("input") if isinstance(payload, dict) else None)
+
+
+async def _record_invoke(
+    recorder: ConversationRecorder, request: Request, response: Response
+) -> None:
+    """Record the input and output of a successful invoke request."""
+    input_ = await _request_input(request)
+    if input_ is None or response.status_code != status.HTTP_200_OK:
+        return
+
+    conversation = conversation_id(request)
+    recorder.record_exchange(
+        conversation,
+        request_user_id(request),
+        "invoke",
+        input_,
+        response.body.decode(),
+    )
+    response.headers[CONVERSATION_HEADER] = str(conversation)
+
+
+async def _record_stream(
+    events: AsyncIterator[dict],
+    recorder: ConversationRecorder,
+    request: Request,
+    conversation: uuid.UUID,
+) -> AsyncIterator[dict]:
+    """Tee the stream to the recorder.
+
+    The events are forwarded as they come, the output is recorded once the stream
+    ends so that the time to the first chunk is unchanged.
+    """
+    transcript = recorder.transcript()
+
+    try:
+        async with contextlib.aclosing(events):
+            async for event in events:
+                if event.get("event") == "data":
+                    transcript.append(event["data"])
+                yield event
+    finally:
+        input_ = await _request_input(request)
+        if input_ is not None:
+            recorder.record_exchange(
+                conversation,
+                request_user_id(request),
+                "stream",
+                input_,
+                transcript.content(),
+                truncated=transcript.truncated,
+            )
+
+
+class RunMessage(BaseModel):
+    """Message starting a run."""
+
+    type: Literal["run"]
+    id: str = Field(min_length=1, max_length=128)
+    input: Any = Field(default=None)
+    config: dict[str, Any] = Field(default={})
+    conversation_id: uuid.UUID | None = Field(default=None)
+
+
+class CancelMessage(BaseModel):
+    """Message cancelling a run."""
+
+    type: Literal["cancel"]
+    id: str = Field(min_length=1, max_length=128)
+
+
+client_message = TypeAdapter(
+    Annotated[RunMessage | CancelMessage, Field(discriminator="type")]
+)
+
+
+class AgentSession:
+    """Runs of a runnable multiplexed over a WebSocket connection.
+
+    The user is authenticated once, when the connection opens. Messages are JSON
+    objects:
+
+    - the client starts a run with `{"type": "run", "id": ..., "input": ...,
+      "config": ...}` and cancels it with `{"type": "cancel", "id": ...}`,
+    - the server sends the chunks of each run as `{"type": "data", "id": ...,
+      "data": ...}`, followed by `{"type": "end", "id": ...}`, `{"type":
+      "cancelled", "id": ...}` or `{"type": "error", "id": ..., "status_code": ...,
+      "message": ...}`.
+
+    Each run takes a token of the rate limiter and a slot of the concurrency limiter
+    of the stream endpoint, like a stream request. The rejected runs get an error
+    with the status code of the rejected requests.
+
+    The chunks of each run are buffered by the event streamer, so a run only holds a
+    bounded number of chunks. An idle session, without any run in progress, holds no
+    task besides the one waiting for the next message. It is closed after
+    `idle_timeout` seconds.
+    """
+
+    # Sessions and runs in progress in the worker, for the metrics
+    connections = 0
+    runs = 0
+
+    def __init__(  # noqa: PLR0913
+        self: "AgentSession",
+        websocket: WebSocket,
+        runnable: Runnable,
+        run_name: str,
+        per_req_config_modifier: PerRequestConfigModifier | None = None,
+        *,
+        streamer: EventStreamer = event_streamer,
+        recorder: ConversationRecorder | None = None,
+        idle_timeout: float = 300.0,
+        max_runs: int = 16,
+        limiter: ConcurrencyLimiter | None = None,
+        rate_limiter: RateLimiter | None = None,
+        config_model: type[BaseModel] | None = None,
+    ) -> None:
+        """Initialize the session.
+
+        Args:
+            websocket: The connection.
+            runnable: The runnable to serve.
+            run_name: The name of the runs.
+            per_req_config_modifier: Optional function updating the runnable config
+                from the connection, called on every run.
+            streamer: The streamer buffering the chunks of each run.
+            recorder: Optional recorder of the runs.
+            idle_timeout: The time in seconds without any run before the connection
+                is closed.
+            max_runs: The maximum number of runs in progress.
+            limiter: Optional concurrency limiter, a run holds a slot.
+            rate_limiter: Optional rate limiter, a run takes a token.
+            config_model: The model validating the configs of the runs, built from
+                the runnable by default.
+        """
+        self.websocket = websocket
+        self.runnable = runnable
+        self.run_name = run_name
+        self.per_req_config_modifier = per_req_config_modifier
+        self.streamer = streamer
+        self.recorder = recorder
+        self.idle_timeout = idle_timeout
+        self.max_runs = max_runs
+        self.limiter = limiter
+        self.rate_limiter = rate_limiter
+        self.config_model = config_model or runnable.config_schema(include=CONFIG_KEYS)
+        self._runs: dict[str, asyncio.Task] = {}
+        self._send_lock = asyncio.Lock()
+        self._timeout: asyncio.Timeout | None = None
+        self._closed = False
+
+    async def serve(self: "AgentSession") -> None:
+        """Accept the connection and serve its runs until it is closed."""
+        offered = self.websocket.scope.get("subprotocols", [])
+        await self.websocket.accept(
+            subprotocol=BEARER_SUBPROTOCOL if BEARER_SUBPROTOCOL in offered else None
+        )
+        type(self).connections += 1
+
+        try:
+            async with asyncio.timeout(None) as self._timeout:
+                self._reset_idle_timeout()
+                while True:
+                    message = await self.websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        return
+                    await self._handle(message.get("text") or message.get("bytes"))
+        except TimeoutError:
+            await self.websocket.close(reason="Idle timeout")
+        finally:
+            self._closed = True
+            for task in self._runs.values():
+                task.cancel()
+            type(self).connections -= 1
+
+    async def _handle(self: "AgentSession", data: str | bytes | None) -> None:
+        """Handle a message of the client."""
+        try:
+            message = client_message.validate_json(data or b"")
+        except ValidationError as e:
+            await self._send_error(
+                None,
+                status.HTTP_422_UNPROCESSABLE_ENTITY,
+                "Invalid message",
+                e.errors(include_url=False, include_context=False, include_input=False),
+            )
+            return
+
+        if isinstance(message, CancelMessage):
+            await self._cancel(message.id)
+        else:
+            await self._start(message)
+
+    async def _start(self: "AgentSession", message: RunMessage) -> None:
+        """Validate a run and start it in its own task."""
+        if message.id in self._runs:
+            await self._send_error(
+                message.id, status.HTTP_409_CONFLICT, "Run already in progress"
+            )
+            return
+
+        if len(self._runs) >= self.max_runs:
+            await self._send_error(
+                message.id, status.HTTP_429_TOO_MANY_REQUESTS, "Too many runs"
+            )
+            return
+
+        if self.rate_limiter is not None:
+            scope = self.websocket.scope
+            retry_after = self.rate_limiter.check(scope["path"], rate_limit_key(scope))
+            if retry_after is not None:
+                await self._send_error(
+                    message.id,
+                    status.HTTP_429_TOO_MANY_REQUESTS,
+                    "Rate limit exceeded",
+                    {"retry_after": math.ceil(retry_after)},
+                )
+                return
+
+        try:
+            config = await _unpack_request_config(
+                message.config,
+                config_keys=CONFIG_KEYS,
+                model=self.config_model,
+                request=self.websocket,
+                per_req_config_modifier=self.per_req_config_modifier,
+                server_config=None,
+            )
+            config = _update_config_with_defaults(
+                self.run_name, config, self.websocket, endpoint="stream"
+            )
+            validated = self.runnable.with_config(config).input_schema.model_validate(
+                message.input
+            )
+        except ValidationError as e:
+            await self._send_error(
+                message.id,
+                status.HTTP_422_UNPROCESSABLE_ENTITY,
+                "Invalid input",
+                e.errors(include_url=False, include_context=False, include_input=False),
+            )
+            return
+        except HTTPException as e:
+            # Raised by the config modifier, the other runs go on
+            await self._send_error(message.id, e.status_code, str(e.detail))
+            return
+
+        task = asyncio.create_task(self._run(message, _unpack_input(validated), config))
+        self._runs[message.id] = task
+        type(self).runs += 1
+        self._reset_idle_timeout()
+        task.add_done_callback(lambda _: self._discard(message.id))
+
+    async def _cancel(self: "AgentSession", run_id: str) -> None:
+        """Cancel a run and wait for it to stop."""
+        task = self._runs.get(run_id)
+        if task is None:
+            await self._send_error(run_id, status.HTTP_404_NOT_FOUND, "Unknown run")
+            return
+
+        task.cancel()
+        await asyncio.wait([task])
+        await self._send({"type": "cancelled", "id": run_id})
+
+    async def _run(
+        self: "AgentSession",
+        message: RunMessage,
+        input_: Any,  # noqa: ANN401
+        config: RunnableConfig,
+    ) -> None:
+        """Run the runnable in a slot of the concurrency limiter."""
+        if self.limiter is None:
+            await self._stream(message, input_, config)
+            return
+
+        try:
+            await self.limiter.acquire()
+        except AdmissionRejectedError as e:
+            await self._send_error(
+                message.id, status.HTTP_503_SERVICE_UNAVAILABLE, str(e)
+            )
+            return
+
+        try:
+            await self._stream(message, input_, config)
+        finally:
+            self.limiter.release()
+
+    async def _stream(
+        self: "AgentSession",
+        message: RunMessage,
+        input_: Any,  # noqa: ANN401
+        config: RunnableConfig,
+    ) -> None:
+        """Stream the chunks of the runnable."""
+        prefix = f'{{"type":"data","id":{json.dumps(message.id)},"data":'
+        transcript = self.recorder.transcript() if self.recorder else None
+
+        async def chunks() -> AsyncIterator[str]:
+            async for chunk in self.runnable.astream(input_, config):
+                data = serializer.dumps(chunk).decode()
+                if transcript is not None:
+                    transcript.append(data)
+                yield f"{prefix}{data}}}"
+
+        end: dict[str, Any] = {"type": "end", "id": message.id}
+        try:
+            with RUNNABLE_DURATION.time("stream"):
+                async for batch in self.streamer.batches(chunks()):
+                    async with self._send_lock:
+                        for text in batch:
+                            await self.websocket.send_text(text)
+        except SlowConsumerError:
+            await self._send_error(
+                message.id, status.HTTP_503_SERVICE_UNAVAILABLE, "Client too slow"
+            )
+            return
+        except Exception:
+            if self._closed:
+                return
+            logger.exception("WebSocket run failed")
+            await self._send_error(
+                message.id,
+                status.HTTP_500_INTERNAL_SERVER_ERROR,
+                "Internal Server Error",
+            )
+            return
+        finally:
+            if transcript is not None:
+                conversation = message.conversation_id or uuid.uuid4()
+                end["conversation_id"] = str(conversation)
+                self.recorder.record_exchange(
+                    conversation,
+                    request_user_id(self.websocket),
+                    "stream",
+                    json.dumps(message.input),
+                    transcript.content(),
+                    truncated=transcript.truncated,
+                )
+
+        await self._send(end)
+
+    def _discard(self: "AgentSession", run_id: str) -> None:
+        """Forget a finished run."""
+        self._runs.pop(run_id, None)
+        type(self).runs -= 1
+        self._reset_idle_timeout()
+
+    def _reset_idle_timeout(self: "AgentSession") -> None:
+        """Start the idle timeout once no run is in progress, stop it otherwise."""
+        if self._timeout is None or self._closed:
+            return
+
+        if self._runs:
+            self._timeout.reschedule(None)
+        else:
+            loop = asyncio.get_running_loop()
+            self._timeout.reschedule(loop.time() + self.idle_timeout)
+
+    async def _send_error(
+        self: "AgentSession",
+        run_id: str | None,
+        status_code: int,
+        message: str,
+        detail: object = None,
+    ) -> None:
+        """Send the error of a run, or of a message without run."""
+        error = {
+            "type": "error",
+            "id": run_id,
+            "status_code": status_code,
+            "message": message,
+        }
+        if detail is not None:
+            error["detail"] = detail
+        await self._send(error)
+
+    async def _send(self: "AgentSession", message: dict[str, Any]) -> None:
+        """Send a message, unless the connection is closed."""
+        if self._closed:
+            return
+
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(message))
+
+
+def create_langchain_router(  # noqa: PLR0913
+    runnable: Runnable,
+    prefix: str = "/v1",
+    per_req_config_modifier: PerRequestConfigModifier | None = None,
+    cache: ResponseCache | None = None,
+    coalescer: Coalescer | None = None,
+    *,
+    per_user: bool = True,
+    batch_concurrency: int = 8,
+    recorder: ConversationRecorder | None = None,
+    streamer: EventStreamer | None = None,
+    websocket_idle_timeout: float = 300.0,
+    websocket_max_runs: int = 16,
+    websocket_limiter: ConcurrencyLimiter | None = None,
+    rate_limiter: RateLimiter | None = None,
+) -> APIRouter:
+    """Create a router for the agent.
+
+    The handler resolves the input, output and request models of the runnable
+    once, when the router is created at startup, and is shared by all endpoints.
+
+    Args:
+        runnable: The runnable to serve.
+        prefix: The prefix of the routes.
+        per_req_config_modifier: Optional function updating the runnable config
+            from the request, called on every request.
+        cache: Optional cache of the invoke responses.
+        coalescer: Optional coalescer sharing the identical concurrent invocations.
+        per_user: Scope the cached responses and the shared invocations to the
+            authenticated user.
+        batch_concurrency: The maximum number of items of a streamed batch running
+            at once.
+        recorder: Optional recorder of the invoke and stream conversations.
+        streamer: Optional streamer coalescing and bounding the streamed events.
+        websocket_idle_timeout: The time in seconds without any run before a
+            WebSocket connection is closed.
+        websocket_max_runs: The maximum number of runs in progress on a WebSocket
+            connection.
+        websocket_limiter: Optional concurrency limiter of the WebSocket runs, the
+            limiter of the stream endpoint.
+        rate_limiter: Optional rate limiter of the WebSocket runs.
+
+    Returns:
+        The router serving the runnable.
+    """
     router = APIRouter(prefix=prefix, tags=["agent"])
 
-    async def _get_invoke_handler() -> APIHandler:
-        return APIHandler(runnable, path="/agents")
+    handler = APIHandler(
+        runnable, path="/agents", per_req_config_modifier=per_req_config_modifier
+    )
+    # Built once, like the models of the langserve handler
+    config_model = runnable.config_schema(include=CONFIG_KEYS)
 
     @router.post("/agents/invoke")
-    async def invoke_agents_handler(
-        request: Request, runnable: Annotated[APIHandler, Depends(_get_invoke_handler)]
-    ) -> Response:
+    async def invoke_agents_handler(request: Request) -> Response:
         """Handle invoke request."""
-        return await runnable.invoke(request)
+        if cache is None and coalescer is None:
+            response = await _invoke(handler, request)
+        else:
+            response = await _shared_invoke(
+                handler,
+                request,
+                cache,
+                coalescer,
+                per_user=per_user,
+                config_model=config_model,
+                per_req_config_modifier=per_req_config_modifier,
+            )
+
+        if recorder is not None:
+            await _record_invoke(recorder, request, response)
+
+        return response
 
     @router.post("/agents/batch")
-    async def batch_agents_handler(
-        request: Request, runnable: Annotated[APIHandler, Depends(_get_invoke_handler)]
-    ) -> Response:
+    async def batch_agents_handler(request: Request) -> Response:
         """Handle batch request."""
-        return await runnable.batch(request)
+        with RUNNABLE_DURATION.time("batch"):
+            return await handler.batch(request)
+
+    @router.post("/agents/batch/stream")
+    async def stream_batch_agents_handler(request: Request) -> Response:
+        """Handle streamed batch request."""
+        return await _stream_batch(
+            request,
+            runnable,
+            config_model,
+            f"{prefix}/agents",
+            per_req_config_modifier,
+            max_concurrency=batch_concurrency,
+        )
 
     @router.post("/agents/stream")
-    async def stream_agents_handler(
-        request: Request, runnable: Annotated[APIHandler, Depends(_get_invoke_handler)]
-    ) -> EventSourceResponse:
+    async def stream_agents_handler(request: Request) -> EventSourceResponse:
         """Handle stream request."""
-        return await runnable.stream(request)
+        start = time.perf_counter()
+        response = await handler.stream(request)
+        response.body_iterator = _instrument_stream(
+            response.body_iterator, f"{prefix}/agents/stream", start
+        )
+
+        if recorder is not None:
+            conversation = conversation_id(request)
+            response.body_iterator = _record_stream(
+                response.body_iterator, recorder, request, conversation
+            )
+            response.headers[CONVERSATION_HEADER] = str(conversation)
+
+        if streamer is not None:
+            response.body_iterator = streamer.stream(
+                response.body_iterator, encode_event
+            )
+            response.ping_interval = streamer.heartbeat_interval
+
+        return response
+
+    @router.websocket("/agents/ws")
+    async def websocket_agents_handler(websocket: WebSocket) -> None:
+        """Handle the runs of a WebSocket connection."""
+        session = AgentSession(
+            websocket,
+            runnable,
+            f"{prefix}/agents",
+            per_req_config_modifier,
+            streamer=streamer or event_streamer,
+            recorder=recorder,
+            idle_timeout=websocket_idle_timeout,
+            max_runs=websocket_max_runs,
+            limiter=websocket_limiter,
+            rate_limiter=rate_limiter,
+            config_model=config_model,
+        )
+        await session.serve()
 
     return router
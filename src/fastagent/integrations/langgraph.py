@@ -0,0 +1,595 @@
+"""Graph router."""
+
+import contextlib
+import inspect
+import json
+import logging
+import time
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable, Sequence
+from contextvars import ContextVar
+from typing import Any
+
+from asyncpg import Pool
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.pregel import Pregel
+from langgraph.types import StreamMode
+from pydantic import BaseModel, Field
+from sse_starlette import EventSourceResponse
+
+from fastagent.internal.data.checkpoints import (
+    CheckpointRow,
+    CheckpointWriteRow,
+    delete_thread_checkpoints,
+    get_checkpoint,
+    get_checkpoint_writes,
+    insert_checkpoints,
+    list_checkpoints,
+)
+from fastagent.internal.data.conversations import (
+    CONVERSATION_HEADER,
+    ConversationRecorder,
+    conversation_id,
+    request_user_id,
+)
+from fastagent.internal.metrics import RUNNABLE_DURATION, TIME_TO_FIRST_CHUNK
+from fastagent.internal.streaming import EventStreamer
+
+logger = logging.getLogger("_fastagent.langgraph")
+
+# Updates the config of a run from the request, like the langserve config modifier
+ConfigModifier = Callable[
+    [RunnableConfig, Request], RunnableConfig | Awaitable[RunnableConfig]
+]
+
+
+class _Batch:
+    """Checkpoints and writes of a run waiting to be written."""
+
+    __slots__ = ("checkpoints", "writes")
+
+    def __init__(self: "_Batch") -> None:
+        self.checkpoints: dict[tuple[str, str, str], CheckpointRow] = {}
+        self.writes: dict[tuple[str, str, str, str, int], CheckpointWriteRow] = {}
+
+    def __len__(self: "_Batch") -> int:
+        return len(self.checkpoints) + len(self.writes)
+
+    def latest(
+        self: "_Batch", thread_id: str, checkpoint_ns: str, checkpoint_id: str | None
+    ) -> CheckpointRow | None:
+        if checkpoint_id is not None:
+            return self.checkpoints.get((thread_id, checkpoint_ns, checkpoint_id))
+
+        # Checkpoint ids increase monotonically
+        rows = [
+            row
+            for key, row in self.checkpoints.items()
+            if key[:2] == (thread_id, checkpoint_ns)
+        ]
+        return max(rows, key=lambda row: row.checkpoint_id, default=None)
+
+
+_batch: ContextVar[_Batch | None] = ContextVar("fastagent_checkpoints", default=None)
+
+
+class PostgresCheckpointSaver(BaseCheckpointSaver[int]):
+    """Checkpoint saver storing the threads in PostgreSQL through the asyncpg pool.
+
+    Within `batch()`, the checkpoints and writes of a run are kept in memory and
+    written together when the run ends, or once `max_pending` of them are waiting, so
+    that a graph with many steps does not make one round trip per node. The pending
+    checkpoints are visible to the run itself, not to the other workers until they
+    are written. A worker that dies in the middle of a run loses its pending steps.
+
+    Only the async methods are implemented, graphs must be run with `ainvoke` or
+    `astream`.
+    """
+
+    def __init__(
+        self: "PostgresCheckpointSaver",
+        pool: Pool | None = None,
+        max_pending: int = 100,
+    ) -> None:
+        """Initialize the saver.
+
+        Args:
+            pool: The database pool, it can be set once the pool is created.
+            max_pending: The maximum number of checkpoints and writes kept in memory
+                by a batch.
+        """
+        super().__init__()
+        self.pool = pool
+        self.max_pending = max_pending
+        self.flushes = 0
+
+    @contextlib.asynccontextmanager
+    async def batch(self: "PostgresCheckpointSaver") -> AsyncIterator[None]:
+        """Batch the writes of the runs in the context, flushed on exit."""
+        batch = _Batch()
+        token = _batch.set(batch)
+        try:
+            yield
+        finally:
+            _batch.reset(token)
+            await self._flush(batch)
+
+    async def aget_tuple(
+        self: "PostgresCheckpointSaver", config: RunnableConfig
+    ) -> CheckpointTuple | None:
+        """Get a checkpoint, the latest of the thread without a checkpoint id.
+
+        Args:
+            config: The config of the checkpoint.
+
+        Returns:
+            The checkpoint tuple, None if it does not exist.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        batch = _batch.get()
+        row = batch.latest(thread_id, checkpoint_ns, checkpoint_id) if batch else None
+
+        async with self.pool.acquire() as conn:
+            if row is None:
+                record = await get_checkpoint(
+                    conn, thread_id, checkpoint_ns, checkpoint_id
+                )
+                if record is None:
+                    return None
+                row = CheckpointRow(*record)
+
+            writes = {
+                (write.task_id, write.idx): write
+                for write in map(
+                    CheckpointWriteRow._make,
+                    await get_checkpoint_writes(
+                        conn, thread_id, checkpoint_ns, row.checkpoint_id
+                    ),
+                )
+            }
+
+        if batch is not None:
+            writes |= {
+                key[3:]: write
+                for key, write in batch.writes.items()
+                if key[:3] == (thread_id, checkpoint_ns, row.checkpoint_id)
+            }
+
+        return self._load(row, writes.values())
+
+    async def alist(
+        self: "PostgresCheckpointSaver",
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,  # noqa: A002
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """List the checkpoints, the most recent first.
+
+        Args:
+            config: The config of the thread, None for all the threads.
+            filter: The metadata the checkpoints must have.
+            before: Only list the checkpoints older than this one.
+            limit: The maximum number of checkpoints.
+
+        Yields:
+            The checkpoint tuples.
+        """
+        batch = _batch.get()
+        if batch is not None:
+            await self._flush(batch)
+
+        configurable = (config or {}).get("configurable", {})
+
+        async with self.pool.acquire() as conn:
+            records = await list_checkpoints(
+                conn,
+                configurable.get("thread_id"),
+                configurable.get("checkpoint_ns"),
+                metadata=json.dumps(filter) if filter else None,
+                before=get_checkpoint_id(before) if before else None,
+                limit=limit,
+            )
+            for record in records:
+                row = CheckpointRow(*record)
+                writes = await get_checkpoint_writes(
+                    conn, row.thread_id, row.checkpoint_ns, row.checkpoint_id
+                )
+                yield self._load(row, map(CheckpointWriteRow._make, writes))
+
+    async def aput(
+        self: "PostgresCheckpointSaver",
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,  # noqa: ARG002
+    ) -> RunnableConfig:
+        """Store a checkpoint.
+
+        Args:
+            config: The config of the parent checkpoint.
+            checkpoint: The checkpoint.
+            metadata: The metadata of the checkpoint.
+            new_versions: The channel versions updated by the checkpoint.
+
+        Returns:
+            The config of the stored checkpoint.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_type, blob = self.serde.dumps_typed(checkpoint)
+
+        row = CheckpointRow(
+            thread_id,
+            checkpoint_ns,
+            checkpoint["id"],
+            get_checkpoint_id(config),
+            checkpoint_type,
+            blob,
+            self.serde.dumps(get_checkpoint_metadata(config, metadata)).decode(),
+        )
+        await self._write([row], [])
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    async def aput_writes(
+        self: "PostgresCheckpointSaver",
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Store the writes of a task.
+
+        Args:
+            config: The config of the checkpoint the task belongs to.
+            writes: The channels and values written by the task.
+            task_id: The task.
+            task_path: The path of the task.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        rows = [
+            CheckpointWriteRow(
+                thread_id,
+                checkpoint_ns,
+                checkpoint_id,
+                task_id,
+                task_path,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                *self.serde.dumps_typed(value),
+            )
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        await self._write([], rows)
+
+    async def adelete_thread(self: "PostgresCheckpointSaver", thread_id: str) -> None:
+        """Delete the checkpoints and writes of a thread.
+
+        Args:
+            thread_id: The thread.
+        """
+        batch = _batch.get()
+        if batch is not None:
+            batch.checkpoints = {
+                key: row
+                for key, row in batch.checkpoints.items()
+                if key[0] != thread_id
+            }
+            batch.writes = {
+                key: row for key, row in batch.writes.items() if key[0] != thread_id
+            }
+
+        async with self.pool.acquire() as conn:
+            await delete_thread_checkpoints(conn, thread_id)
+
+    async def _write(
+        self: "PostgresCheckpointSaver",
+        checkpoints: list[CheckpointRow],
+        writes: list[CheckpointWriteRow],
+    ) -> None:
+        batch = _batch.get()
+
+        if batch is None:
+            async with self.pool.acquire() as conn:
+                await insert_checkpoints(conn, checkpoints, writes)
+            return
+
+        for row in checkpoints:
+            batch.checkpoints[row[:3]] = row
+        for row in writes:
+            key = (*row[:4], row.idx)
+            if row.idx < 0:
+                batch.writes[key] = row
+            else:
+                batch.writes.setdefault(key, row)
+
+        if len(batch) >= self.max_pending:
+            await self._flush(batch)
+
+    async def _flush(self: "PostgresCheckpointSaver", batch: _Batch) -> None:
+        if not batch:
+            return
+
+        # Taken before awaiting, the writes of concurrent tasks go to the next flush
+        checkpoints = list(batch.checkpoints.values())
+        writes = list(batch.writes.values())
+        batch.checkpoints, batch.writes = {}, {}
+
+        async with self.pool.acquire() as conn:
+            await insert_checkpoints(conn, checkpoints, writes)
+        self.flushes += 1
+
+    def _load(
+        self: "PostgresCheckpointSaver",
+        row: CheckpointRow,
+        writes: Iterable[CheckpointWriteRow],
+    ) -> CheckpointTuple:
+        def config(checkpoint_id: str) -> RunnableConfig:
+            return {
+                "configurable": {
+                    "thread_id": row.thread_id,
+                    "checkpoint_ns": row.checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            }
+
+        return CheckpointTuple(
+            config=config(row.checkpoint_id),
+            checkpoint=self.serde.loads_typed((row.type, row.checkpoint)),
+            metadata=self.serde.loads(row.metadata.encode()),
+            parent_config=(
+                config(row.parent_checkpoint_id) if row.parent_checkpoint_id else None
+            ),
+            pending_writes=[
+                (write.task_id, write.channel, self.serde.loads_typed(write[7:]))
+                for write in sorted(
+                    writes, key=lambda write: (write.task_id, write.idx)
+                )
+            ],
+        )
+
+
+checkpoint_saver = PostgresCheckpointSaver()
+
+
+class GraphRequest(BaseModel):
+    """Invoke request of a graph."""
+
+    input: Any = Field(default=None)
+    config: dict[str, Any] = Field(default={})
+
+
+class GraphStreamRequest(GraphRequest):
+    """Stream request of a graph."""
+
+    stream_mode: StreamMode = Field(default="updates")
+
+
+async def _graph_config(
+    payload: GraphRequest,
+    request: Request,
+    per_req_config_modifier: ConfigModifier | None,
+    checkpointer: PostgresCheckpointSaver | None,
+    *,
+    per_user: bool,
+) -> RunnableConfig:
+    """Build the config of a run from the request.
+
+    Only the `configurable` part of the config sent by the client is kept. Threads
+    are scoped to the authenticated user with `per_user`.
+
+    Raises:
+        HTTPException: The thread is missing while the graph is checkpointed.
+    """
+    configurable = payload.config.get("configurable")
+    config: RunnableConfig = {
+        "configurable": dict(configurable) if isinstance(configurable, dict) else {}
+    }
+
+    if per_req_config_modifier is not None:
+        config = per_req_config_modifier(config, request)
+        if inspect.isawaitable(config):
+            config = await config
+
+    thread_id = config["configurable"].get("thread_id")
+    if checkpointer is not None and thread_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="A thread_id is required in config.configurable",
+        )
+
+    context = getattr(request.state, "context", None)
+    if thread_id is not None and per_user and context is not None:
+        config["configurable"]["thread_id"] = f"{context.user.id}:{thread_id}"
+
+    return config
+
+
+def _json(data: object) -> str:
+    """Encode data as compact JSON."""
+    return json.dumps(jsonable_encoder(data), separators=(",", ":"))
+
+
+def _sse_event(event: str, data: object = None) -> bytes:
+    """Encode a server sent event."""
+    if data is None:
+        return f"event: {event}\r\n\r\n".encode()
+
+    return f"event: {event}\r\ndata: {_json(data)}\r\n\r\n".encode()
+
+
+async def _record_stream(
+    chunks: AsyncIterator[Any],
+    recorder: ConversationRecorder,
+    request: Request,
+    conversation: uuid.UUID,
+    input_: Any,  # noqa: ANN401
+) -> AsyncIterator[Any]:
+    """Tee the chunks of the graph to the recorder.
+
+    The chunks are forwarded as they come, the output is recorded once the stream
+    ends so that the time to the first chunk is unchanged.
+    """
+    transcript = recorder.transcript()
+
+    try:
+        async for chunk in chunks:
+            yield chunk
+            transcript.append(_json(chunk))
+    finally:
+        recorder.record_exchange(
+            conversation,
+            request_user_id(request),
+            "stream",
+            _json(input_),
+            transcript.content(),
+            truncated=transcript.truncated,
+        )
+
+
+def create_langgraph_router(  # noqa: C901, PLR0913
+    graph: Pregel,
+    prefix: str = "/v1",
+    per_req_config_modifier: ConfigModifier | None = None,
+    checkpointer: PostgresCheckpointSaver | None = None,
+    *,
+    per_user: bool = True,
+    recorder: ConversationRecorder | None = None,
+    streamer: EventStreamer | None = None,
+) -> APIRouter:
+    """Create a router for the graph.
+
+    Args:
+        graph: The compiled graph to serve.
+        prefix: The prefix of the routes.
+        per_req_config_modifier: Optional function updating the config from the
+            request, called on every request.
+        checkpointer: Optional saver persisting the threads, it replaces the
+            checkpointer the graph was compiled with.
+        per_user: Scope the threads to the authenticated user.
+        recorder: Optional recorder of the inputs and outputs.
+        streamer: Optional streamer coalescing and bounding the streamed events.
+
+    Returns:
+        The router serving the graph.
+    """
+    router = APIRouter(prefix=prefix, tags=["agent"])
+
+    if checkpointer is not None:
+        graph = graph.copy(update={"checkpointer": checkpointer})
+
+    def batch() -> contextlib.AbstractAsyncContextManager:
+        if checkpointer is None:
+            return contextlib.nullcontext()
+        return checkpointer.batch()
+
+    @router.post("/agents/invoke")
+    async def invoke_agents_handler(
+        payload: GraphRequest, request: Request
+    ) -> Response:
+        """Handle invoke request."""
+        config = await _graph_config(
+            payload, request, per_req_config_modifier, checkpointer, per_user=per_user
+        )
+
+        with RUNNABLE_DURATION.time("invoke"):
+            async with batch():
+                output = await graph.ainvoke(payload.input, config)
+
+        response = JSONResponse({"output": jsonable_encoder(output)})
+        if recorder is not None:
+            conversation = conversation_id(request)
+            recorder.record_exchange(
+                conversation,
+                request_user_id(request),
+                "invoke",
+                _json(payload.input),
+                response.body.decode(),
+            )
+            response.headers[CONVERSATION_HEADER] = str(conversation)
+
+        return response
+
+    @router.post("/agents/stream")
+    async def stream_agents_handler(
+        payload: GraphStreamRequest, request: Request
+    ) -> EventSourceResponse:
+        """Handle stream request.
+
+        Chunks are sent as `data` events, followed by an `end` event, or an `error`
+        event if the graph fails.
+        """
+        config = await _graph_config(
+            payload, request, per_req_config_modifier, checkpointer, per_user=per_user
+        )
+        route = f"{prefix}/agents/stream"
+        headers = {}
+        chunks = graph.astream(payload.input, config, stream_mode=payload.stream_mode)
+        if recorder is not None:
+            conversation = conversation_id(request)
+            headers[CONVERSATION_HEADER] = str(conversation)
+            chunks = _record_stream(
+                chunks, recorder, request, conversation, payload.input
+            )
+
+        async def events() -> AsyncIterator[bytes]:
+            start = time.perf_counter()
+            first = True
+            try:
+                async with batch():
+                    async for chunk in chunks:
+                        if first:
+                            TIME_TO_FIRST_CHUNK.observe(
+                                time.perf_counter() - start, route
+                            )
+                            first = False
+                        yield _sse_event("data", chunk)
+            except Exception:
+                logger.exception("Graph stream failed")
+                yield _sse_event(
+                    "error",
+                    {"status_code": 500, "message": "Internal Server Error"},
+                )
+                return
+            finally:
+                RUNNABLE_DURATION.observe(time.perf_counter() - start, "stream")
+
+            yield _sse_event("end")
+
+        if streamer is None:
+            return EventSourceResponse(events(), headers=headers)
+
+        return EventSourceResponse(
+            streamer.stream(events()),
+            headers=headers,
+            ping=streamer.heartbeat_interval,
+        )
+
+    return router
@@ -1,4 +1,4 @@
 from fastagent.internal.module import ModuleLoader
-from fastagent.internal.settings import Settings, SettingsDependency
+from fastagent.internal.settings import Settings
 
-__all__ = ["Settings", "SettingsDependency", "ModuleLoader"]
+__all__ = ["Settings", "ModuleLoader"]
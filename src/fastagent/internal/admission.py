@@ -0,0 +1,95 @@
+"""Admission control of the agent endpoints.
+
+Each endpoint runs at most `max_concurrency` requests at once, the next requests
+wait in a bounded FIFO queue. Requests are rejected right away when the queue is
+full, or once they waited `queue_timeout` seconds, so that a burst does not slow
+down every request of the worker.
+"""
+
+import asyncio
+import contextlib
+from collections import deque
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a request is not admitted."""
+
+
+class ConcurrencyLimiter:
+    """Concurrency limit with a bounded wait queue.
+
+    A released slot is handed over to the oldest waiting request. Each worker runs a
+    single event loop, so the counters are updated without any lock.
+    """
+
+    def __init__(
+        self: "ConcurrencyLimiter",
+        max_concurrency: int,
+        max_queue: int = 0,
+        queue_timeout: float = 10.0,
+    ) -> None:
+        """Initialize the limiter.
+
+        Args:
+            max_concurrency: The maximum number of requests running at once.
+            max_queue: The maximum number of requests waiting for a slot.
+            queue_timeout: The maximum time in seconds a request waits for a slot.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.rejected = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+
+    @property
+    def waiting(self: "ConcurrencyLimiter") -> int:
+        """Get the number of requests waiting for a slot."""
+        return len(self._waiters)
+
+    async def acquire(self: "ConcurrencyLimiter") -> None:
+        """Wait for a slot.
+
+        Raises:
+            AdmissionRejectedError: The queue is full or the wait timed out.
+        """
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            msg = "Too many concurrent requests"
+            raise AdmissionRejectedError(msg)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await waiter
+        except TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over as the timeout expired
+                return
+
+            self.rejected += 1
+            msg = "Timed out waiting for a free slot"
+            raise AdmissionRejectedError(msg) from None
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            with contextlib.suppress(ValueError):
+                self._waiters.remove(waiter)
+
+    def release(self: "ConcurrencyLimiter") -> None:
+        """Release a slot, handing it over to the oldest waiting request."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+        self.active -= 1
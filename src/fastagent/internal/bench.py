@@ -0,0 +1,396 @@
+"""Load generator of the `bench` command.
+
+Each of the `concurrency` clients sends its requests over its own keep-alive
+HTTP/1.1 connection. The requests are written and parsed directly on the asyncio
+streams: a general purpose HTTP client costs more CPU per request than the server
+spends on a trivial agent, and a single process could not saturate several workers.
+
+Without a rate, the clients send their next request as soon as the previous one is
+answered. With a rate, requests are scheduled at fixed intervals whether or not the
+server keeps up, and their latency is measured from their scheduled time, so that a
+slow server is not hidden by the clients waiting for it.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Literal, NamedTuple
+
+Endpoint = Literal["invoke", "batch", "stream"]
+
+ENDPOINTS: dict[str, str] = {
+    "invoke": "/v1/agents/invoke",
+    "batch": "/v1/agents/batch",
+    "stream": "/v1/agents/stream",
+}
+
+LOGIN_PATH = "/v1/tokens/authentication"
+
+# First bytes of the events of the streams
+DATA_EVENT = b"event: data"
+ERROR_EVENT = b"event: error"
+
+
+class BenchError(Exception):
+    """Raised when the benchmark cannot start."""
+
+
+class Response(NamedTuple):
+    """Response of a request."""
+
+    status: int
+    body: bytes
+    first_event: float | None
+    error_event: bool
+
+
+@dataclass
+class Results:
+    """Latencies and errors of a run, in seconds."""
+
+    latencies: list[float] = field(default_factory=list)
+    time_to_first_token: list[float] = field(default_factory=list)
+    errors: Counter[str] = field(default_factory=Counter)
+    elapsed: float = 0.0
+
+    @property
+    def requests(self: "Results") -> int:
+        """Get the number of completed requests, errors included."""
+        return len(self.latencies) + sum(self.errors.values())
+
+    def summary(self: "Results") -> dict[str, Any]:
+        """Summarize the run.
+
+        Returns:
+            The throughput, the percentiles in milliseconds and the errors.
+        """
+        elapsed = self.elapsed or 1.0
+        return {
+            "requests": self.requests,
+            "succeeded": len(self.latencies),
+            "elapsed_s": self.elapsed,
+            "throughput_rps": len(self.latencies) / elapsed,
+            "latency_ms": percentiles(self.latencies),
+            "time_to_first_token_ms": percentiles(self.time_to_first_token),
+            "errors": dict(self.errors.most_common()),
+        }
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    """Compute the percentiles of durations in seconds.
+
+    Args:
+        values: The durations.
+
+    Returns:
+        The mean and the percentiles in milliseconds, empty without values.
+    """
+    if not values:
+        return {}
+
+    values = sorted(values)
+
+    def rank(q: float) -> float:
+        return values[min(len(values) - 1, int(q * len(values)))] * 1e3
+
+    return {
+        "mean": sum(values) / len(values) * 1e3,
+        "p50": rank(0.50),
+        "p90": rank(0.90),
+        "p99": rank(0.99),
+        "p99.9": rank(0.999),
+        "max": values[-1] * 1e3,
+    }
+
+
+def load_inputs(path: Path) -> list[Any]:
+    """Load the inputs of the agent from a JSON lines file.
+
+    Args:
+        path: The file, with one JSON input per line.
+
+    Returns:
+        The inputs.
+
+    Raises:
+        BenchError: If the file is empty or a line is not valid JSON.
+    """
+    inputs = []
+    with path.open() as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                inputs.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                msg = f"Invalid JSON on line {number} of {path}: {e.msg}"
+                raise BenchError(msg) from e
+
+    if not inputs:
+        msg = f"No inputs in {path}"
+        raise BenchError(msg)
+
+    return inputs
+
+
+def encode_bodies(
+    inputs: list[Any], endpoint: Endpoint, batch_size: int
+) -> list[bytes]:
+    """Encode the request bodies once, before the run.
+
+    Args:
+        inputs: The inputs of the agent.
+        endpoint: The endpoint, the inputs of a batch are taken in turn.
+        batch_size: The number of inputs per batch.
+
+    Returns:
+        The JSON bodies.
+    """
+    if endpoint != "batch":
+        return [json.dumps({"input": value}).encode() for value in inputs]
+
+    cycle = itertools.cycle(inputs)
+    return [
+        json.dumps({"inputs": [next(cycle) for _ in range(batch_size)]}).encode()
+        for _ in range(len(inputs))
+    ]
+
+
+class Connection:
+    """Keep-alive HTTP/1.1 connection, sending JSON requests."""
+
+    def __init__(self: "Connection", host: str, port: int) -> None:
+        """Initialize the connection, opened on the first request.
+
+        Args:
+            host: The host of the server.
+            port: The port of the server.
+        """
+        self.host = host
+        self.port = port
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+
+    async def request(
+        self: "Connection",
+        path: str,
+        body: bytes,
+        headers: bytes = b"",
+    ) -> Response:
+        """Send a POST request and read the whole response.
+
+        Args:
+            path: The path of the request.
+            body: The JSON body.
+            headers: Additional header lines, each terminated by CRLF.
+
+        Returns:
+            The response, the body is only kept when it has a length.
+        """
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+
+        self._writer.write(
+            b"POST %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\n"
+            b"Content-Length: %d\r\n%s\r\n%s"
+            % (path.encode(), self.host.encode(), len(body), headers, body)
+        )
+
+        try:
+            return await self._read_response()
+        except BaseException:
+            # The connection is in an unknown state, the next request reconnects
+            self.close()
+            raise
+
+    async def _read_response(self: "Connection") -> Response:
+        reader = self._reader
+        status = int((await reader.readuntil(b"\r\n")).split(b" ", 2)[1])
+
+        length = None
+        chunked = False
+        keep_alive = True
+        while (line := await reader.readuntil(b"\r\n")) != b"\r\n":
+            name, _, value = line.partition(b":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == b"content-length":
+                length = int(value)
+            elif name == b"transfer-encoding":
+                chunked = b"chunked" in value
+            elif name == b"connection":
+                keep_alive = value != b"close"
+
+        body = b""
+        first_event = None
+        error_event = False
+        if chunked:
+            first_event, error_event = await self._read_chunks()
+        elif length is not None:
+            body = await reader.readexactly(length)
+        else:
+            body = await reader.read()
+            keep_alive = False
+
+        if not keep_alive:
+            self.close()
+
+        return Response(status, body, first_event, error_event)
+
+    async def _read_chunks(self: "Connection") -> tuple[float | None, bool]:
+        """Read a chunked body, the events of the streams are not kept.
+
+        Returns:
+            The time of the first data event and whether an error event was sent.
+        """
+        reader = self._reader
+        first_event = None
+        error_event = False
+        while size := int((await reader.readuntil(b"\r\n")).split(b";")[0], 16):
+            chunk = await reader.readexactly(size + 2)
+            if first_event is None and DATA_EVENT in chunk:
+                first_event = time.perf_counter()
+            error_event = error_event or ERROR_EVENT in chunk
+
+        # Trailers
+        while await reader.readuntil(b"\r\n") != b"\r\n":
+            pass
+
+        return first_event, error_event
+
+    def close(self: "Connection") -> None:
+        """Close the connection."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+
+
+async def login(host: str, port: int, email: str, password: str) -> str:
+    """Create an authentication token.
+
+    Args:
+        host: The host of the server.
+        port: The port of the server.
+        email: The email of the user.
+        password: The password of the user.
+
+    Returns:
+        The token.
+
+    Raises:
+        BenchError: If the credentials are rejected.
+    """
+    connection = Connection(host, port)
+    body = json.dumps({"email": email, "password": password}).encode()
+    try:
+        response = await connection.request(LOGIN_PATH, body)
+    finally:
+        connection.close()
+
+    if response.status != 201:  # noqa: PLR2004
+        msg = f"Login failed with status {response.status}"
+        raise BenchError(msg)
+
+    return json.loads(response.body)["token"]
+
+
+async def run(  # noqa: C901, PLR0913
+    host: str,
+    port: int,
+    endpoint: Endpoint,
+    bodies: list[bytes],
+    *,
+    concurrency: int,
+    rate: float = 0.0,
+    duration: float = 30.0,
+    max_requests: int = 0,
+    request_timeout: float = 60.0,
+    token: str | None = None,
+) -> Results:
+    """Send the requests until the duration or the number of requests is reached.
+
+    Args:
+        host: The host of the server.
+        port: The port of the server.
+        endpoint: The endpoint of the agent.
+        bodies: The request bodies, sent in turn.
+        concurrency: The number of connections.
+        rate: The number of requests started per second, 0 to send the requests as
+            fast as the connections allow.
+        duration: The duration of the run in seconds.
+        max_requests: The number of requests to send, 0 for no limit.
+        request_timeout: The time in seconds after which a request is an error.
+        token: The authentication token, None to send anonymous requests.
+
+    Returns:
+        The results of the run.
+    """
+    path = ENDPOINTS[endpoint]
+    headers = f"Authorization: Bearer {token}\r\n".encode() if token else b""
+    results = Results()
+    stream = endpoint == "stream"
+
+    start = time.perf_counter()
+    deadline = start + duration
+    schedule = _schedule(start, rate, max_requests)
+    cycle = itertools.cycle(bodies)
+
+    async def client() -> None:
+        connection = Connection(host, port)
+        try:
+            for scheduled in schedule:
+                # Open loop: wait for the scheduled time, the latency starts there
+                if scheduled is not None:
+                    delay = scheduled - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                if time.perf_counter() >= deadline:
+                    return
+
+                sent = time.perf_counter() if scheduled is None else scheduled
+                await send(connection, next(cycle), sent)
+        finally:
+            connection.close()
+
+    async def send(connection: Connection, body: bytes, sent: float) -> None:
+        try:
+            async with asyncio.timeout(request_timeout):
+                response = await connection.request(path, body, headers)
+        except TimeoutError:
+            results.errors["timeout"] += 1
+            return
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            results.errors[type(e).__name__] += 1
+            return
+
+        if response.status >= 400:  # noqa: PLR2004
+            results.errors[f"HTTP {response.status}"] += 1
+        elif response.error_event:
+            results.errors["event: error"] += 1
+        else:
+            results.latencies.append(time.perf_counter() - sent)
+            if stream and response.first_event is not None:
+                results.time_to_first_token.append(response.first_event - sent)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    results.elapsed = time.perf_counter() - start
+
+    return results
+
+
+def _schedule(start: float, rate: float, max_requests: int) -> Iterator[float | None]:
+    """Iterate over the start times of the requests, shared by the clients.
+
+    Yields:
+        The scheduled time of each request, None to send it right away.
+    """
+    count = itertools.count() if max_requests <= 0 else range(max_requests)
+    for i in count:
+        yield start + i / rate if rate > 0 else None
@@ -0,0 +1,85 @@
+"""Coalescing of identical concurrent executions.
+
+The first call with a key starts the execution in its own task, the calls with the
+same key arriving before it completes wait for the same result. Each worker runs a
+single event loop, so the in-flight calls are tracked without any lock.
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class _Flight:
+    """In-flight execution and the number of calls waiting for it."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self: "_Flight", task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class Coalescer:
+    """Share a single execution between the concurrent calls with the same key.
+
+    The execution does not belong to any caller: a cancelled caller does not cancel
+    it as long as other callers are waiting. It is cancelled once no caller waits
+    for it anymore. Errors are raised to all the callers.
+    """
+
+    def __init__(self: "Coalescer") -> None:
+        """Initialize the coalescer."""
+        self._flights: dict[bytes, _Flight] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def run(
+        self: "Coalescer", key: bytes, function: Callable[[], Awaitable[T]]
+    ) -> tuple[T, bool]:
+        """Run the function or wait for the in-flight execution with the same key.
+
+        Args:
+            key: The key identifying identical executions.
+            function: The function starting the execution.
+
+        Returns:
+            The result and whether it was shared with an earlier call.
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(function()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._discard(key, flight))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody waits for the result, later calls start a new execution
+                self._discard(key, flight)
+                flight.task.cancel()
+
+    def in_flight(self: "Coalescer") -> int:
+        """Get the number of executions in progress.
+
+        Returns:
+            The number of executions in progress.
+        """
+        return len(self._flights)
+
+    def _discard(self: "Coalescer", key: bytes, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+coalescer = Coalescer()
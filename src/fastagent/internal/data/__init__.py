@@ -1,4 +1,12 @@
-from fastagent.internal.data.database import setup_postgresql_database
+from fastagent.internal.data.database import (
+    reap_postgresql_tokens,
+    setup_postgresql_database,
+)
 from fastagent.internal.data.healthcheck import Healthcheck, SystemInfo
 
-__all__ = ["Healthcheck", "SystemInfo", "setup_postgresql_database"]
+__all__ = [
+    "Healthcheck",
+    "SystemInfo",
+    "reap_postgresql_tokens",
+    "setup_postgresql_database",
+]
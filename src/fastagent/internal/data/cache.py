@@ -0,0 +1,163 @@
+"""In-process cache of the authentication tokens."""
+
+import time
+from collections import OrderedDict
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from fastagent.internal.data.users import UserModel
+
+
+class CachedToken(NamedTuple):
+    """Cache entry, a `None` user marks an invalid token."""
+
+    user: "UserModel | None"
+    deadline: float
+
+
+class TokenCache:
+    """Bounded LRU cache with TTL of the users resolved from a token hash.
+
+    Valid tokens are cached until the cache TTL or the token expiry, whichever
+    comes first. Invalid tokens are cached for a shorter time so that a flood of
+    bad tokens does not turn into a flood of queries.
+
+    The cache is local to the worker process, an invalidation only applies to the
+    current worker and other workers catch up once their entries expire.
+    """
+
+    def __init__(
+        self: "TokenCache",
+        max_size: int = 10_000,
+        ttl: float = 60.0,
+        negative_ttl: float = 5.0,
+    ) -> None:
+        """Initialize the cache.
+
+        Args:
+            max_size: The maximum number of entries, 0 disables the cache.
+            ttl: The maximum time in seconds a valid token is cached.
+            negative_ttl: The time in seconds an invalid token is cached.
+        """
+        self._entries: OrderedDict[bytes, CachedToken] = OrderedDict()
+        self._user_tokens: dict[int, set[bytes]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.configure(max_size=max_size, ttl=ttl, negative_ttl=negative_ttl)
+
+    def configure(
+        self: "TokenCache", max_size: int, ttl: float, negative_ttl: float
+    ) -> None:
+        """Update the limits of the cache and drop the current entries.
+
+        Args:
+            max_size: The maximum number of entries, 0 disables the cache.
+            ttl: The maximum time in seconds a valid token is cached.
+            negative_ttl: The time in seconds an invalid token is cached.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clear()
+
+    def get(self: "TokenCache", token_hash: bytes) -> CachedToken | None:
+        """Get the cached entry for a token hash.
+
+        Args:
+            token_hash: The hash of the token.
+
+        Returns:
+            The cached entry or None if the token is not cached.
+        """
+        entry = self._entries.get(token_hash)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry.deadline <= time.monotonic():
+            self._remove(token_hash)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(token_hash)
+        self.hits += 1
+        return entry
+
+    def set(
+        self: "TokenCache", token_hash: bytes, user: "UserModel", expiry: datetime
+    ) -> None:
+        """Cache the user of a valid token.
+
+        Args:
+            token_hash: The hash of the token.
+            user: The user owning the token.
+            expiry: The expiry of the token.
+        """
+        remaining = (expiry - datetime.now(UTC)).total_seconds()
+        if remaining <= 0:
+            return
+
+        deadline = time.monotonic() + min(self.ttl, remaining)
+        self._put(token_hash, CachedToken(user, deadline))
+
+    def set_invalid(self: "TokenCache", token_hash: bytes) -> None:
+        """Cache an invalid token.
+
+        Args:
+            token_hash: The hash of the token.
+        """
+        if self.negative_ttl > 0:
+            deadline = time.monotonic() + self.negative_ttl
+            self._put(token_hash, CachedToken(None, deadline))
+
+    def invalidate_user(self: "TokenCache", user_id: int) -> None:
+        """Remove all the cached tokens of a user.
+
+        Args:
+            user_id: The user ID.
+        """
+        for token_hash in self._user_tokens.pop(user_id, ()):
+            self._entries.pop(token_hash, None)
+
+    def clear(self: "TokenCache") -> None:
+        """Remove all the entries."""
+        self._entries.clear()
+        self._user_tokens.clear()
+
+    def stats(self: "TokenCache") -> dict[str, int]:
+        """Get the counters of the cache.
+
+        Returns:
+            The number of hits, misses and cached entries.
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def _put(self: "TokenCache", token_hash: bytes, entry: CachedToken) -> None:
+        if self.max_size <= 0:
+            return
+
+        self._remove(token_hash)
+        self._entries[token_hash] = entry
+
+        if entry.user is not None:
+            self._user_tokens.setdefault(entry.user.id, set()).add(token_hash)
+
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self: "TokenCache", token_hash: bytes) -> None:
+        entry = self._entries.pop(token_hash, None)
+
+        if entry is None or entry.user is None:
+            return
+
+        tokens = self._user_tokens.get(entry.user.id)
+        if tokens is not None:
+            tokens.discard(token_hash)
+            if not tokens:
+                del self._user_tokens[entry.user.id]
+
+
+token_cache = TokenCache()
@@ -0,0 +1,216 @@
+"""Checkpoints of the graph threads.
+
+Checkpoints and the pending writes of their tasks are stored as serialized blobs,
+the serialization belongs to the checkpoint saver. Metadata are stored as JSON so
+that the checkpoints of a thread can be filtered on them.
+"""
+
+from typing import NamedTuple
+
+from asyncpg import Record
+from asyncpg.connection import Connection
+
+
+class CheckpointRow(NamedTuple):
+    """Row of the checkpoints table."""
+
+    thread_id: str
+    checkpoint_ns: str
+    checkpoint_id: str
+    parent_checkpoint_id: str | None
+    type: str
+    checkpoint: bytes
+    metadata: str
+
+
+class CheckpointWriteRow(NamedTuple):
+    """Row of the checkpoint writes table."""
+
+    thread_id: str
+    checkpoint_ns: str
+    checkpoint_id: str
+    task_id: str
+    task_path: str
+    idx: int
+    channel: str
+    type: str
+    value: bytes
+
+
+async def create_checkpoint_tables(conn: Connection) -> None:
+    """Create the checkpoints and checkpoint writes tables."""
+    query = """
+    CREATE TABLE IF NOT EXISTS fastagent_checkpoints (
+        thread_id text NOT NULL,
+        checkpoint_ns text NOT NULL DEFAULT '',
+        checkpoint_id text NOT NULL,
+        parent_checkpoint_id text,
+        type text NOT NULL,
+        checkpoint bytea NOT NULL,
+        metadata jsonb NOT NULL DEFAULT '{}',
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+    );
+    CREATE TABLE IF NOT EXISTS fastagent_checkpoint_writes (
+        thread_id text NOT NULL,
+        checkpoint_ns text NOT NULL DEFAULT '',
+        checkpoint_id text NOT NULL,
+        task_id text NOT NULL,
+        task_path text NOT NULL DEFAULT '',
+        idx integer NOT NULL,
+        channel text NOT NULL,
+        type text NOT NULL,
+        value bytea NOT NULL,
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+    );
+    """
+    await conn.execute(query, timeout=30)
+
+
+async def insert_checkpoints(
+    conn: Connection,
+    checkpoints: list[CheckpointRow],
+    writes: list[CheckpointWriteRow],
+) -> None:
+    """CRUD operation: Insert checkpoints and writes in a single transaction.
+
+    Each statement is sent once for all its rows, so that a batch costs two round
+    trips whatever its size.
+
+    Args:
+        conn: The database connection.
+        checkpoints: The checkpoints.
+        writes: The pending writes of the tasks.
+    """
+    checkpoints_query = """
+    INSERT INTO fastagent_checkpoints
+        (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type,
+        checkpoint, metadata)
+    VALUES ($1, $2, $3, $4, $5, $6, $7::jsonb)
+    ON CONFLICT (thread_id, checkpoint_ns, checkpoint_id) DO UPDATE SET
+        checkpoint = EXCLUDED.checkpoint, metadata = EXCLUDED.metadata
+    """
+    # Special writes (errors, interrupts...) have a negative index and are replaced
+    writes_query = """
+    INSERT INTO fastagent_checkpoint_writes
+        (thread_id, checkpoint_ns, checkpoint_id, task_id, task_path, idx, channel,
+        type, value)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+    ON CONFLICT (thread_id, checkpoint_ns, checkpoint_id, task_id, idx) DO UPDATE SET
+        channel = EXCLUDED.channel, type = EXCLUDED.type, value = EXCLUDED.value
+        WHERE EXCLUDED.idx < 0
+    """
+    async with conn.transaction():
+        if checkpoints:
+            await conn.executemany(checkpoints_query, checkpoints, timeout=10)
+        if writes:
+            await conn.executemany(writes_query, writes, timeout=10)
+
+
+async def get_checkpoint(
+    conn: Connection, thread_id: str, checkpoint_ns: str, checkpoint_id: str | None
+) -> Record | None:
+    """CRUD operation: Get a checkpoint, the latest of the thread without an id.
+
+    Args:
+        conn: The database connection.
+        thread_id: The thread.
+        checkpoint_ns: The namespace of the checkpoint.
+        checkpoint_id: The checkpoint, None for the latest checkpoint.
+
+    Returns:
+        The checkpoint row, None if it does not exist.
+    """
+    query = """
+    SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type,
+        checkpoint, metadata
+    FROM fastagent_checkpoints
+    WHERE thread_id = $1 AND checkpoint_ns = $2
+        AND ($3::text IS NULL OR checkpoint_id = $3)
+    ORDER BY checkpoint_id DESC
+    LIMIT 1
+    """
+    return await conn.fetchrow(
+        query, thread_id, checkpoint_ns, checkpoint_id, timeout=3
+    )
+
+
+async def get_checkpoint_writes(
+    conn: Connection, thread_id: str, checkpoint_ns: str, checkpoint_id: str
+) -> list[Record]:
+    """CRUD operation: Get the pending writes of a checkpoint.
+
+    Args:
+        conn: The database connection.
+        thread_id: The thread.
+        checkpoint_ns: The namespace of the checkpoint.
+        checkpoint_id: The checkpoint.
+
+    Returns:
+        The write rows, ordered by task and index.
+    """
+    query = """
+    SELECT thread_id, checkpoint_ns, checkpoint_id, task_id, task_path, idx, channel,
+        type, value
+    FROM fastagent_checkpoint_writes
+    WHERE thread_id = $1 AND checkpoint_ns = $2 AND checkpoint_id = $3
+    ORDER BY task_id, idx
+    """
+    return await conn.fetch(query, thread_id, checkpoint_ns, checkpoint_id, timeout=3)
+
+
+async def list_checkpoints(  # noqa: PLR0913
+    conn: Connection,
+    thread_id: str | None,
+    checkpoint_ns: str | None,
+    *,
+    metadata: str | None = None,
+    before: str | None = None,
+    limit: int | None = None,
+) -> list[Record]:
+    """CRUD operation: List checkpoints, the most recent first.
+
+    Args:
+        conn: The database connection.
+        thread_id: The thread, None for all the threads.
+        checkpoint_ns: The namespace, None for all the namespaces.
+        metadata: The JSON object the metadata must contain.
+        before: Only list the checkpoints older than this one.
+        limit: The maximum number of checkpoints.
+
+    Returns:
+        The checkpoint rows.
+    """
+    query = """
+    SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type,
+        checkpoint, metadata
+    FROM fastagent_checkpoints
+    WHERE ($1::text IS NULL OR thread_id = $1)
+        AND ($2::text IS NULL OR checkpoint_ns = $2)
+        AND ($3::jsonb IS NULL OR metadata @> $3::jsonb)
+        AND ($4::text IS NULL OR checkpoint_id < $4)
+    ORDER BY checkpoint_id DESC
+    LIMIT $5
+    """
+    return await conn.fetch(
+        query, thread_id, checkpoint_ns, metadata, before, limit, timeout=10
+    )
+
+
+async def delete_thread_checkpoints(conn: Connection, thread_id: str) -> None:
+    """CRUD operation: Delete the checkpoints and writes of a thread.
+
+    Args:
+        conn: The database connection.
+        thread_id: The thread.
+    """
+    async with conn.transaction():
+        await conn.execute(
+            "DELETE FROM fastagent_checkpoint_writes WHERE thread_id = $1",
+            thread_id,
+            timeout=10,
+        )
+        await conn.execute(
+            "DELETE FROM fastagent_checkpoints WHERE thread_id = $1",
+            thread_id,
+            timeout=10,
+        )
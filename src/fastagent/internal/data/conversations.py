@@ -0,0 +1,353 @@
+"""Conversation history of the agents.
+
+The inputs and outputs of the agents are recorded in memory and written behind the
+requests: the buffer is flushed by a background task once it holds `flush_size`
+messages or every `flush_interval` seconds, and on shutdown. The messages are
+written with a binary `COPY`, the conversations with a single multi-row insert.
+
+The buffer is bounded, messages recorded while it is full are dropped so that a
+slow database never grows the memory of the worker.
+
+Conversations are scoped to their user: the id sent by a client only designates a
+conversation among the conversations of the user sending it. A client sending the
+id of a conversation of another user starts its own conversation with this id,
+without any lookup on the request path. Anonymous requests share the user 0.
+"""
+
+import asyncio
+import contextlib
+import logging
+import uuid
+from collections import deque
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING, NamedTuple
+
+from asyncpg import Pool, PostgresError
+from asyncpg.connection import Connection
+
+from fastagent.internal.data.users import AnnonymousUser, is_anonymous
+
+if TYPE_CHECKING:
+    from starlette.requests import HTTPConnection
+
+logger = logging.getLogger("_fastagent.conversations")
+
+CONVERSATION_HEADER = "X-Conversation-Id"
+
+
+class Message(NamedTuple):
+    """Row of the messages table."""
+
+    conversation_id: uuid.UUID
+    user_id: int
+    role: str
+    endpoint: str
+    content: str
+    truncated: bool
+    created_at: datetime
+
+
+async def create_conversation_tables(conn: Connection) -> None:
+    """Create the conversations and messages tables."""
+    query = """
+    CREATE TABLE IF NOT EXISTS fastagent_conversations (
+        user_id bigint NOT NULL,
+        id uuid NOT NULL,
+        created_at timestamp with time zone NOT NULL DEFAULT now(),
+        PRIMARY KEY (user_id, id)
+    );
+    CREATE TABLE IF NOT EXISTS fastagent_messages (
+        id bigserial PRIMARY KEY,
+        conversation_id uuid NOT NULL,
+        user_id bigint NOT NULL,
+        role text NOT NULL,
+        endpoint text NOT NULL,
+        content jsonb NOT NULL,
+        truncated boolean NOT NULL DEFAULT false,
+        created_at timestamp with time zone NOT NULL,
+        FOREIGN KEY (user_id, conversation_id)
+            REFERENCES fastagent_conversations ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS fastagent_messages_conversation_id_idx
+        ON fastagent_messages (user_id, conversation_id, created_at);
+    """
+    await conn.execute(query, timeout=30)
+
+
+async def insert_messages(conn: Connection, messages: list[Message]) -> None:
+    """CRUD operation: Insert messages and their conversations.
+
+    The new conversations are inserted with a single statement, the messages are
+    copied in the same transaction.
+
+    Args:
+        conn: The database connection.
+        messages: The messages.
+    """
+    conversations = {(message.user_id, message.conversation_id) for message in messages}
+    query = """
+    INSERT INTO fastagent_conversations (user_id, id)
+    SELECT * FROM unnest($1::bigint[], $2::uuid[])
+    ON CONFLICT (user_id, id) DO NOTHING
+    """
+    user_ids, ids = zip(*conversations, strict=True)
+    async with conn.transaction():
+        await conn.execute(query, list(user_ids), list(ids), timeout=10)
+        await conn.copy_records_to_table(
+            "fastagent_messages",
+            records=messages,
+            columns=Message._fields,
+            timeout=30,
+        )
+
+
+def conversation_id(request: "HTTPConnection") -> uuid.UUID:
+    """Get the conversation of a request from its header.
+
+    Args:
+        request: The request.
+
+    Returns:
+        The conversation sent by the client, a new conversation if it sent none or
+        an invalid one.
+    """
+    try:
+        return uuid.UUID(request.headers.get(CONVERSATION_HEADER, ""))
+    except ValueError:
+        return uuid.uuid4()
+
+
+def request_user_id(request: "HTTPConnection") -> int:
+    """Get the authenticated user of a request.
+
+    Args:
+        request: The request.
+
+    Returns:
+        The id of the user, 0 for anonymous requests.
+    """
+    context = getattr(request.state, "context", None)
+    if context is None or is_anonymous(context.user):
+        return AnnonymousUser.id
+
+    return context.user.id
+
+
+class Transcript:
+    """JSON chunks of a streamed output, bounded in size."""
+
+    def __init__(self: "Transcript", max_bytes: int) -> None:
+        """Initialize the transcript.
+
+        Args:
+            max_bytes: The size beyond which the next chunks are dropped.
+        """
+        self._chunks: list[str] = []
+        self._size = 0
+        self.max_bytes = max_bytes
+        self.truncated = False
+
+    def append(self: "Transcript", chunk: str) -> None:
+        """Append a JSON chunk, unless the transcript is full."""
+        if self.truncated or self._size + len(chunk) > self.max_bytes:
+            self.truncated = True
+            return
+
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+
+    def content(self: "Transcript") -> str:
+        """Get the chunks as a JSON array."""
+        return f"[{','.join(self._chunks)}]"
+
+
+class ConversationRecorder:
+    """Write-behind buffer of the conversation messages."""
+
+    def __init__(
+        self: "ConversationRecorder",
+        max_buffer: int = 10_000,
+        flush_size: int = 500,
+        flush_interval: float = 1.0,
+        max_message_bytes: int = 1024 * 1024,
+    ) -> None:
+        """Initialize the recorder.
+
+        Args:
+            max_buffer: The maximum number of messages waiting to be written.
+            flush_size: The number of messages triggering a flush.
+            flush_interval: The maximum time in seconds a message waits.
+            max_message_bytes: The size beyond which streamed outputs are truncated.
+        """
+        self._buffer: deque[Message] = deque()
+        self._pool: Pool | None = None
+        self._task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+        self.recorded = 0
+        self.dropped = 0
+        self.errors = 0
+        self.configure(
+            max_buffer=max_buffer,
+            flush_size=flush_size,
+            flush_interval=flush_interval,
+            max_message_bytes=max_message_bytes,
+        )
+
+    def configure(
+        self: "ConversationRecorder",
+        max_buffer: int,
+        flush_size: int,
+        flush_interval: float,
+        max_message_bytes: int,
+    ) -> None:
+        """Update the limits of the recorder.
+
+        Args:
+            max_buffer: The maximum number of messages waiting to be written.
+            flush_size: The number of messages triggering a flush.
+            flush_interval: The maximum time in seconds a message waits.
+            max_message_bytes: The size beyond which streamed outputs are truncated.
+        """
+        self.max_buffer = max_buffer
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_message_bytes = max_message_bytes
+
+    def transcript(self: "ConversationRecorder") -> Transcript:
+        """Create a transcript of a streamed output.
+
+        Returns:
+            A transcript bounded by `max_message_bytes`.
+        """
+        return Transcript(self.max_message_bytes)
+
+    @property
+    def pending(self: "ConversationRecorder") -> int:
+        """Get the number of messages waiting to be written."""
+        return len(self._buffer)
+
+    def record(  # noqa: PLR0913
+        self: "ConversationRecorder",
+        conversation: uuid.UUID,
+        user_id: int,
+        role: str,
+        endpoint: str,
+        content: str,
+        *,
+        truncated: bool = False,
+    ) -> None:
+        """Record a message, without waiting for it to be written.
+
+        Args:
+            conversation: The conversation.
+            user_id: The authenticated user, 0 for anonymous requests.
+            role: `user` for the inputs, `assistant` for the outputs.
+            endpoint: The endpoint of the agent.
+            content: The JSON content of the message.
+            truncated: Whether the content was truncated.
+        """
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+
+        self._buffer.append(
+            Message(
+                conversation,
+                user_id,
+                role,
+                endpoint,
+                content,
+                truncated,
+                datetime.now(UTC),
+            )
+        )
+        self.recorded += 1
+
+        if len(self._buffer) >= self.flush_size:
+            self._wakeup.set()
+
+    def record_exchange(  # noqa: PLR0913
+        self: "ConversationRecorder",
+        conversation: uuid.UUID,
+        user_id: int,
+        endpoint: str,
+        input_: str,
+        output: str,
+        *,
+        truncated: bool = False,
+    ) -> None:
+        """Record the input and the output of a request.
+
+        Args:
+            conversation: The conversation.
+            user_id: The authenticated user, 0 for anonymous requests.
+            endpoint: The endpoint of the agent.
+            input_: The JSON input.
+            output: The JSON output.
+            truncated: Whether the output was truncated.
+        """
+        self.record(conversation, user_id, "user", endpoint, input_)
+        self.record(
+            conversation, user_id, "assistant", endpoint, output, truncated=truncated
+        )
+
+    def start(self: "ConversationRecorder", pool: Pool) -> None:
+        """Start the background task flushing the buffer.
+
+        Args:
+            pool: The database pool.
+        """
+        self._pool = pool
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self: "ConversationRecorder") -> None:
+        """Stop the background task and write the remaining messages."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+        while self._buffer and await self.flush():
+            pass
+
+    async def flush(self: "ConversationRecorder") -> bool:
+        """Write up to `flush_size` buffered messages.
+
+        Returns:
+            True if the messages were written, False if the write failed.
+        """
+        count = min(len(self._buffer), self.flush_size)
+        if count == 0 or self._pool is None:
+            return True
+
+        messages = [self._buffer.popleft() for _ in range(count)]
+
+        try:
+            async with self._pool.acquire() as conn:
+                await insert_messages(conn, messages)
+        except (OSError, TimeoutError, PostgresError):
+            # The messages are dropped, a failing database must not fill the memory
+            logger.exception("Failed to write %d conversation messages", count)
+            self.errors += 1
+            self.dropped += count
+            return False
+
+        return True
+
+    async def _run(self: "ConversationRecorder") -> None:
+        while True:
+            try:
+                async with asyncio.timeout(self.flush_interval):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+
+            self._wakeup.clear()
+            while self._buffer:
+                if not await self.flush() or len(self._buffer) < self.flush_size:
+                    break
+
+
+conversation_recorder = ConversationRecorder()
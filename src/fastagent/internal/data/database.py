@@ -1,23 +1,145 @@
 """Database utilities."""
 
+from collections.abc import Awaitable, Callable
+
 from asyncpg import Pool, create_pool
+from asyncpg.connection import Connection
 
-from fastagent.internal.data.tokens import create_token_table
+from fastagent.internal.data.checkpoints import create_checkpoint_tables
+from fastagent.internal.data.conversations import create_conversation_tables
+from fastagent.internal.data.responses import create_response_cache_table
+from fastagent.internal.data.tokens import create_token_table, reap_expired_tokens
 from fastagent.internal.data.users import create_user_table
 
 
-async def init_database(dsn: str, max_size: int = 50) -> Pool:
+def get_pool_size(max_connections: int, workers: int) -> int:
+    """Split a total connection budget between the server workers.
+
+    Each worker owns its own pool, the budget is shared so that the total number
+    of connections opened on the database never exceeds `max_connections`.
+
+    Args:
+        max_connections: The total number of connections for the server.
+        workers: The number of worker processes.
+
+    Returns:
+        The maximum size of the pool of a single worker.
+    """
+    return max(1, max_connections // max(1, workers))
+
+
+def _session_initializer(
+    parameters: dict[str, str],
+) -> Callable[[Connection], Awaitable[None]] | None:
+    """Create the hook setting the session parameters of a new connection.
+
+    Args:
+        parameters: The session parameters, e.g. `{"statement_timeout": "5s"}`.
+
+    Returns:
+        The connection init hook, None if there are no parameters.
+    """
+    if not parameters:
+        return None
+
+    # All the parameters are set in a single round trip
+    calls = ", ".join(
+        f"set_config(${2 * i + 1}, ${2 * i + 2}, false)" for i in range(len(parameters))
+    )
+    query = f"SELECT {calls}"
+    args = [value for item in parameters.items() for value in item]
+
+    async def init(conn: Connection) -> None:
+        await conn.execute(query, *args)
+
+    return init
+
+
+async def init_database(  # noqa: PLR0913
+    dsn: str,
+    max_size: int = 50,
+    *,
+    min_size: int = 10,
+    max_inactive_connection_lifetime: float = 300.0,
+    statement_cache_size: int = 100,
+    command_timeout: float | None = None,
+    max_queries: int = 50_000,
+    session_parameters: dict[str, str] | None = None,
+) -> Pool:
     """Create a new database pool.
 
+    The pool opens `min_size` connections before returning so that the first
+    requests do not pay for opening them.
+
+    Args:
+        dsn: The Data Source Name of the database.
+        max_size: The maximum number of connections in the pool.
+        min_size: The number of connections opened upfront, capped by `max_size`.
+        max_inactive_connection_lifetime: The time in seconds after which an idle
+            connection is closed, 0 keeps them open.
+        statement_cache_size: The size of the prepared statement cache of each
+            connection.
+        command_timeout: The default timeout in seconds of the queries.
+        max_queries: The number of queries after which a connection is replaced.
+        session_parameters: The session parameters set on each new connection.
+
     Returns:
         The database pool.
     """
-    return await create_pool(dsn, max_size=max_size)
+    return await create_pool(
+        dsn,
+        min_size=min(min_size, max_size),
+        max_size=max_size,
+        max_inactive_connection_lifetime=max_inactive_connection_lifetime,
+        statement_cache_size=statement_cache_size,
+        command_timeout=command_timeout,
+        max_queries=max_queries,
+        init=_session_initializer(session_parameters or {}),
+    )
 
 
-async def setup_postgresql_database(dsn: str) -> None:
-    """Setup the database."""
+async def setup_postgresql_database(
+    dsn: str,
+    *,
+    response_cache: bool = False,
+    checkpoints: bool = False,
+    conversations: bool = False,
+) -> None:
+    """Setup the database.
+
+    Args:
+        dsn: The Data Source Name of the database.
+        response_cache: Also create the response cache table.
+        checkpoints: Also create the graph checkpoint tables.
+        conversations: Also create the conversation tables.
+    """
     pool = await init_database(dsn)
     async with pool.acquire() as conn:
         await create_user_table(conn)
         await create_token_table(conn)
+
+        if response_cache:
+            await create_response_cache_table(conn)
+
+        if checkpoints:
+            await create_checkpoint_tables(conn)
+
+        if conversations:
+            await create_conversation_tables(conn)
+
+
+async def reap_postgresql_tokens(dsn: str, batch_size: int = 1000) -> int:
+    """Delete the expired tokens.
+
+    Args:
+        dsn: The Data Source Name of the database.
+        batch_size: The maximum number of tokens deleted per batch.
+
+    Returns:
+        The number of deleted tokens.
+    """
+    pool = await init_database(dsn, max_size=1, min_size=1)
+    try:
+        return await reap_expired_tokens(pool, batch_size)
+    finally:
+        await pool.close()
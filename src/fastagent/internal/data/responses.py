@@ -0,0 +1,352 @@
+"""Cache of the agent responses.
+
+Responses are kept in an in-process LRU tier and, optionally, in a PostgreSQL table
+shared by all the workers. The memory tier is checked first, a hit in the database
+tier is copied back in memory.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import UTC, datetime, timedelta
+from typing import Any, Literal, NamedTuple
+
+from asyncpg import Pool, PostgresError
+from asyncpg.connection import Connection
+
+CacheTier = Literal["memory", "postgresql"]
+
+
+class CachedResponse(NamedTuple):
+    """Cache entry of the memory tier."""
+
+    body: bytes
+    deadline: float
+
+
+async def create_response_cache_table(conn: Connection) -> None:
+    """Create the response cache table."""
+    query = """
+    CREATE TABLE IF NOT EXISTS fastagent_response_cache (
+        key bytea PRIMARY KEY,
+        body bytea NOT NULL,
+        expiry timestamp with time zone NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS fastagent_response_cache_expiry_idx
+        ON fastagent_response_cache (expiry);
+    """
+    await conn.execute(query, timeout=30)
+
+
+async def get_cached_response(
+    conn: Connection, key: bytes
+) -> tuple[bytes, datetime] | None:
+    """CRUD operation: Get a response that has not expired.
+
+    Args:
+        conn: The database connection.
+        key: The cache key.
+
+    Returns:
+        The body and expiry of the response, None if it is not cached.
+    """
+    query = """
+    SELECT body, expiry FROM fastagent_response_cache
+        WHERE key = $1 AND expiry > now()
+    """
+    row = await conn.fetchrow(query, key, timeout=3)
+
+    if row is None:
+        return None
+
+    return row[0], row[1]
+
+
+async def upsert_cached_response(
+    conn: Connection, key: bytes, body: bytes, expiry: datetime
+) -> None:
+    """CRUD operation: Insert or replace a response.
+
+    Args:
+        conn: The database connection.
+        key: The cache key.
+        body: The body of the response.
+        expiry: The expiry of the entry.
+    """
+    query = """
+    INSERT INTO fastagent_response_cache (key, body, expiry)
+    VALUES ($1, $2, $3)
+    ON CONFLICT (key) DO UPDATE SET body = EXCLUDED.body, expiry = EXCLUDED.expiry
+    """
+    await conn.execute(query, key, body, expiry, timeout=3)
+
+
+async def delete_expired_responses(conn: Connection, batch_size: int = 1000) -> int:
+    """CRUD operation: Delete a batch of expired responses.
+
+    Args:
+        conn: The database connection.
+        batch_size: The maximum number of responses to delete.
+
+    Returns:
+        The number of deleted responses.
+    """
+    query = """
+    DELETE FROM fastagent_response_cache
+    WHERE key IN (
+        SELECT key FROM fastagent_response_cache
+        WHERE expiry < now()
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    )
+    """
+    result = await conn.execute(query, batch_size, timeout=10)
+
+    return int(result.split()[-1])
+
+
+async def reap_expired_responses(
+    pool: Pool, batch_size: int = 1000, pause: float = 0.1
+) -> int:
+    """Delete all the expired responses in small batches.
+
+    Args:
+        pool: The database pool.
+        batch_size: The maximum number of responses deleted per batch.
+        pause: The time in seconds to wait between two batches.
+
+    Returns:
+        The number of deleted responses.
+    """
+    total = 0
+
+    while True:
+        async with pool.acquire() as conn:
+            deleted = await delete_expired_responses(conn, batch_size)
+
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+        await asyncio.sleep(pause)
+
+
+def cache_key(
+    payload: Any,  # noqa: ANN401
+    user_id: int | None = None,
+    config: dict[str, Any] | None = None,
+) -> bytes:
+    """Compute the cache key of an invoke request.
+
+    Only the fields changing the output are kept: the input, the `configurable`
+    part of the config and the kwargs. Tracing fields such as tags, metadata or run
+    names do not change the key. The JSON is serialized with sorted keys so that the
+    key does not depend on the order of the fields.
+
+    Args:
+        payload: The decoded body of the request.
+        user_id: The user to scope the entry to, None to share it between users.
+        config: The config of the run, as updated from the request by the config
+            modifier. The config of the body by default.
+
+    Returns:
+        The sha256 digest of the normalized request.
+    """
+    if not isinstance(payload, dict):
+        payload = {"input": payload}
+
+    if config is None:
+        config = payload.get("config")
+    if not isinstance(config, dict):
+        config = {}
+
+    normalized = {
+        "input": payload.get("input"),
+        "configurable": config.get("configurable"),
+        "kwargs": payload.get("kwargs"),
+        "user": user_id,
+    }
+    # The values set by a config modifier are not always JSON
+    encoded = json.dumps(
+        normalized,
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=repr,
+    )
+
+    return hashlib.sha256(encoded.encode()).digest()
+
+
+class ResponseCache:
+    """Two tiers cache of the response bodies.
+
+    The memory tier is bounded by a number of entries and a total size in bytes, and
+    evicts the least recently used entries first. It is local to the worker.
+    """
+
+    def __init__(
+        self: "ResponseCache",
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entry_bytes: int = 1024 * 1024,
+        ttl: float = 300.0,
+        *,
+        postgresql: bool = False,
+    ) -> None:
+        """Initialize the cache.
+
+        Args:
+            max_entries: The maximum number of entries in memory.
+            max_bytes: The maximum total size of the bodies in memory.
+            max_entry_bytes: Larger responses are not cached.
+            ttl: The time in seconds a response is cached.
+            postgresql: Also cache the responses in the database.
+        """
+        self._entries: OrderedDict[bytes, CachedResponse] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.configure(
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+            max_entry_bytes=max_entry_bytes,
+            ttl=ttl,
+            postgresql=postgresql,
+        )
+
+    def configure(
+        self: "ResponseCache",
+        max_entries: int,
+        max_bytes: int,
+        max_entry_bytes: int,
+        ttl: float,
+        *,
+        postgresql: bool,
+    ) -> None:
+        """Update the limits of the cache and drop the entries in memory.
+
+        Args:
+            max_entries: The maximum number of entries in memory.
+            max_bytes: The maximum total size of the bodies in memory.
+            max_entry_bytes: Larger responses are not cached.
+            ttl: The time in seconds a response is cached.
+            postgresql: Also cache the responses in the database.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.postgresql = postgresql
+        self.clear()
+
+    async def get(
+        self: "ResponseCache", key: bytes, pool: Pool | None = None
+    ) -> tuple[bytes, CacheTier] | None:
+        """Get a cached response.
+
+        Args:
+            key: The cache key.
+            pool: The database pool, required by the database tier.
+
+        Returns:
+            The body of the response and the tier it was found in, None on a miss.
+        """
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            if entry.deadline > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.body, "memory"
+
+            self._remove(key)
+
+        if self.postgresql and pool is not None:
+            try:
+                async with pool.acquire() as conn:
+                    row = await get_cached_response(conn, key)
+            except (OSError, TimeoutError, PostgresError):
+                # The cache never fails a request
+                self.errors += 1
+                row = None
+
+            if row is not None:
+                body, expiry = row
+                remaining = (expiry - datetime.now(UTC)).total_seconds()
+                self._put(key, body, min(self.ttl, remaining))
+                self.hits += 1
+                return body, "postgresql"
+
+        self.misses += 1
+        return None
+
+    async def set(
+        self: "ResponseCache", key: bytes, body: bytes, pool: Pool | None = None
+    ) -> bool:
+        """Cache a response in all the tiers.
+
+        Args:
+            key: The cache key.
+            body: The body of the response.
+            pool: The database pool, required by the database tier.
+
+        Returns:
+            True if the response was cached, False if it is too large.
+        """
+        if len(body) > self.max_entry_bytes:
+            return False
+
+        self._put(key, body, self.ttl)
+
+        if self.postgresql and pool is not None:
+            expiry = datetime.now(UTC) + timedelta(seconds=self.ttl)
+            try:
+                async with pool.acquire() as conn:
+                    await upsert_cached_response(conn, key, body, expiry)
+            except (OSError, TimeoutError, PostgresError):
+                self.errors += 1
+
+        return True
+
+    def clear(self: "ResponseCache") -> None:
+        """Remove all the entries in memory."""
+        self._entries.clear()
+        self._size = 0
+
+    def stats(self: "ResponseCache") -> dict[str, int]:
+        """Get the counters of the cache.
+
+        Returns:
+            The number of hits, misses, errors, entries and bytes in memory.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "size": len(self._entries),
+            "bytes": self._size,
+        }
+
+    def _put(self: "ResponseCache", key: bytes, body: bytes, ttl: float) -> None:
+        if self.max_entries <= 0 or len(body) > self.max_bytes or ttl <= 0:
+            return
+
+        self._remove(key)
+        self._entries[key] = CachedResponse(body, time.monotonic() + ttl)
+        self._size += len(body)
+
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self: "ResponseCache", key: bytes) -> None:
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            self._size -= len(entry.body)
+
+
+response_cache = ResponseCache()
@@ -1,11 +1,13 @@
 """Token models for activation and authentication."""
 
+import asyncio
 import base64
 import hashlib
 from datetime import UTC, datetime, timedelta
 from enum import Enum
 from secrets import token_bytes
 
+from asyncpg import Pool
 from asyncpg.connection import Connection
 from pydantic import (
     BaseModel,
@@ -15,6 +17,8 @@ from pydantic import (
     SecretStr,
 )
 
+from fastagent.internal.data.cache import token_cache
+
 TOKEN_LENGTH = 26
 
 
@@ -42,8 +46,22 @@ class TokenModel(BaseModel):
     scope: Scope
 
 
+TOKEN_INDEXES = {
+    "fastagent_tokens_user_id_scope_idx": "(user_id, scope)",
+    "fastagent_tokens_expiry_idx": "(expiry)",
+}
+
+
 async def create_token_table(conn: Connection) -> None:
-    """Create the token table."""
+    """Create the token table and its indexes.
+
+    The `(user_id, scope)` index serves the deletion of the tokens of a user and the
+    cascade from the user table, the `expiry` index serves the expired tokens reaper.
+
+    The indexes are built concurrently, each in its own statement, so that the logins
+    are not blocked while they are built on an existing table. An index left invalid
+    by an interrupted build is dropped and built again.
+    """
     query = """
     CREATE TABLE IF NOT EXISTS fastagent_tokens (
         hash bytea PRIMARY KEY,
@@ -52,7 +70,24 @@ async def create_token_table(conn: Connection) -> None:
         scope text NOT NULL
     );
     """
-    await conn.execute(query, timeout=3)
+    await conn.execute(query, timeout=30)
+
+    invalid_query = """
+    SELECT pg_class.relname
+        FROM pg_index
+        INNER JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+        WHERE pg_class.relname = ANY($1::text[])
+            AND NOT pg_index.indisvalid
+    """
+    for row in await conn.fetch(invalid_query, list(TOKEN_INDEXES), timeout=30):
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {row['relname']}")
+
+    # Outside of a transaction and without timeout, the build scans the whole table
+    for name, columns in TOKEN_INDEXES.items():
+        await conn.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+            f"ON fastagent_tokens {columns}"
+        )
 
 
 def hash_token(token: str) -> SecretBytes:
@@ -60,6 +95,20 @@ def hash_token(token: str) -> SecretBytes:
     return hashlib.sha3_256(token.encode("utf-8")).digest()
 
 
+def generate_token() -> tuple[str, bytes]:
+    """Generate a random token.
+
+    Returns:
+        The plain text token and its sha3_256 hash.
+    """
+    random_bytes = token_bytes(16)
+
+    # Encode to base32 without padding
+    token_plain_text = base64.b32encode(random_bytes).decode().rstrip("=")
+
+    return token_plain_text, hash_token(token_plain_text)
+
+
 def create_token(user_id: int, ttl: timedelta, scope: Scope) -> TokenModel:
     """Create a token hashed with sha256.
 
@@ -71,13 +120,7 @@ def create_token(user_id: int, ttl: timedelta, scope: Scope) -> TokenModel:
     Returns:
         A token model.
     """
-    random_bytes = token_bytes(16)
-
-    # Encode to base32 without padding
-    token_plain_text = base64.b32encode(random_bytes).decode().rstrip("=")
-
-    # Hash the token using sha3_256
-    token_hash = hash_token(token_plain_text)
+    token_plain_text, token_hash = generate_token()
 
     expiry = datetime.now(UTC) + ttl
 
@@ -97,21 +140,39 @@ async def insert_token(conn: Connection, token: TokenModel) -> None:
         conn: The database connection.
         token: The token model.
     """
-    query = """
-    INSERT INTO fastagent_tokens (hash, user_id, expiry, scope)
-    VALUES ($1, $2, $3, $4)
-    """
-
-    await conn.execute(
-        query,
+    await insert_token_hash(
+        conn,
         token.hash.get_secret_value(),
         token.user_id,
         token.expiry,
         token.scope,
-        timeout=3,
     )
 
 
+async def insert_token_hash(
+    conn: Connection,
+    token_hash: bytes,
+    user_id: int,
+    expiry: datetime,
+    scope: Scope,
+) -> None:
+    """CRUD operation: Insert a token from its hash into the database.
+
+    Args:
+        conn: The database connection.
+        token_hash: The hash of the token.
+        user_id: The user ID to associate with the token.
+        expiry: The expiry of the token.
+        scope: The scope of the token.
+    """
+    query = """
+    INSERT INTO fastagent_tokens (hash, user_id, expiry, scope)
+    VALUES ($1, $2, $3, $4)
+    """
+
+    await conn.execute(query, token_hash, user_id, expiry, scope, timeout=3)
+
+
 async def new_token(
     conn: Connection, user_id: int, ttl: timedelta, scope: Scope
 ) -> TokenModel:
@@ -135,6 +196,8 @@ async def new_token(
 async def delete_all_for_user(conn: Connection, user_id: int, scope: Scope) -> None:
     """CRUD operation: Delete all tokens for a user.
 
+    Authentication tokens cached by the current worker are invalidated as well.
+
     Args:
         conn: The database connection.
         user_id: The user ID to delete tokens for.
@@ -145,3 +208,64 @@ async def delete_all_for_user(conn: Connection, user_id: int, scope: Scope) -> N
     """
 
     await conn.execute(query, scope, user_id, timeout=3)
+
+    if scope == Scope.AUTHENTICATION:
+        token_cache.invalidate_user(user_id)
+
+
+async def delete_expired_tokens(conn: Connection, batch_size: int = 1000) -> int:
+    """CRUD operation: Delete a batch of expired tokens.
+
+    Rows locked by another transaction are skipped so that concurrent reapers do not
+    wait on each other.
+
+    Args:
+        conn: The database connection.
+        batch_size: The maximum number of tokens to delete.
+
+    Returns:
+        The number of deleted tokens.
+    """
+    query = """
+    DELETE FROM fastagent_tokens
+    WHERE hash IN (
+        SELECT hash FROM fastagent_tokens
+        WHERE expiry < now()
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    )
+    """
+
+    result = await conn.execute(query, batch_size, timeout=10)
+
+    # The status of the command is "DELETE <count>"
+    return int(result.split()[-1])
+
+
+async def reap_expired_tokens(
+    pool: Pool, batch_size: int = 1000, pause: float = 0.1
+) -> int:
+    """Delete all the expired tokens in small batches.
+
+    Each batch runs in its own transaction and the connection is released between
+    batches, so the reaper never holds locks or a connection for long.
+
+    Args:
+        pool: The database pool.
+        batch_size: The maximum number of tokens deleted per batch.
+        pause: The time in seconds to wait between two batches.
+
+    Returns:
+        The number of deleted tokens.
+    """
+    total = 0
+
+    while True:
+        async with pool.acquire() as conn:
+            deleted = await delete_expired_tokens(conn, batch_size)
+
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+        await asyncio.sleep(pause)
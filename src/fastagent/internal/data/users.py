@@ -12,7 +12,6 @@ from pydantic import (
 )
 
 from fastagent.internal.data.tokens import Scope, hash_token
-from fastagent.internal.security import hash_password
 
 
 class UserCreate(BaseModel):
@@ -67,12 +66,16 @@ async def create_user_table(conn: Connection) -> None:
     await conn.execute(query, timeout=3)
 
 
-async def insert_user(conn: Connection, user: UserCreate) -> None:
+async def insert_user(conn: Connection, user: UserCreate, password_hash: bytes) -> None:
     """Insert a user into the database.
 
+    The password is hashed beforehand so that the connection is not held while
+    argon2 is running.
+
     Args:
         conn: The database connection.
         user: The user to insert.
+        password_hash: The hash of the user password.
     """
     query = """
     INSERT INTO fastagent_users (name, email, password_hash)
@@ -80,22 +83,36 @@ async def insert_user(conn: Connection, user: UserCreate) -> None:
         RETURNING id, created_at
     """
 
-    password_hash = hash_password(user.password.get_secret_value())
-
     await conn.execute(query, user.name, user.email, password_hash, timeout=3)
 
 
 async def get_user_for_token(conn: Connection, scope: Scope, token: str) -> UserModel:
     """Get a user for a token."""
-    token_hash = hash_token(token)
+    user, _ = await get_user_for_token_hash(conn, scope, hash_token(token))
+    return user
+
+
+async def get_user_for_token_hash(
+    conn: Connection, scope: Scope, token_hash: bytes
+) -> tuple[UserModel, datetime]:
+    """Get a user and the expiry of the token for a token hash.
+
+    Args:
+        conn: The database connection.
+        scope: The scope of the token.
+        token_hash: The hash of the token.
 
+    Returns:
+        The user owning the token and the expiry of the token.
+    """
     query = """
     SELECT fastagent_users.id,
         fastagent_users.created_at,
         fastagent_users.name,
         fastagent_users.email,
         fastagent_users.password_hash,
-        fastagent_users.version
+        fastagent_users.version,
+        fastagent_tokens.expiry
         FROM fastagent_users
         INNER JOIN fastagent_tokens
             ON fastagent_users.id = fastagent_tokens.user_id
@@ -110,7 +127,33 @@ async def get_user_for_token(conn: Connection, scope: Scope, token: str) -> User
         msg = "Invalid token"
         raise ValueError(msg)
 
-    return UserModel.model_validate(dict(row))
+    user = dict(row)
+    expiry = user.pop("expiry")
+
+    return UserModel.model_validate(user), expiry
+
+
+async def get_credentials_by_email(
+    conn: Connection, email: EmailStr
+) -> tuple[int, bytes] | None:
+    """Get the id and password hash of a user by email.
+
+    Args:
+        conn: The database connection.
+        email: The email of the user.
+
+    Returns:
+        The id and password hash of the user, None if the user does not exist.
+    """
+    query = """
+    SELECT id, password_hash FROM fastagent_users WHERE email = $1
+    """
+    row = await conn.fetchrow(query, email, timeout=3)
+
+    if row is None:
+        return None
+
+    return row[0], row[1]
 
 
 async def get_user_by_email(conn: Connection, email: EmailStr) -> UserModel:
@@ -0,0 +1,119 @@
+"""Thread pool running the synchronous agents.
+
+Synchronous programs, like DSPy modules, would block the event loop if they were
+called from the handlers. They run on a dedicated pool of threads instead, sized so
+that a burst of requests does not start an unbounded number of threads.
+"""
+
+import asyncio
+import contextvars
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class ExecutorBusyError(Exception):
+    """Raised when too many calls are waiting for the executor."""
+
+
+class ProgramExecutor:
+    """Bounded thread pool for the synchronous agents.
+
+    Calls beyond the threads and the pending limit are rejected instead of queued.
+    Each worker runs a single event loop, so the counters are updated without any
+    lock.
+    """
+
+    def __init__(
+        self: "ProgramExecutor", max_workers: int = 8, max_pending: int = 64
+    ) -> None:
+        """Initialize the executor, the pool is created on first use.
+
+        Args:
+            max_workers: The number of threads.
+            max_pending: The number of calls allowed to wait for a thread.
+        """
+        self._executor: ThreadPoolExecutor | None = None
+        self.in_flight = 0
+        self.rejected = 0
+        self.configure(max_workers=max_workers, max_pending=max_pending)
+
+    @property
+    def busy(self: "ProgramExecutor") -> int:
+        """Get the number of threads running a call."""
+        return min(self.in_flight, self.max_workers)
+
+    @property
+    def waiting(self: "ProgramExecutor") -> int:
+        """Get the number of calls waiting for a thread."""
+        return max(0, self.in_flight - self.max_workers)
+
+    def configure(self: "ProgramExecutor", max_workers: int, max_pending: int) -> None:
+        """Update the executor configuration, the running pool is shut down.
+
+        Args:
+            max_workers: The number of threads.
+            max_pending: The number of calls allowed to wait for a thread.
+        """
+        self.shutdown()
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+
+    def start(self: "ProgramExecutor") -> None:
+        """Create the pool if it is not running yet."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="fastagent-program"
+            )
+
+    def shutdown(self: "ProgramExecutor") -> None:
+        """Shutdown the pool and wait for the running calls."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def run(
+        self: "ProgramExecutor",
+        func: Callable[..., T],
+        /,
+        *args: object,
+        **kwargs: object,
+    ) -> T:
+        """Run a function on a thread of the pool.
+
+        The context variables of the caller are copied to the thread.
+
+        Args:
+            func: The function to run.
+            *args: The positional arguments of the function.
+            **kwargs: The keyword arguments of the function.
+
+        Returns:
+            The result of the function.
+
+        Raises:
+            ExecutorBusyError: If too many calls are already waiting.
+        """
+        if self.in_flight >= self.max_workers + self.max_pending:
+            self.rejected += 1
+            msg = "Too many agent calls in progress"
+            raise ExecutorBusyError(msg)
+
+        self.start()
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, func, *args, **kwargs)
+
+        # Released once the thread is done, a cancelled caller does not stop it
+        self.in_flight += 1
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+
+        return await asyncio.wrap_future(future)
+
+    def _release(self: "ProgramExecutor") -> None:
+        self.in_flight -= 1
+
+
+program_executor = ProgramExecutor()
@@ -1,8 +1,36 @@
 """Utility functions."""
 
+import json
 import logging
+import os
+import queue
 import sys
 from datetime import UTC, datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Literal
+
+_listener: "_QueueListener | None" = None
+_queue_handler: "DroppingQueueHandler | None" = None
+
+
+def _request_fields(record: logging.LogRecord) -> dict[str, str]:
+    """Extract the request fields of a record.
+
+    Args:
+        record: The record.
+
+    Returns:
+        The request fields, empty if the record has no request.
+    """
+    if not hasattr(record, "request") or not (req := record.request):
+        return {}
+
+    return {
+        "ip": f"{req.client.host}:{req.client.port}",
+        "proto": f"{req.scope['scheme'].upper()}/{req.scope['http_version']}",
+        "method": req.method,
+        "uri": req.url.path,
+    }
 
 
 class LoggingFormatter(logging.Formatter):
@@ -17,7 +45,8 @@ class LoggingFormatter(logging.Formatter):
         Returns:
             The formatted record as a string.
         """
-        timestamp = datetime.now(UTC).astimezone().isoformat()
+        # Use the creation time, the record may be formatted later by the listener
+        timestamp = datetime.fromtimestamp(record.created, UTC).astimezone().isoformat()
 
         log_msg = (
             f"time={timestamp}"
@@ -25,26 +54,130 @@ class LoggingFormatter(logging.Formatter):
             f" msg='{record.getMessage()}'"
         )
 
-        if hasattr(record, "request") and (req := record.request):
-            log_msg += (
-                f" ip={req.client.host}:{req.client.port}"
-                f" proto={req.scope['scheme'].upper()}/{req.scope['http_version']}"
-                f" method={req.method}"
-                f" uri={req.url.path}"
-            )
+        for key, value in _request_fields(record).items():
+            log_msg += f" {key}={value}"
 
         return log_msg
 
 
-def setup_logger(level: int = logging.INFO) -> logging.Logger:
+class JSONFormatter(logging.Formatter):
+    """Formatter writing each record as a JSON line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Format the record to a JSON string.
+
+        Args:
+            record: The record to format.
+
+        Returns:
+            The formatted record as a JSON string.
+        """
+        timestamp = datetime.fromtimestamp(record.created, UTC).astimezone().isoformat()
+
+        log_dict = {
+            "time": timestamp,
+            "level": record.levelname,
+            "msg": record.getMessage(),
+            **_request_fields(record),
+        }
+
+        if record.exc_info:
+            log_dict["exc"] = self.formatException(record.exc_info)
+
+        return json.dumps(log_dict)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler dropping the records when the queue is full.
+
+    Records are handed over as is, formatting and I/O happen in the listener
+    thread. Dropping under overload keeps the event loop from waiting on logs.
+    """
+
+    dropped: int
+
+    def __init__(self: "DroppingQueueHandler", log_queue: queue.Queue) -> None:
+        """Initialize the handler.
+
+        Args:
+            log_queue: The bounded queue read by the listener.
+        """
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(
+        self: "DroppingQueueHandler", record: logging.LogRecord
+    ) -> logging.LogRecord:
+        """Return the record unchanged, the listener lives in the same process.
+
+        Args:
+            record: The record.
+
+        Returns:
+            The record.
+        """
+        return record
+
+    def enqueue(self: "DroppingQueueHandler", record: logging.LogRecord) -> None:
+        """Enqueue the record or count it as dropped if the queue is full.
+
+        Args:
+            record: The record.
+        """
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(QueueListener):
+    """Queue listener waiting for room in the queue to stop."""
+
+    def enqueue_sentinel(self: "_QueueListener") -> None:
+        """Enqueue the sentinel, blocking while the queue is full."""
+        self.queue.put(self._sentinel)
+
+
+def _restart_listener() -> None:
+    """Restart the listener in a forked worker, threads do not survive a fork."""
+    global _listener  # noqa: PLW0603
+
+    if _listener is None or _queue_handler is None:
+        return
+
+    _queue_handler.queue = queue.Queue(maxsize=_queue_handler.queue.maxsize)
+    _queue_handler.dropped = 0
+
+    _listener = _QueueListener(_queue_handler.queue, *_listener.handlers)
+    _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listener)
+
+
+def setup_logger(
+    level: int = logging.INFO,
+    log_format: Literal["text", "json"] = "text",
+    queue_size: int = 0,
+) -> logging.Logger:
     """Setup logging for the application.
 
+    Calling it again replaces the previous configuration.
+
     Args:
         level: The logging level to use.
+        log_format: Write plain text or JSON lines.
+        queue_size: Hand the records to a background thread through a queue of this
+            size, 0 writes synchronously.
 
     Returns:
         The root logger.
     """
+    global _listener, _queue_handler  # noqa: PLW0603
+
+    shutdown_logger()
+
     # Disable Granian's default logging
     root_logger = logging.getLogger(__name__)
     root_logger.setLevel(level)
@@ -56,10 +189,36 @@ def setup_logger(level: int = logging.INFO) -> logging.Logger:
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(level)
 
-    formatter = LoggingFormatter()
+    formatter = JSONFormatter() if log_format == "json" else LoggingFormatter()
     console_handler.setFormatter(formatter)
 
-    root_logger.addHandler(console_handler)
-    custom_logger.addHandler(console_handler)
+    handler: logging.Handler = console_handler
+    _queue_handler = None
+    if queue_size > 0:
+        _queue_handler = handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        _listener = _QueueListener(handler.queue, console_handler)
+        _listener.start()
+
+    for logger in (root_logger, custom_logger):
+        logger.handlers.clear()
+        logger.addHandler(handler)
 
     return root_logger
+
+
+def shutdown_logger() -> None:
+    """Stop the background listener, flushing the queued records."""
+    global _listener  # noqa: PLW0603
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records() -> int:
+    """Get the number of records dropped because the queue was full.
+
+    Returns:
+        The number of dropped records in the current process.
+    """
+    return _queue_handler.dropped if _queue_handler is not None else 0
@@ -0,0 +1,444 @@
+"""Prometheus metrics.
+
+Metrics are recorded in plain Python containers, each worker runs a single event
+loop so recording needs no lock. With several workers, each worker periodically
+writes a snapshot of its metrics in a shared directory and the `/metrics` endpoint
+sums the snapshots of all the workers.
+
+On shutdown, a worker replaces its snapshot by a retired snapshot holding only its
+counters, so that the counters keep their values when a worker is replaced while
+its gauges stop being counted. The snapshots of the workers which died without
+shutting down are ignored.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Mapping, Sequence
+from types import TracebackType
+from typing import TYPE_CHECKING, Any, Literal, NamedTuple
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from asyncpg import Pool
+    from asyncpg.connection import Connection
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+Snapshot = dict[str, dict[str, list[float]]]
+
+# Prefix of the snapshots of the workers which were shut down
+RETIRED_PREFIX = "retired-"
+
+
+class Histogram:
+    """Histogram with fixed buckets, one series per label values."""
+
+    def __init__(
+        self: "Histogram",
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        """Initialize the histogram.
+
+        Args:
+            name: The metric name.
+            documentation: The help text of the metric.
+            labelnames: The names of the labels.
+            buckets: The upper bounds of the buckets, sorted.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Bucket counts followed by the +Inf bucket and the sum of the observations
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self: "Histogram", value: float, *labels: str) -> None:
+        """Record an observation.
+
+        Args:
+            value: The observed value.
+            *labels: The label values, in the order of the label names.
+        """
+        values = self._values.get(labels)
+        if values is None:
+            values = self._values[labels] = [0] * (len(self.buckets) + 2)
+
+        values[bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def time(self: "Histogram", *labels: str) -> "_Timer":
+        """Time a block of code.
+
+        Args:
+            *labels: The label values, in the order of the label names.
+
+        Returns:
+            A context manager observing the elapsed time on exit.
+        """
+        return _Timer(self, labels)
+
+    def snapshot(self: "Histogram") -> dict[str, list[float]]:
+        """Get a copy of the series, keyed by the JSON encoded label values."""
+        return {json.dumps(labels): list(v) for labels, v in self._values.items()}
+
+
+class _Timer:
+    """Context manager observing the elapsed time in a histogram."""
+
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self: "_Timer", histogram: Histogram, labels: tuple[str, ...]) -> None:
+        self._histogram = histogram
+        self._labels = labels
+        self._start = 0.0
+
+    def __enter__(self: "_Timer") -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(
+        self: "_Timer",
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+
+
+class _Callback(NamedTuple):
+    """Metric read from a function when the metrics are collected."""
+
+    kind: Literal["gauge", "counter"]
+    documentation: str
+    function: Callable[[], Any]
+    labelnames: tuple[str, ...]
+
+
+class Registry:
+    """Collection of the metrics of the application."""
+
+    def __init__(self: "Registry") -> None:
+        """Initialize an empty registry."""
+        self.directory: Path | None = None
+        self._histograms: dict[str, Histogram] = {}
+        self._callbacks: dict[str, _Callback] = {}
+
+    def histogram(
+        self: "Registry",
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """Register a histogram.
+
+        Args:
+            name: The metric name.
+            documentation: The help text of the metric.
+            labelnames: The names of the labels.
+            buckets: The upper bounds of the buckets, sorted.
+
+        Returns:
+            The histogram.
+        """
+        histogram = Histogram(name, documentation, labelnames, buckets)
+        self._histograms[name] = histogram
+        return histogram
+
+    def callback(
+        self: "Registry",
+        name: str,
+        documentation: str,
+        function: Callable[[], float | Mapping[tuple[str, ...], float]],
+        kind: Literal["gauge", "counter"] = "gauge",
+        labelnames: Sequence[str] = (),
+    ) -> None:
+        """Register a value read when the metrics are collected.
+
+        Args:
+            name: The metric name.
+            documentation: The help text of the metric.
+            function: The function returning the current value, or the value of
+                each label values when the metric has labels.
+            kind: The Prometheus type of the metric.
+            labelnames: The names of the labels.
+        """
+        self._callbacks[name] = _Callback(
+            kind, documentation, function, tuple(labelnames)
+        )
+
+    def snapshot(self: "Registry") -> Snapshot:
+        """Get the current values of the metrics of this worker.
+
+        Returns:
+            The series of each metric keyed by the JSON encoded label values.
+        """
+        snapshot = {name: h.snapshot() for name, h in self._histograms.items()}
+
+        for name, callback in self._callbacks.items():
+            value = callback.function()
+            if callback.labelnames:
+                snapshot[name] = {
+                    json.dumps(labels): [float(v)] for labels, v in value.items()
+                }
+            else:
+                snapshot[name] = {"[]": [float(value)]}
+
+        return snapshot
+
+    def write_snapshot(self: "Registry", snapshot: Snapshot | None = None) -> None:
+        """Write the snapshot of this worker in the shared directory.
+
+        Args:
+            snapshot: The snapshot to write, the current one if not provided.
+        """
+        if self.directory is None:
+            return
+
+        _write_json(self.directory / f"{os.getpid()}.json", snapshot or self.snapshot())
+
+    def retire(self: "Registry", snapshot: Snapshot | None = None) -> None:
+        """Replace the snapshot of this worker by its counters, on shutdown.
+
+        Args:
+            snapshot: The last snapshot of the worker, the current one if not
+                provided.
+        """
+        if self.directory is None:
+            return
+
+        snapshot = snapshot or self.snapshot()
+        counters = {
+            name: series
+            for name, series in snapshot.items()
+            if name in self._histograms or self._callbacks[name].kind == "counter"
+        }
+        # A later worker may get the same pid, the name of a retired snapshot is unique
+        name = f"{RETIRED_PREFIX}{os.getpid()}-{time.time_ns()}.json"
+        _write_json(self.directory / name, counters)
+        (self.directory / f"{os.getpid()}.json").unlink(missing_ok=True)
+
+    async def collect(self: "Registry") -> Snapshot:
+        """Sum the snapshots of all the workers.
+
+        Returns:
+            The aggregated series of each metric.
+        """
+        snapshots = [self.snapshot()]
+        if self.directory is not None:
+            # The snapshots are read in a thread, not to block the event loop
+            snapshots.extend(await asyncio.to_thread(self._read_snapshots))
+
+        merged: Snapshot = {}
+        for snapshot in snapshots:
+            for name, series in snapshot.items():
+                target = merged.setdefault(name, {})
+                for labels, values in series.items():
+                    current = target.setdefault(labels, [0] * len(values))
+                    for index, value in enumerate(values):
+                        current[index] += value
+
+        return merged
+
+    def render(self: "Registry", snapshot: Snapshot) -> str:
+        """Render a snapshot in the Prometheus text format.
+
+        Args:
+            snapshot: The snapshot to render.
+
+        Returns:
+            The metrics in the Prometheus text format.
+        """
+        lines = []
+
+        for name, histogram in self._histograms.items():
+            lines.append(f"# HELP {name} {histogram.documentation}")
+            lines.append(f"# TYPE {name} histogram")
+
+            for labels, values in snapshot.get(name, {}).items():
+                pairs = list(zip(histogram.labelnames, json.loads(labels), strict=True))
+                count = 0
+                bounds = [*map(str, histogram.buckets), "+Inf"]
+                for bound, bucket_count in zip(bounds, values, strict=False):
+                    count += bucket_count
+                    bucket_labels = _format_labels([*pairs, ("le", bound)])
+                    lines.append(f"{name}_bucket{bucket_labels} {count:g}")
+                lines.append(f"{name}_sum{_format_labels(pairs)} {values[-1]}")
+                lines.append(f"{name}_count{_format_labels(pairs)} {count:g}")
+
+        for name, callback in self._callbacks.items():
+            lines.append(f"# HELP {name} {callback.documentation}")
+            lines.append(f"# TYPE {name} {callback.kind}")
+            for labels, values in snapshot.get(name, {}).items():
+                pairs = zip(callback.labelnames, json.loads(labels), strict=True)
+                lines.append(f"{name}{_format_labels(list(pairs))} {values[0]:g}")
+
+        return "\n".join(lines) + "\n"
+
+    def _read_snapshots(self: "Registry") -> list[Snapshot]:
+        """Read the snapshots of the other workers, live or retired."""
+        snapshots = []
+        for path in self.directory.glob("*.json"):
+            if not path.name.startswith(RETIRED_PREFIX):
+                if not path.stem.isdigit():
+                    continue
+                pid = int(path.stem)
+                if pid == os.getpid() or not _is_alive(pid):
+                    continue
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except FileNotFoundError:
+                # The worker retired in the meantime
+                continue
+
+        return snapshots
+
+    async def run_snapshot_writer(self: "Registry", interval: float) -> None:
+        """Periodically write the snapshot of this worker until cancelled.
+
+        Args:
+            interval: The time in seconds between two snapshots.
+        """
+        while True:
+            # Values are copied on the event loop, only the I/O runs in a thread
+            await asyncio.to_thread(self.write_snapshot, self.snapshot())
+            await asyncio.sleep(interval)
+
+
+def _write_json(path: "Path", snapshot: Snapshot) -> None:
+    """Write a snapshot atomically, the readers never see a partial file."""
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(snapshot))
+    tmp_path.replace(path)
+
+
+def _is_alive(pid: int) -> bool:
+    """Check whether a worker process is still running."""
+    if sys.platform == "win32":
+        # Sending a signal terminates the process on Windows
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def _format_labels(pairs: Sequence[tuple[str, str]]) -> str:
+    """Format label pairs in the Prometheus text format."""
+    if not pairs:
+        return ""
+
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class InstrumentedPool:
+    """Pool wrapper recording the time spent waiting for a connection."""
+
+    def __init__(self: "InstrumentedPool", pool: "Pool") -> None:
+        """Initialize the wrapper.
+
+        Args:
+            pool: The database pool.
+        """
+        self._pool = pool
+
+    def acquire(
+        self: "InstrumentedPool", *, timeout: float | None = None
+    ) -> "_Acquire":
+        """Acquire a connection from the pool.
+
+        Args:
+            timeout: The maximum time to wait for a connection.
+
+        Returns:
+            An async context manager returning the connection.
+        """
+        return _Acquire(self._pool, timeout)
+
+    def __getattr__(self: "InstrumentedPool", name: str) -> Any:  # noqa: ANN401
+        """Forward the other attributes to the pool."""
+        return getattr(self._pool, name)
+
+
+class _Acquire:
+    """Timed acquisition of a pool connection."""
+
+    __slots__ = ("_conn", "_pool", "_timeout")
+
+    def __init__(self: "_Acquire", pool: "Pool", timeout: float | None) -> None:
+        self._pool = pool
+        self._timeout = timeout
+        self._conn: Connection | None = None
+
+    async def __aenter__(self: "_Acquire") -> "Connection":
+        start = time.perf_counter()
+        self._conn = await self._pool.acquire(timeout=self._timeout)
+        POOL_ACQUIRE_DURATION.observe(time.perf_counter() - start)
+        return self._conn
+
+    async def __aexit__(
+        self: "_Acquire",
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        await self._pool.release(self._conn)
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.histogram(
+    "fastagent_http_request_duration_seconds",
+    "Duration of the HTTP requests.",
+    ("method", "route", "status"),
+)
+TIME_TO_FIRST_CHUNK = registry.histogram(
+    "fastagent_http_time_to_first_chunk_seconds",
+    "Time until the first chunk of a streamed response is sent.",
+    ("route",),
+)
+AUTH_LOOKUP_DURATION = registry.histogram(
+    "fastagent_auth_lookup_duration_seconds",
+    "Duration of the authentication token lookups in the database.",
+)
+POOL_ACQUIRE_DURATION = registry.histogram(
+    "fastagent_db_pool_acquire_duration_seconds",
+    "Time spent waiting for a database connection.",
+)
+RUNNABLE_DURATION = registry.histogram(
+    "fastagent_runnable_duration_seconds",
+    "Execution time of the runnable.",
+    ("endpoint",),
+    buckets=(*DEFAULT_BUCKETS, 60.0, 120.0),
+)
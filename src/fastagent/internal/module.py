@@ -1,39 +1,56 @@
 """Service module for agent."""
 
-import importlib.util
+import importlib
 import sys
 from pathlib import Path
-from types import ModuleType
+from typing import Any, ClassVar
 
 
 class ModuleLoader:
-    """A utility class for dynamically loading Python modules from import strings."""
+    """A utility class for dynamically loading Python objects from import strings.
 
-    @staticmethod
-    def load_from_string(import_string: str) -> ModuleType:
-        """Load a module from an import string (dot notation).
+    Modules are imported with the standard import system, from the current directory
+    first, so that the agent packages support relative imports and are only executed
+    once. The loaded objects are cached by import string.
+    """
+
+    _cache: ClassVar[dict[str, Any]] = {}
+
+    @classmethod
+    def load_from_string(cls: type["ModuleLoader"], import_string: str) -> Any:  # noqa: ANN401
+        """Load an object from an import string.
 
         Args:
-            import_string: Import path in dot notation (e.g., "myapp.main")
+            import_string: Import path in the format `module:attribute`, the attribute
+                may be nested with dots. The module itself is returned without one.
 
         Returns:
             The loaded module or attribute
 
+        Raises:
+            ImportError: If the module has no such attribute.
+
         Example:
-            loader.load_from_string("myapp.main.app")
+            loader.load_from_string("myapp.main:app")
         """
+        if import_string in cls._cache:
+            return cls._cache[import_string]
+
         module_path, _, attribute = import_string.partition(":")
 
-        module_name = module_path.replace(".", "/")
-        file_path = Path(module_name + ".py")
+        # The agent is found from the project directory, like with `python -m`
+        cwd = str(Path.cwd())
+        if cwd not in sys.path:
+            sys.path.insert(0, cwd)
 
-        spec = importlib.util.spec_from_file_location(module_name, str(file_path))
-        if spec is None or spec.loader is None:
-            msg = f"Failed to create module spec for {file_path}"
-            raise ImportError(msg)
+        target = importlib.import_module(module_path)
+        for name in filter(None, attribute.split(".")):
+            try:
+                target = getattr(target, name)
+            except AttributeError as e:
+                msg = f"Module {module_path} has no attribute {attribute}"
+                raise ImportError(msg) from e
 
-        module = importlib.util.module_from_spec(spec)
-        sys.modules[module_name] = module
-        spec.loader.exec_module(module)
+        cls._cache[import_string] = target
 
-        return getattr(module, attribute)
+        return target
@@ -0,0 +1,206 @@
+"""Token bucket rate limiting.
+
+Each client owns a bucket of `burst` tokens refilled at `rate` tokens per second, a
+request takes one token and is rejected when the bucket is empty.
+
+Two stores keep the buckets:
+
+- `MemoryStore` keeps them in the worker process, limits are applied per worker.
+- `SharedMemoryStore` keeps them in an anonymous shared memory mapping created
+  before the workers are forked, limits hold across all the workers of the host.
+"""
+
+import hashlib
+import mmap
+import multiprocessing
+import struct
+import time
+from typing import Protocol
+
+# Key hash, tokens and last refill time of a bucket in the shared memory
+_SLOT = struct.Struct("Qdd")
+
+
+def _refill(
+    tokens: float, updated: float, now: float, rate: float, burst: int
+) -> tuple[float, float | None]:
+    """Take a token from a bucket.
+
+    Args:
+        tokens: The tokens left in the bucket at the last update.
+        updated: The time of the last update.
+        now: The current time.
+        rate: The number of tokens added per second.
+        burst: The capacity of the bucket.
+
+    Returns:
+        The tokens left and None if the request is allowed, or the time in seconds
+        until a token is available if the request is rejected.
+    """
+    tokens = min(burst, tokens + (now - updated) * rate)
+
+    if tokens >= 1:
+        return tokens - 1, None
+
+    return tokens, (1 - tokens) / rate
+
+
+class Store(Protocol):
+    """Storage of the buckets."""
+
+    def take(self, key: str, rate: float, burst: int) -> float | None:
+        """Take a token from the bucket of a key.
+
+        Args:
+            key: The key of the bucket.
+            rate: The number of tokens added per second.
+            burst: The capacity of the bucket.
+
+        Returns:
+            None if the request is allowed, otherwise the time in seconds until a
+            token is available.
+        """
+        ...
+
+
+class MemoryStore:
+    """Buckets kept in the worker process.
+
+    Buckets are spread over shards holding at most `max_keys / shards` buckets each,
+    the oldest bucket of a full shard is dropped so that eviction stays cheap.
+    """
+
+    def __init__(
+        self: "MemoryStore", max_keys: int = 100_000, shards: int = 64
+    ) -> None:
+        """Initialize the store.
+
+        Args:
+            max_keys: The maximum number of buckets.
+            shards: The number of shards.
+        """
+        self._shards: list[dict[str, list[float]]] = [{} for _ in range(shards)]
+        self._shard_size = max(1, max_keys // shards)
+
+    def take(self: "MemoryStore", key: str, rate: float, burst: int) -> float | None:
+        """Take a token from the bucket of a key.
+
+        Args:
+            key: The key of the bucket.
+            rate: The number of tokens added per second.
+            burst: The capacity of the bucket.
+
+        Returns:
+            None if the request is allowed, otherwise the time in seconds until a
+            token is available.
+        """
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        bucket = shard.get(key)
+
+        if bucket is None:
+            if len(shard) >= self._shard_size:
+                del shard[next(iter(shard))]
+            bucket = shard[key] = [burst, now]
+
+        bucket[0], retry_after = _refill(bucket[0], bucket[1], now, rate, burst)
+        bucket[1] = now
+
+        return retry_after
+
+
+class SharedMemoryStore:
+    """Buckets kept in a shared memory table, shared by the forked workers.
+
+    The table has a fixed number of slots addressed by the hash of the key, a key
+    colliding with another one takes over its slot with a full bucket. Slots are
+    protected by a set of locks, each lock guarding a stripe of slots.
+
+    The store must be created before the workers are forked.
+    """
+
+    def __init__(
+        self: "SharedMemoryStore", slots: int = 65_536, locks: int = 64
+    ) -> None:
+        """Initialize the store.
+
+        Args:
+            slots: The number of buckets in the table.
+            locks: The number of locks guarding the table.
+        """
+        self._slots = slots
+        self._memory = mmap.mmap(-1, slots * _SLOT.size)
+        context = multiprocessing.get_context("fork")
+        self._locks = [context.Lock() for _ in range(locks)]
+
+    def take(
+        self: "SharedMemoryStore", key: str, rate: float, burst: int
+    ) -> float | None:
+        """Take a token from the bucket of a key.
+
+        Args:
+            key: The key of the bucket.
+            rate: The number of tokens added per second.
+            burst: The capacity of the bucket.
+
+        Returns:
+            None if the request is allowed, otherwise the time in seconds until a
+            token is available.
+        """
+        # Stable across processes, unlike the builtin hash of a string
+        key_hash = int.from_bytes(
+            hashlib.blake2b(key.encode(), digest_size=8).digest(), "little"
+        )
+        index = key_hash % self._slots
+        offset = index * _SLOT.size
+
+        with self._locks[index % len(self._locks)]:
+            now = time.monotonic()
+            slot_hash, tokens, updated = _SLOT.unpack_from(self._memory, offset)
+
+            if slot_hash != key_hash:
+                tokens, updated = burst, now
+
+            tokens, retry_after = _refill(tokens, updated, now, rate, burst)
+            _SLOT.pack_into(self._memory, offset, key_hash, tokens, now)
+
+        return retry_after
+
+
+class RateLimiter:
+    """Rate limits of the route groups."""
+
+    def __init__(
+        self: "RateLimiter",
+        store: Store,
+        limits: dict[str, tuple[float, int]],
+    ) -> None:
+        """Initialize the rate limiter.
+
+        Args:
+            store: The storage of the buckets.
+            limits: The rate and burst of each path prefix.
+        """
+        self.store = store
+        self.limits = limits
+        self.rejected = 0
+
+    def check(self: "RateLimiter", path: str, client: str) -> float | None:
+        """Take a token for a request.
+
+        Args:
+            path: The path of the request.
+            client: The key of the client, a user or an IP address.
+
+        Returns:
+            None if the request is allowed, otherwise the time in seconds until the
+            client can retry.
+        """
+        for prefix, (rate, burst) in self.limits.items():
+            if path.startswith(prefix):
+                retry_after = self.store.take(f"{prefix}:{client}", rate, burst)
+                if retry_after is not None:
+                    self.rejected += 1
+                return retry_after
+
+        return None
@@ -1,3 +1,19 @@
-from fastagent.internal.security.password import hash_password, verify_password
+from fastagent.internal.security.password import (
+    PasswordExecutorBusyError,
+    dummy_password_hash,
+    hash_password,
+    hash_password_async,
+    password_executor,
+    verify_password,
+    verify_password_async,
+)
 
-__all__ = ["hash_password", "verify_password"]
+__all__ = [
+    "PasswordExecutorBusyError",
+    "dummy_password_hash",
+    "hash_password",
+    "hash_password_async",
+    "password_executor",
+    "verify_password",
+    "verify_password_async",
+]
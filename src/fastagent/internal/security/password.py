@@ -1,8 +1,22 @@
-"""Password hashing and verification."""
+"""Password hashing and verification.
+
+Argon2 is CPU bound, the async variants run it on a dedicated executor so that the
+event loop keeps serving other requests while a password is hashed or verified.
+"""
+
+import asyncio
+import functools
+import secrets
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from typing import Literal, TypeVar
 
 from argon2 import PasswordHasher
 from argon2.exceptions import VerificationError
 
+T = TypeVar("T")
+
 _hasher = PasswordHasher(
     time_cost=4,
 )
@@ -34,3 +48,139 @@ def hash_password(password: str) -> bytes:
         The hashed password as a bytes object.
     """
     return _hasher.hash(password).encode("utf-8")
+
+
+@functools.cache
+def dummy_password_hash() -> bytes:
+    """Get the hash of a random password, computed once.
+
+    Verifying a password against it costs as much as against the hash of a user,
+    so that the unknown emails are not revealed by the response time.
+
+    Returns:
+        The hashed password, no password matches it.
+    """
+    return hash_password(secrets.token_urlsafe(32))
+
+
+class PasswordExecutorBusyError(Exception):
+    """Raised when too many password operations are waiting for the executor."""
+
+
+class PasswordExecutor:
+    """Bounded executor for the password operations.
+
+    Threads are enough as argon2-cffi releases the GIL, processes isolate the
+    hashing from the worker entirely. Operations beyond the workers and the
+    pending limit are rejected instead of queued.
+    """
+
+    def __init__(
+        self: "PasswordExecutor",
+        kind: Literal["thread", "process"] = "thread",
+        max_workers: int = 2,
+        max_pending: int = 64,
+    ) -> None:
+        """Initialize the executor, the pool is created on first use.
+
+        Args:
+            kind: Run the operations on threads or processes.
+            max_workers: The number of threads or processes.
+            max_pending: The number of operations allowed to wait for a worker.
+        """
+        self._executor: Executor | None = None
+        self._in_flight = 0
+        self.configure(kind=kind, max_workers=max_workers, max_pending=max_pending)
+
+    def configure(
+        self: "PasswordExecutor",
+        kind: Literal["thread", "process"],
+        max_workers: int,
+        max_pending: int,
+    ) -> None:
+        """Update the executor configuration, the running pool is shut down.
+
+        Args:
+            kind: Run the operations on threads or processes.
+            max_workers: The number of threads or processes.
+            max_pending: The number of operations allowed to wait for a worker.
+        """
+        self.shutdown()
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+
+    def start(self: "PasswordExecutor") -> None:
+        """Create the pool if it is not running yet."""
+        if self._executor is not None:
+            return
+
+        if self.kind == "process":
+            # Spawn avoids forking a worker that already runs the event loop threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=get_context("spawn")
+            )
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="fastagent-password"
+            )
+
+    def shutdown(self: "PasswordExecutor") -> None:
+        """Shutdown the pool and wait for the running operations."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def run(self: "PasswordExecutor", func: Callable[..., T], *args: object) -> T:
+        """Run a password operation on the executor.
+
+        Args:
+            func: The function to run.
+            *args: The arguments of the function.
+
+        Returns:
+            The result of the function.
+
+        Raises:
+            PasswordExecutorBusyError: If too many operations are already waiting.
+        """
+        if self._in_flight >= self.max_workers + self.max_pending:
+            msg = "Too many password operations in progress"
+            raise PasswordExecutorBusyError(msg)
+
+        self.start()
+        self._in_flight += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._in_flight -= 1
+
+
+password_executor = PasswordExecutor()
+
+
+async def verify_password_async(password: str, password_hash: bytes) -> bool:
+    """Verify a password against a hashed password on the password executor.
+
+    Args:
+        password: The password to verify.
+        password_hash: The hashed password to verify against.
+
+    Returns:
+        True if the password is correct, False otherwise.
+    """
+    return await password_executor.run(verify_password, password, password_hash)
+
+
+async def hash_password_async(password: str) -> bytes:
+    """Hash a password using Argon2id on the password executor.
+
+    Args:
+        password: The password to hash.
+
+    Returns:
+        The hashed password as a bytes object.
+    """
+    return await password_executor.run(hash_password, password)
@@ -2,12 +2,24 @@
 
 from fastagent.internal.server.handlers import http_exception_handler
 from fastagent.internal.server.middlewares import (
+    BEARER_SUBPROTOCOL,
+    AdmissionMiddleware,
     AuthenticationMiddleware,
+    CompressionMiddleware,
+    MetricsMiddleware,
+    RateLimitMiddleware,
     RequestLoggingMiddleware,
+    rate_limit_key,
 )
 
 __all__ = [
+    "BEARER_SUBPROTOCOL",
+    "AdmissionMiddleware",
     "AuthenticationMiddleware",
+    "CompressionMiddleware",
+    "MetricsMiddleware",
+    "RateLimitMiddleware",
     "RequestLoggingMiddleware",
     "http_exception_handler",
+    "rate_limit_key",
 ]
@@ -25,4 +25,6 @@ async def http_exception_handler(
         case _:
             msg = exc.detail
 
-    return JSONResponse(status_code=exc.status_code, content={"message": msg})
+    return JSONResponse(
+        status_code=exc.status_code, content={"message": msg}, headers=exc.headers
+    )
@@ -1,20 +1,49 @@
-"""Collection of middlewares."""
+"""Collection of middlewares.
 
+Middlewares are implemented as pure ASGI applications, they wrap `receive` and
+`send` instead of buffering the request and response like `BaseHTTPMiddleware`.
+This keeps streaming responses untouched and avoids an extra task per request.
+"""
+
+import asyncio
 import logging
+import math
+import random
+import time
+import zlib
+from collections.abc import Sequence
+from typing import Protocol
 
 from fastapi import HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
+from starlette.responses import JSONResponse
 from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from starlette.websockets import WebSocketClose
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
-from fastagent.internal.data.tokens import TOKEN_LENGTH
+from fastagent.internal.admission import AdmissionRejectedError, ConcurrencyLimiter
+from fastagent.internal.data.cache import TokenCache, token_cache
+from fastagent.internal.data.tokens import TOKEN_LENGTH, hash_token
 from fastagent.internal.data.tokens import Scope as TokenScope
-from fastagent.internal.data.users import AnnonymousUser, get_user_for_token
+from fastagent.internal.data.users import (
+    AnnonymousUser,
+    UserModel,
+    get_user_for_token_hash,
+)
+from fastagent.internal.metrics import AUTH_LOOKUP_DURATION, REQUEST_DURATION
+from fastagent.internal.ratelimit import RateLimiter
 from fastagent.internal.server.context import Context
 
+# Subprotocol carrying the token, for the clients unable to set headers
+BEARER_SUBPROTOCOL = "bearer"
 
-class MaxSizeMiddleware(BaseHTTPMiddleware):
+
+class MaxSizeMiddleware:
     """Limit the maximum size of the request body."""
 
     def __init__(self, app: ASGIApp, *, max_size: int | None = None) -> None:
@@ -24,7 +53,7 @@ class MaxSizeMiddleware(BaseHTTPMiddleware):
             app: The ASGI app.
             max_size: The maximum size of the request body.
         """
-        super().__init__(app)
+        self.app = app
         self.max_size = max_size
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
@@ -37,7 +66,7 @@ class MaxSizeMiddleware(BaseHTTPMiddleware):
             receive: The receive function.
             send: The send function.
         """
-        if scope["type"] != "http":
+        if scope["type"] != "http" or self.max_size is None:
             await self.app(scope, receive, send)
             return
 
@@ -51,7 +80,7 @@ class MaxSizeMiddleware(BaseHTTPMiddleware):
             chunk_size = len(message.get("body", b""))
             total_size += chunk_size
 
-            if self.max_size is not None and total_size > self.max_size:
+            if total_size > self.max_size:
                 raise HTTPException(
                     status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                     detail="Payload too large",
@@ -62,95 +91,588 @@ class MaxSizeMiddleware(BaseHTTPMiddleware):
         await self.app(scope, rcv, send)
 
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class RequestLoggingMiddleware:
     """Request logging middleware."""
 
     logger: logging.Logger
 
-    def __init__(self, app: ASGIApp, logger: logging.Logger) -> None:
+    def __init__(
+        self, app: ASGIApp, logger: logging.Logger, *, sample_rate: float = 1.0
+    ) -> None:
         """Initialize the middleware.
 
         Args:
             app: The ASGI app.
             logger: The logger.
+            sample_rate: The fraction of requests to log.
         """
-        super().__init__(app)
+        self.app = app
         self.logger = logger
+        self.sample_rate = sample_rate
 
-    async def dispatch(
-        self, request: Request, call_next: RequestResponseEndpoint
-    ) -> Response:
-        """Dispatch the request.
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Log the request and call the next application.
 
         Args:
-            request: The request.
-            call_next: The next middleware or handler.
-
-        Returns:
-            The response.
+            scope: The scope.
+            receive: The receive function.
+            send: The send function.
         """
-        self.logger.info("received request", extra={"request": request})
-        return await call_next(request)
+        if scope["type"] == "http" and (
+            self.sample_rate >= 1 or random.random() < self.sample_rate  # noqa: S311
+        ):
+            self.logger.info("received request", extra={"request": Request(scope)})
 
+        await self.app(scope, receive, send)
 
-class AuthenticationMiddleware(BaseHTTPMiddleware):
-    """Authentication middleware."""
 
-    def __init__(self, app: ASGIApp) -> None:
+def _unauthorized(detail: str, scope: Scope | None = None) -> ASGIApp:
+    """Build the response returned when the authentication fails.
+
+    Args:
+        detail: The reason of the failure.
+        scope: The scope, WebSocket connections are closed instead.
+
+    Returns:
+        The response as a JSON object, or the closing of the WebSocket connection.
+    """
+    if scope is not None and scope["type"] == "websocket":
+        return WebSocketClose(code=status.WS_1008_POLICY_VIOLATION, reason=detail)
+
+    return JSONResponse(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        content={"detail": detail},
+        headers={"Vary": "Authorization"},
+    )
+
+
+def _authorization(scope: Scope) -> str | None:
+    """Get the authorization of a request or a WebSocket connection.
+
+    Browsers cannot set the headers of a WebSocket connection, the token can also be
+    sent as the second subprotocol after `bearer`.
+
+    Args:
+        scope: The scope.
+
+    Returns:
+        The value of the `Authorization` header, None if it is missing.
+    """
+    authorization = Headers(scope=scope).get("Authorization")
+
+    subprotocols = scope.get("subprotocols", [])
+    if (
+        authorization is None
+        and len(subprotocols) > 1
+        and subprotocols[0] == BEARER_SUBPROTOCOL
+    ):
+        return f"Bearer {subprotocols[1]}"
+
+    return authorization
+
+
+class AuthenticationMiddleware:
+    """Authentication middleware.
+
+    Users resolved from a token are kept in a cache so that repeated requests with
+    the same token do not query the database. WebSocket connections are
+    authenticated once, when they open.
+    """
+
+    def __init__(self, app: ASGIApp, *, cache: TokenCache = token_cache) -> None:
         """Initialize the middleware.
 
         Args:
             app: The ASGI app.
+            cache: The cache of the authentication tokens.
         """
-        super().__init__(app)
+        self.app = app
+        self.cache = cache
 
-    async def dispatch(
-        self, request: Request, call_next: RequestResponseEndpoint
-    ) -> Response | JSONResponse:
-        """Dispatch the request."""
-        authorization = request.headers.get("Authorization")
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Authenticate the request and inject the context in the request state.
+
+        Args:
+            scope: The scope.
+            receive: The receive function.
+            send: The send function.
+        """
+        if scope["type"] not in {"http", "websocket"}:
+            await self.app(scope, receive, send)
+            return
+
+        authorization = _authorization(scope)
 
         if authorization is None or authorization == "":
             # If token is not provided, use anonymous user
-            request.state.context = Context(user=AnnonymousUser)
+            context = Context(user=AnnonymousUser)
         elif not authorization.startswith("Bearer "):
-            return JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content={
-                    "detail": "Invalid token format, Token should start with 'Bearer '"
-                },
-                headers={"Vary": "Authorization"},
+            response = _unauthorized(
+                "Invalid token format, Token should start with 'Bearer '", scope
             )
+            await response(scope, receive, send)
+            return
         else:
             token = authorization.split(" ")[1]
 
             # Token format validation
             if len(token) != TOKEN_LENGTH:
-                return JSONResponse(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    content={"detail": "Invalid token format"},
-                    headers={"Vary": "Authorization"},
-                )
+                await _unauthorized("Invalid token format", scope)(scope, receive, send)
+                return
+
+            user = await self._authenticate(scope, hash_token(token))
+
+            if user is None:
+                await _unauthorized("Invalid token", scope)(scope, receive, send)
+                return
+
+            context = Context(user=user)
+
+        state = scope.setdefault("state", {})
+        state["context"] = context
+
+        async def send_with_vary(message: Message) -> None:
+            """Add the `Vary` header to the response."""
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).add_vary_header("Authorization")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_vary)
+        finally:
+            # Clean up context
+            state["context"] = None
+
+    async def _authenticate(self, scope: Scope, token_hash: bytes) -> UserModel | None:
+        """Resolve the user of a token from the cache or the database.
+
+        Args:
+            scope: The scope.
+            token_hash: The hash of the token.
+
+        Returns:
+            The user owning the token, None if the token is invalid.
+        """
+        cached = self.cache.get(token_hash)
 
-            # Retrieve user from token
-            async with request.app.async_pool.acquire() as conn:
+        if cached is not None:
+            return cached.user
+
+        # Retrieve user from token
+        with AUTH_LOOKUP_DURATION.time():
+            async with scope["app"].async_pool.acquire() as conn:
                 try:
-                    user = await get_user_for_token(
-                        conn, TokenScope.AUTHENTICATION, token
+                    user, expiry = await get_user_for_token_hash(
+                        conn, TokenScope.AUTHENTICATION, token_hash
                     )
                 except ValueError:
-                    return JSONResponse(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        content={"detail": "Invalid token"},
-                        headers={"Vary": "Authorization"},
-                    )
+                    user = None
+
+        if user is None:
+            self.cache.set_invalid(token_hash)
+            return None
+
+        self.cache.set(token_hash, user, expiry)
+        return user
+
+
+class MetricsMiddleware:
+    """Record the duration of the requests per route and status code."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """Initialize the middleware.
+
+        Args:
+            app: The ASGI app.
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Call the next application and record the duration of the request.
+
+        Args:
+            scope: The scope.
+            receive: The receive function.
+            send: The send function.
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+
+        async def send_with_status(message: Message) -> None:
+            """Keep the status code of the response."""
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Route templates keep the cardinality bounded
+            route = scope.get("route")
+            REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status_code),
+            )
+
+
+class AdmissionMiddleware:
+    """Limit the number of concurrent requests of the agent endpoints.
+
+    The slot is held until the response is fully sent, streamed responses included.
+    Other routes, like the healthcheck and authentication, are never limited. The
+    runs of the WebSocket connections are limited by their session, one slot each.
+    """
 
-            request.state.context = Context(user=user)
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        limiters: dict[str, ConcurrencyLimiter],
+        retry_after: int = 1,
+    ) -> None:
+        """Initialize the middleware.
+
+        Args:
+            app: The ASGI app.
+            limiters: The limiter of each limited path.
+            retry_after: The delay in seconds suggested to the rejected clients.
+        """
+        self.app = app
+        self.limiters = limiters
+        self.retry_after = retry_after
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Admit the request or reject it when the endpoint is overloaded.
+
+        Args:
+            scope: The scope.
+            receive: The receive function.
+            send: The send function.
+        """
+        limiter = self.limiters.get(scope["path"]) if scope["type"] == "http" else None
+
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire()
+        except AdmissionRejectedError as e:
+            response = JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"detail": str(e)},
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+def rate_limit_key(scope: Scope) -> str:
+    """Get the rate limit bucket of a client.
+
+    Args:
+        scope: The scope of the request or of the WebSocket connection.
+
+    Returns:
+        The authenticated user, or the IP address of anonymous clients.
+    """
+    # The context is set by the authentication middleware, the anonymous user has
+    # the ID 0
+    context = scope.get("state", {}).get("context")
+    if context is not None and context.user.id != 0:
+        return f"user:{context.user.id}"
+
+    return f"ip:{scope['client'][0] if scope.get('client') else ''}"
+
+
+class RateLimitMiddleware:
+    """Rate limit the requests per user, or per IP address for anonymous clients.
+
+    The runs of the WebSocket connections are limited by their session, each run
+    takes a token.
+    """
+
+    def __init__(self, app: ASGIApp, *, limiter: RateLimiter) -> None:
+        """Initialize the middleware.
+
+        Args:
+            app: The ASGI app.
+            limiter: The rate limiter.
+        """
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Reject the request if the client exceeded its rate limit.
+
+        Args:
+            scope: The scope.
+            receive: The receive function.
+            send: The send function.
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = self.limiter.check(scope["path"], rate_limit_key(scope))
+
+        if retry_after is not None:
+            response = JSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={"detail": "Rate limit exceeded"},
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+
+def _negotiate_encoding(accept_encoding: str, encodings: Sequence[str]) -> str | None:
+    """Select the content encoding of the response.
+
+    Args:
+        accept_encoding: The `Accept-Encoding` header of the request.
+        encodings: The supported encodings, most preferred first.
+
+    Returns:
+        The encoding with the highest quality accepted by the client, None if the
+        client accepts none of the supported encodings.
+    """
+    qualities: dict[str, float] = {}
+
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+
+    return best
+
+
+class _Compressor(Protocol):
+    """Incremental compressor of a response body."""
+
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+class _GzipCompressor:
+    """Gzip compressor flushing the compressed data of each chunk."""
+
+    def __init__(self, level: int) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _ZstdCompressor:
+    """Zstandard compressor flushing the compressed data of each chunk."""
+
+    def __init__(self, level: int) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _CompressionResponder:
+    """Compress the response of a single request."""
+
+    def __init__(
+        self, middleware: "CompressionMiddleware", encoding: str, send: Send
+    ) -> None:
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start: Message | None = None
+        self.passthrough = False
+        self.compressor: _Compressor | None = None
+
+    async def __call__(self, message: Message) -> None:
+        """Hold the response start until the first body chunk is known."""
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.passthrough = headers.get("Content-Type", "").startswith(
+                "text/event-stream"
+            ) or ("Content-Encoding" in headers)
+            if self.passthrough:
+                await self.send(message)
+            else:
+                self.start = message
+            return
+
+        if self.passthrough or message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        if self.start is not None:
+            await self.send_first_body(message)
+            return
+
+        body = self.compressor.compress(message.get("body", b""))
+        more_body = message.get("more_body", False)
+        if not more_body:
+            body += self.compressor.flush()
+
+        await self.send(
+            {"type": "http.response.body", "body": body, "more_body": more_body}
+        )
+
+    async def send_first_body(self, message: Message) -> None:
+        """Decide whether to compress the response and send its first chunk."""
+        start, self.start = self.start, None
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        headers = MutableHeaders(scope=start)
+        headers.add_vary_header("Accept-Encoding")
+
+        if not more_body and len(body) < self.middleware.minimum_size:
+            self.passthrough = True
+            await self.send(start)
+            await self.send(message)
+            return
+
+        self.compressor = self.middleware.compressor(self.encoding)
+        headers["Content-Encoding"] = self.encoding
+
+        if not more_body:
+            body = await self.middleware.compress_all(self.compressor, body)
+            headers["Content-Length"] = str(len(body))
+            await self.send(start)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+
+        del headers["Content-Length"]
+        await self.send(start)
+        await self.send(
+            {
+                "type": "http.response.body",
+                "body": self.compressor.compress(body),
+                "more_body": True,
+            }
+        )
+
+
+class CompressionMiddleware:
+    """Compress the responses with the encoding negotiated with the client.
+
+    Zstandard is preferred over gzip when the `zstandard` package is installed.
+    Responses smaller than `minimum_size`, already encoded or sent as server sent
+    events are left untouched. Streamed responses are compressed chunk by chunk,
+    each chunk is flushed so that the client receives it right away.
+
+    Bodies larger than `offload_size` are compressed in a thread so that the event
+    loop keeps serving other requests.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        zstd_level: int = 3,
+        offload_size: int = 256 * 1024,
+    ) -> None:
+        """Initialize the middleware.
+
+        Args:
+            app: The ASGI app.
+            minimum_size: The minimum size of the body to compress.
+            gzip_level: The gzip compression level, from 1 to 9.
+            zstd_level: The zstandard compression level, from 1 to 22.
+            offload_size: The minimum size of the body compressed in a thread.
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.levels = {"gzip": gzip_level, "zstd": zstd_level}
+        self.encodings = ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Call the next application and compress its response.
+
+        Args:
+            scope: The scope.
+            receive: The receive function.
+            send: The send function.
+        """
+        encoding = None
+        if scope["type"] == "http":
+            accept_encoding = Headers(scope=scope).get("Accept-Encoding", "")
+            encoding = _negotiate_encoding(accept_encoding, self.encodings)
+
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        await self.app(scope, receive, _CompressionResponder(self, encoding, send))
+
+    def compressor(self, encoding: str) -> _Compressor:
+        """Create a compressor for the encoding.
+
+        Args:
+            encoding: The negotiated encoding.
+
+        Returns:
+            The compressor.
+        """
+        if encoding == "zstd":
+            return _ZstdCompressor(self.levels["zstd"])
+        return _GzipCompressor(self.levels["gzip"])
+
+    async def compress_all(self, compressor: _Compressor, body: bytes) -> bytes:
+        """Compress a whole body, in a thread if it is large.
+
+        Args:
+            compressor: The compressor.
+            body: The body.
+
+        Returns:
+            The compressed body.
+        """
 
-        response = await call_next(request)
-        response.headers["Vary"] = "Authorization"
+        def compress() -> bytes:
+            return compressor.compress(body) + compressor.flush()
 
-        # Clean up context
-        request.state.context = None
+        if len(body) >= self.offload_size:
+            return await asyncio.to_thread(compress)
 
-        return response
+        return compress()
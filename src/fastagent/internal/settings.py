@@ -1,9 +1,7 @@
 """Configuration of the API."""
 
 from functools import lru_cache
-from typing import Annotated
 
-from fastapi import Depends
 from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -39,6 +37,3 @@ class Settings(BaseSettings):
 def get_settings() -> Settings:
     """Get the configuration."""
     return Settings()
-
-
-SettingsDependency = Annotated[Settings, Depends(get_settings)]
@@ -0,0 +1,239 @@
+"""Buffering of the streamed responses.
+
+The events of a stream are pulled from the agent by a background task into a bounded
+queue, and written by the response. Events waiting in the queue are written together,
+optionally after waiting `window` seconds for more events, so that a fast agent does
+not cost one network write per token.
+
+The queue bounds the memory held by a client reading slower than the agent produces.
+Once it is full, the agent either waits for the client (`wait`), or waits at most
+`slow_consumer_timeout` seconds before the stream is closed (`close`): the events
+already queued are sent, followed by an error event. A burst of events filling the
+queue faster than the response is scheduled does not close the stream. When the
+client disconnects, the response is cancelled and the agent with it.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+from collections.abc import AsyncIterator, Callable
+from typing import Any, Literal
+
+logger = logging.getLogger("_fastagent.streaming")
+
+SlowConsumerPolicy = Literal["wait", "close"]
+
+# Mark the end of the events in the queue
+_END = object()
+
+SLOW_CONSUMER_EVENT = (
+    "event: error\r\ndata: "
+    + json.dumps({"status_code": 503, "message": "Client too slow"})
+    + "\r\n\r\n"
+).encode()
+
+
+class SlowConsumerError(Exception):
+    """Raised when a stream is closed because the client did not keep up."""
+
+
+class EventStreamer:
+    """Coalesce the events of the streams and bound the events they buffer."""
+
+    def __init__(  # noqa: PLR0913
+        self: "EventStreamer",
+        window: float = 0.0,
+        max_bytes: int = 16 * 1024,
+        buffer_size: int = 256,
+        slow_consumer: SlowConsumerPolicy = "wait",
+        heartbeat_interval: float = 15.0,
+        *,
+        slow_consumer_timeout: float = 1.0,
+    ) -> None:
+        """Initialize the streamer.
+
+        Args:
+            window: The time in seconds to wait for more events before a write.
+            max_bytes: The size of a write beyond which no more events are added.
+            buffer_size: The maximum number of events waiting to be written.
+            slow_consumer: What to do when the buffer of a stream is full.
+            heartbeat_interval: The time in seconds between two heartbeats.
+            slow_consumer_timeout: The time in seconds the agent waits for room in a
+                full buffer before a stream is closed, with the `close` policy.
+        """
+        self.events = 0
+        self.writes = 0
+        self.slow_consumers = 0
+        self.configure(
+            window=window,
+            max_bytes=max_bytes,
+            buffer_size=buffer_size,
+            slow_consumer=slow_consumer,
+            heartbeat_interval=heartbeat_interval,
+            slow_consumer_timeout=slow_consumer_timeout,
+        )
+
+    def configure(  # noqa: PLR0913
+        self: "EventStreamer",
+        window: float,
+        max_bytes: int,
+        buffer_size: int,
+        slow_consumer: SlowConsumerPolicy,
+        heartbeat_interval: float,
+        *,
+        slow_consumer_timeout: float = 1.0,
+    ) -> None:
+        """Update the streamer configuration.
+
+        Args:
+            window: The time in seconds to wait for more events before a write.
+            max_bytes: The size of a write beyond which no more events are added.
+            buffer_size: The maximum number of events waiting to be written.
+            slow_consumer: What to do when the buffer of a stream is full.
+            heartbeat_interval: The time in seconds between two heartbeats.
+            slow_consumer_timeout: The time in seconds the agent waits for room in a
+                full buffer before a stream is closed, with the `close` policy.
+        """
+        self.window = window
+        self.max_bytes = max_bytes
+        self.buffer_size = buffer_size
+        self.slow_consumer = slow_consumer
+        self.heartbeat_interval = heartbeat_interval
+        self.slow_consumer_timeout = slow_consumer_timeout
+
+    async def stream(
+        self: "EventStreamer",
+        events: AsyncIterator[Any],
+        encode: Callable[[Any], bytes] | None = None,
+    ) -> AsyncIterator[bytes]:
+        """Stream the encoded events, several events per write when they are waiting.
+
+        Args:
+            events: The events of the agent.
+            encode: The function encoding an event, None for events already encoded.
+
+        Yields:
+            The bytes to write.
+        """
+        try:
+            async for chunks in self.batches(events, encode):
+                yield b"".join(chunks)
+        except SlowConsumerError:
+            yield SLOW_CONSUMER_EVENT
+
+    async def batches(
+        self: "EventStreamer",
+        events: AsyncIterator[Any],
+        encode: Callable[[Any], Any] | None = None,
+    ) -> AsyncIterator[list[Any]]:
+        """Stream the encoded events, grouped by write.
+
+        Args:
+            events: The events of the agent.
+            encode: The function encoding an event, None for events already encoded.
+
+        Yields:
+            The events of each write.
+
+        Raises:
+            SlowConsumerError: The buffer stayed full with the `close` policy, once the
+                queued events are sent.
+        """
+        queue: asyncio.Queue = asyncio.Queue(self.buffer_size)
+        producer = asyncio.create_task(self._produce(events, encode, queue))
+
+        try:
+            while True:
+                chunks = await self._collect(queue)
+                if chunks:
+                    self.writes += 1
+                    yield chunks
+                if producer.done() and queue.empty():
+                    break
+        finally:
+            # The client is gone or the stream is over, the agent stops
+            producer.cancel()
+
+        # Errors of the agent are raised to the response
+        if not producer.cancelled() and producer.exception() is not None:
+            raise producer.exception()
+        if not producer.cancelled() and producer.result():
+            raise SlowConsumerError
+
+    async def _collect(self: "EventStreamer", queue: asyncio.Queue) -> list[Any]:
+        """Wait for an event, then take the events ready within the window."""
+        chunks = []
+        item = await queue.get()
+        if item is _END:
+            return chunks
+
+        chunks.append(item)
+        size = len(item)
+        deadline = asyncio.get_running_loop().time() + self.window
+
+        while size < self.max_bytes:
+            if queue.empty():
+                if self.window <= 0:
+                    break
+                try:
+                    async with asyncio.timeout_at(deadline):
+                        item = await queue.get()
+                except TimeoutError:
+                    break
+            else:
+                item = queue.get_nowait()
+
+            if item is _END:
+                # The end is seen by the next call
+                queue.put_nowait(item)
+                break
+
+            chunks.append(item)
+            size += len(item)
+
+        return chunks
+
+    async def _produce(
+        self: "EventStreamer",
+        events: AsyncIterator[Any],
+        encode: Callable[[Any], Any] | None,
+        queue: asyncio.Queue,
+    ) -> bool:
+        """Pull the events of the agent into the queue.
+
+        Returns:
+            True if the agent was stopped because the client did not keep up.
+        """
+        try:
+            async for event in events:
+                self.events += 1
+                chunk = event if encode is None else encode(event)
+                if self.slow_consumer == "wait":
+                    await queue.put(chunk)
+                    continue
+
+                # Only a client not reading for a while is slow, a burst of events
+                # fills the queue before the response runs
+                try:
+                    async with asyncio.timeout(self.slow_consumer_timeout):
+                        await queue.put(chunk)
+                except TimeoutError:
+                    logger.warning("Closing stream of a slow client")
+                    self.slow_consumers += 1
+                    return True
+        finally:
+            # Closing the generators of the agent cancels its execution, langserve
+            # yields a last error event when closed, which raises a RuntimeError
+            aclose = getattr(events, "aclose", None)
+            if aclose is not None:
+                with contextlib.suppress(RuntimeError):
+                    await aclose()
+            # A full queue is drained by the response, which then sees the task done
+            with contextlib.suppress(asyncio.QueueFull):
+                queue.put_nowait(_END)
+
+        return False
+
+
+event_streamer = EventStreamer()
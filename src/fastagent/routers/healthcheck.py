@@ -1,9 +1,8 @@
 """Healthcheck router."""
 
-from fastapi import APIRouter, status
+from fastapi import APIRouter, Request, status
 
 from fastagent.internal.data.healthcheck import Healthcheck
-from fastagent.internal.settings import SettingsDependency
 
 router = APIRouter(prefix="/v1", tags=["healthcheck"])
 
@@ -13,14 +12,15 @@ router = APIRouter(prefix="/v1", tags=["healthcheck"])
     status_code=status.HTTP_200_OK,
     response_model=Healthcheck,
 )
-async def healthcheck_handler(
-    settings: SettingsDependency,
-) -> Healthcheck:
-    """Healthcheck endpoint."""
+async def healthcheck_handler(request: Request) -> Healthcheck:
+    """Healthcheck endpoint.
+
+    The environment is set on the application by the server.
+    """
     return {
         "status": "available",
         "system_info": {
-            "environment": settings.environment,
+            "environment": request.app.state.environment,
             "version": "0.0.1",
         },
     }
@@ -0,0 +1,22 @@
+"""Metrics router."""
+
+from fastapi import APIRouter, status
+from fastapi.responses import PlainTextResponse
+
+from fastagent.internal.metrics import registry
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get(
+    "/metrics",
+    status_code=status.HTTP_200_OK,
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+)
+async def metrics_handler() -> PlainTextResponse:
+    """Metrics endpoint in the Prometheus text format, summed over the workers."""
+    return PlainTextResponse(
+        registry.render(await registry.collect()),
+        media_type="text/plain; version=0.0.4",
+    )
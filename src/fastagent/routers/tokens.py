@@ -1,12 +1,23 @@
 """Users router."""
 
-from datetime import timedelta
+from datetime import UTC, datetime, timedelta
 
 from fastapi import APIRouter, HTTPException, Request, status
 
-from fastagent.internal.data.tokens import AuthenticationTokenCreate, Scope, new_token
-from fastagent.internal.data.users import get_user_by_email
-from fastagent.internal.security import verify_password
+from fastagent.internal.data.tokens import (
+    AuthenticationTokenCreate,
+    Scope,
+    generate_token,
+    insert_token_hash,
+)
+from fastagent.internal.data.users import get_credentials_by_email
+from fastagent.internal.security import (
+    PasswordExecutorBusyError,
+    dummy_password_hash,
+    verify_password_async,
+)
+
+AUTHENTICATION_TOKEN_TTL = timedelta(days=1)
 
 router = APIRouter(prefix="/v1", tags=["tokens"])
 
@@ -19,22 +30,42 @@ async def create_authentication_token_handler(
     payload: AuthenticationTokenCreate,
     request: Request,
 ) -> dict[str, str]:
-    """Create an authentication token."""
+    """Create an authentication token.
+
+    A connection is held for the credentials lookup and for the token insertion,
+    never while the password is verified.
+    """
     async with request.app.async_pool.acquire() as conn:
-        user = await get_user_by_email(conn, payload.email)
+        credentials = await get_credentials_by_email(conn, payload.email)
+
+    # An unknown email is verified against a dummy hash, so that the response time
+    # does not reveal the registered emails
+    user_id, password_hash = (
+        credentials if credentials is not None else (None, dummy_password_hash())
+    )
 
-    if not verify_password(
-        payload.password.get_secret_value(), user.password_hash.get_secret_value()
-    ):
+    try:
+        valid = await verify_password_async(
+            payload.password.get_secret_value(), password_hash
+        )
+    except PasswordExecutorBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        ) from e
+
+    if not valid or user_id is None:
         msg = "Invalid credentials"
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=msg)
 
+    plain_text, token_hash = generate_token()
+    expiry = datetime.now(UTC) + AUTHENTICATION_TOKEN_TTL
+
     async with request.app.async_pool.acquire() as conn:
-        token = await new_token(
-            conn, user_id=user.id, scope=Scope.AUTHENTICATION, ttl=timedelta(days=1)
-        )
+        await insert_token_hash(conn, token_hash, user_id, expiry, Scope.AUTHENTICATION)
 
     return {
-        "expiry": token.expiry.isoformat(),
-        "token": token.plain_text.get_secret_value(),
+        "expiry": expiry.isoformat(),
+        "token": plain_text,
     }
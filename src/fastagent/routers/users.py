@@ -4,6 +4,7 @@ from asyncpg.exceptions import UniqueViolationError
 from fastapi import APIRouter, HTTPException, Request, status
 
 from fastagent.internal.data.users import UserCreate, insert_user
+from fastagent.internal.security import PasswordExecutorBusyError, hash_password_async
 
 router = APIRouter(prefix="/v1", tags=["users"])
 
@@ -17,9 +18,18 @@ async def register_user_handler(
     request: Request,
 ) -> dict[str, str]:
     """Register a user."""
+    try:
+        password_hash = await hash_password_async(payload.password.get_secret_value())
+    except PasswordExecutorBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        ) from e
+
     async with request.app.async_pool.acquire() as conn:
         try:
-            await insert_user(conn, payload)
+            await insert_user(conn, payload, password_hash)
         except UniqueViolationError as e:
             msg = "User already exists"
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=msg) from e
@@ -1,26 +1,64 @@
 """The FastAgent server."""
 
+import asyncio
+import contextlib
+import gc
 import logging
-from typing import Literal
-
-from fastapi import FastAPI
+import multiprocessing
+import random
+import sys
+import tempfile
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Literal
+
+from asyncpg import Pool, PostgresError
+from fastapi import APIRouter, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from granian.server import Granian
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from fastagent.configuration import Config
 from fastagent.dependencies import require_auth_dependency
-from fastagent.integrations import create_langchain_router
 from fastagent.internal import ModuleLoader
-from fastagent.internal.data.database import init_database
-from fastagent.internal.log import setup_logger
+from fastagent.internal.admission import ConcurrencyLimiter
+from fastagent.internal.coalescing import coalescer
+from fastagent.internal.data.cache import token_cache
+from fastagent.internal.data.conversations import conversation_recorder
+from fastagent.internal.data.database import get_pool_size, init_database
+from fastagent.internal.data.responses import (
+    ResponseCache,
+    reap_expired_responses,
+    response_cache,
+)
+from fastagent.internal.data.tokens import reap_expired_tokens
+from fastagent.internal.executor import program_executor
+from fastagent.internal.log import dropped_records, setup_logger, shutdown_logger
+from fastagent.internal.metrics import InstrumentedPool, registry
+from fastagent.internal.ratelimit import MemoryStore, RateLimiter, SharedMemoryStore
+from fastagent.internal.security import dummy_password_hash, password_executor
 from fastagent.internal.server import (
+    AdmissionMiddleware,
     AuthenticationMiddleware,
+    CompressionMiddleware,
+    MetricsMiddleware,
+    RateLimitMiddleware,
     RequestLoggingMiddleware,
     http_exception_handler,
 )
 from fastagent.internal.settings import Settings
-from fastagent.routers import healthcheck, tokens, users
+from fastagent.internal.streaming import event_streamer
+from fastagent.routers import healthcheck, metrics, tokens, users
+
+if TYPE_CHECKING:
+    from fastagent.integrations.langgraph import PostgresCheckpointSaver
+
+# Path prefix of the route groups with a rate limit
+RATE_LIMIT_GROUPS = {
+    "agents": "/v1/agents/",
+    "tokens": "/v1/tokens/",
+    "users": "/v1/users",
+}
 
 
 class FastAgentServer:
@@ -28,6 +66,11 @@ class FastAgentServer:
 
     _api: FastAPI = FastAPI()
     _server: Granian
+    _metrics_task: asyncio.Task
+    _reaper_tasks: list[asyncio.Task]
+    _checkpointer: "PostgresCheckpointSaver | None" = None
+    _limiters: dict[str, ConcurrencyLimiter]
+    _rate_limiter: RateLimiter | None
     _logger: logging.Logger = setup_logger(level=logging.INFO)
     configuration: Config
     environment: Literal["dev", "prod"]
@@ -45,10 +88,21 @@ class FastAgentServer:
         """
         self.configuration = configuration
         self.environment = environment
+        self._api.state.environment = (
+            "development" if environment == "dev" else "production"
+        )
 
-        # Setups
+        self._logger = setup_logger(
+            level=logging.getLevelName(self.configuration.server.log_level.upper()),
+            log_format=self.configuration.server.log_format,
+            queue_size=self.configuration.server.log_queue_size,
+        )
+
+        # Setups, the limits are shared with the WebSocket sessions of the agent
+        self.setup_limits()
         self.setup_api()
         self.setup_middlewares()
+        self.setup_metrics()
 
         # setup exception handlers
         self._api.add_exception_handler(StarletteHTTPException, http_exception_handler)
@@ -68,6 +122,10 @@ class FastAgentServer:
             reload=self.environment == "dev",
             interface="asgi",
             loop="uvloop",
+            workers=self.configuration.server.get_workers(),
+            threads=self.configuration.server.threads,
+            blocking_threads=self.configuration.server.blocking_threads,
+            threading_mode=self.configuration.server.threading_mode,
             log_enabled=False,
             log_level=self.configuration.server.log_level,
         )
@@ -80,34 +138,213 @@ class FastAgentServer:
         """
         # Default routers
         self._api.include_router(healthcheck.router)
+        if self.configuration.server.metrics:
+            self._api.include_router(metrics.router)
+
         target_module = ModuleLoader.load_from_string(self.configuration.project.app)
+        self.preload()
+
+        config_modifier = None
+        if self.configuration.project.config_modifier:
+            config_modifier = ModuleLoader.load_from_string(
+                self.configuration.project.config_modifier
+            )
+
+        if (
+            self.configuration.cache.postgresql
+            and self.configuration.storage.database != "postgresql"
+        ):
+            message = "The postgresql response cache requires a postgresql storage."
+            raise ValueError(message)
+
+        cache = None
+        if self.configuration.cache.enabled:
+            cache = response_cache
+            cache.configure(
+                max_entries=self.configuration.cache.max_entries,
+                max_bytes=self.configuration.cache.max_bytes,
+                max_entry_bytes=self.configuration.cache.max_entry_bytes,
+                ttl=self.configuration.cache.ttl,
+                postgresql=self.configuration.cache.postgresql,
+            )
 
         # Business logic routers
+        router = self.create_agent_router(target_module, config_modifier, cache)
+        if self.configuration.security.authentication:
+            self._api.include_router(router, dependencies=[require_auth_dependency])
+        else:
+            self._api.include_router(router)
+
+        if self.configuration.security.authentication:
+            password_executor.configure(
+                kind=self.configuration.security.password_executor,
+                max_workers=self.configuration.security.password_workers,
+                max_pending=self.configuration.security.password_max_pending,
+            )
+            self._api.include_router(users.router)
+            self._api.include_router(tokens.router)
+
+    def preload(self: "FastAgentServer") -> None:
+        """Load the preloaded objects of the project in the main process.
+
+        Functions are called, modules are imported. The objects are inherited by the
+        forked workers.
+        """
+        for import_string in self.configuration.project.preload:
+            target = ModuleLoader.load_from_string(import_string)
+            if callable(target):
+                self._logger.info("Preloading %s", import_string)
+                target()
+
+    def create_agent_router(
+        self: "FastAgentServer",
+        target_module: Any,  # noqa: ANN401
+        config_modifier: Callable | None,
+        cache: ResponseCache | None,
+    ) -> APIRouter:
+        """Create the router serving the agent with the configured framework.
+
+        Args:
+            target_module: The runnable or graph to serve.
+            config_modifier: Optional function updating the config from the request.
+            cache: Optional cache of the invoke responses.
+
+        Returns:
+            The router of the agent.
+        """
+        storage = self.configuration.storage
+
+        if storage.conversations and storage.database != "postgresql":
+            message = "The conversation history requires a postgresql storage."
+            raise ValueError(message)
+
+        streaming = self.configuration.streaming
+        event_streamer.configure(
+            window=streaming.coalesce_window,
+            max_bytes=streaming.coalesce_bytes,
+            buffer_size=streaming.buffer_size,
+            slow_consumer=streaming.slow_consumer,
+            heartbeat_interval=streaming.heartbeat_interval,
+            slow_consumer_timeout=streaming.slow_consumer_timeout,
+        )
+
+        recorder = None
+        if storage.conversations:
+            recorder = conversation_recorder
+            recorder.configure(
+                max_buffer=storage.conversation_buffer_size,
+                flush_size=storage.conversation_flush_size,
+                flush_interval=storage.conversation_flush_interval,
+                max_message_bytes=storage.conversation_max_message_bytes,
+            )
+
         match self.configuration.project.framework:
             case "langchain":
-                if self.configuration.security.authentication:
-                    self._api.include_router(
-                        create_langchain_router(target_module),
-                        dependencies=[require_auth_dependency],
-                    )
-                else:
-                    self._api.include_router(create_langchain_router(target_module))
+                # Imported here, like the other frameworks, langserve is only
+                # loaded to serve runnables
+                from fastagent.integrations.langchain import (  # noqa: PLC0415
+                    create_langchain_router,
+                )
+
+                return create_langchain_router(
+                    target_module,
+                    per_req_config_modifier=config_modifier,
+                    cache=cache,
+                    coalescer=coalescer if self.configuration.cache.coalesce else None,
+                    per_user=self.configuration.cache.per_user,
+                    batch_concurrency=self.configuration.admission.batch_concurrency,
+                    recorder=recorder,
+                    streamer=event_streamer,
+                    websocket_idle_timeout=streaming.websocket_idle_timeout,
+                    websocket_max_runs=streaming.websocket_max_runs,
+                    websocket_limiter=self._limiters.get("/v1/agents/stream"),
+                    rate_limiter=self._rate_limiter,
+                )
+            case "langgraph":
+                # Imported here, langgraph is only required to serve graphs
+                from fastagent.integrations.langgraph import (  # noqa: PLC0415
+                    checkpoint_saver,
+                    create_langgraph_router,
+                )
+
+                if storage.checkpoints and storage.database != "postgresql":
+                    message = "The langgraph checkpoints require a postgresql storage."
+                    raise ValueError(message)
+
+                if storage.checkpoints:
+                    self._checkpointer = checkpoint_saver
+                    self._checkpointer.max_pending = storage.checkpoint_batch_size
+
+                return create_langgraph_router(
+                    target_module,
+                    per_req_config_modifier=config_modifier,
+                    checkpointer=self._checkpointer,
+                    recorder=recorder,
+                    streamer=event_streamer,
+                )
+            case "dspy":
+                # Imported here, dspy is only required to serve programs
+                from fastagent.integrations.dspy import (  # noqa: PLC0415
+                    create_dspy_router,
+                )
+
+                program_executor.configure(
+                    max_workers=self.configuration.project.dspy_workers,
+                    max_pending=self.configuration.project.dspy_max_pending,
+                )
+                return create_dspy_router(
+                    target_module, executor=program_executor, recorder=recorder
+                )
             case _:
                 message = (
-                    f"Unsupported framework: {self.configuration.project.framework}"
-                    f"fastagent only supports langchain at the moment. Expecting more soon."  # noqa: E501
+                    f"Unsupported framework: {self.configuration.project.framework}. "
+                    "fastagent supports langchain, langgraph and dspy."
                 )
                 raise ValueError(message)
 
-        if self.configuration.security.authentication:
-            self._api.include_router(users.router)
-            self._api.include_router(tokens.router)
+    def setup_limits(self: "FastAgentServer") -> None:
+        """Setup the admission control and the rate limits of the routes."""
+        self._limiters = {}
+        for endpoint in ("invoke", "batch", "batch_stream", "stream"):
+            limit = getattr(self.configuration.admission, endpoint)
+            if limit.max_concurrency > 0:
+                path = f"/v1/agents/{endpoint.replace('_', '/')}"
+                self._limiters[path] = ConcurrencyLimiter(
+                    limit.max_concurrency, limit.max_queue, limit.queue_timeout
+                )
+
+        self._rate_limiter = None
+        if self.configuration.security.rate_limits:
+            # The shared store is created here, before the workers are forked
+            store = (
+                SharedMemoryStore()
+                if self.configuration.security.rate_limit_store == "shared"
+                else MemoryStore()
+            )
+            self._rate_limiter = RateLimiter(
+                store,
+                {
+                    RATE_LIMIT_GROUPS[group]: (limit.rate, limit.burst)
+                    for group, limit in self.configuration.security.rate_limits.items()
+                },
+            )
 
     def setup_middlewares(self: "FastAgentServer") -> None:
         """Setup middlewares for the API.
 
         Setup the middleware according to the configuration.
         """
+        # Innermost middlewares, requests are limited once authenticated
+        if self._limiters:
+            self._api.add_middleware(
+                AdmissionMiddleware,
+                limiters=self._limiters,
+                retry_after=self.configuration.admission.retry_after,
+            )
+
+        if self._rate_limiter is not None:
+            self._api.add_middleware(RateLimitMiddleware, limiter=self._rate_limiter)
+
         # Filter out None values from allowed_origins
         # Avoid attack from a sandboxed iframe
         allowed_origins = [
@@ -130,11 +367,185 @@ class FastAgentServer:
         )
 
         # Default middlewares
-        self._api.add_middleware(RequestLoggingMiddleware, logger=self._logger)
+        self._api.add_middleware(
+            RequestLoggingMiddleware,
+            logger=self._logger,
+            sample_rate=self.configuration.server.log_sample_rate,
+        )
 
         # Add an authentication middleware if authentication is enabled
         if self.configuration.security.authentication:
-            self._api.add_middleware(AuthenticationMiddleware)
+            token_cache.configure(
+                max_size=self.configuration.security.token_cache_size,
+                ttl=self.configuration.security.token_cache_ttl,
+                negative_ttl=self.configuration.security.token_cache_negative_ttl,
+            )
+            self._api.add_middleware(AuthenticationMiddleware, cache=token_cache)
+
+        if self.configuration.server.compression:
+            self._api.add_middleware(
+                CompressionMiddleware,
+                minimum_size=self.configuration.server.compression_min_size,
+                gzip_level=self.configuration.server.gzip_level,
+                zstd_level=self.configuration.server.zstd_level,
+                offload_size=self.configuration.server.compression_offload_size,
+            )
+
+        # Outermost middleware, the recorded duration includes the other middlewares
+        if self.configuration.server.metrics:
+            self._api.add_middleware(MetricsMiddleware)
+
+    def setup_metrics(self: "FastAgentServer") -> None:
+        """Setup the metrics collected on each worker.
+
+        With several workers, the metrics are aggregated through a directory shared
+        by the workers, it is emptied before the workers start.
+        """
+        if not self.configuration.server.metrics:
+            return
+
+        registry.callback(
+            "fastagent_log_dropped_total",
+            "Log records dropped because the log queue was full.",
+            dropped_records,
+            kind="counter",
+        )
+
+        if self.configuration.security.authentication:
+            registry.callback(
+                "fastagent_token_cache_hits_total",
+                "Authentication token cache hits.",
+                lambda: token_cache.hits,
+                kind="counter",
+            )
+            registry.callback(
+                "fastagent_token_cache_misses_total",
+                "Authentication token cache misses.",
+                lambda: token_cache.misses,
+                kind="counter",
+            )
+
+        if self.configuration.cache.enabled:
+            registry.callback(
+                "fastagent_response_cache_hits_total",
+                "Response cache hits.",
+                lambda: response_cache.hits,
+                kind="counter",
+            )
+            registry.callback(
+                "fastagent_response_cache_misses_total",
+                "Response cache misses.",
+                lambda: response_cache.misses,
+                kind="counter",
+            )
+            registry.callback(
+                "fastagent_response_cache_bytes",
+                "Size of the responses cached in memory.",
+                lambda: response_cache.stats()["bytes"],
+            )
+
+        if self._rate_limiter is not None:
+            registry.callback(
+                "fastagent_rate_limited_total",
+                "Requests rejected by the rate limiter.",
+                lambda: self._rate_limiter.rejected,
+                kind="counter",
+            )
+
+        if self._limiters:
+            registry.callback(
+                "fastagent_admission_active",
+                "Requests running on the limited endpoints.",
+                lambda: {(p,): limiter.active for p, limiter in self._limiters.items()},
+                labelnames=("route",),
+            )
+            registry.callback(
+                "fastagent_admission_queue_depth",
+                "Requests waiting for a slot on the limited endpoints.",
+                lambda: {
+                    (p,): limiter.waiting for p, limiter in self._limiters.items()
+                },
+                labelnames=("route",),
+            )
+            registry.callback(
+                "fastagent_admission_rejected_total",
+                "Requests rejected by the admission control.",
+                lambda: {
+                    (p,): limiter.rejected for p, limiter in self._limiters.items()
+                },
+                kind="counter",
+                labelnames=("route",),
+            )
+
+        if self.configuration.cache.coalesce:
+            registry.callback(
+                "fastagent_invoke_executions_total",
+                "Executions of the runnable started by the invoke endpoint.",
+                lambda: coalescer.executions,
+                kind="counter",
+            )
+            registry.callback(
+                "fastagent_invoke_coalesced_total",
+                "Invoke requests served by an execution already in progress.",
+                lambda: coalescer.coalesced,
+                kind="counter",
+            )
+
+        if self.configuration.project.framework == "dspy":
+            registry.callback(
+                "fastagent_program_threads_busy",
+                "Threads of the program executor running a call.",
+                lambda: program_executor.busy,
+            )
+            registry.callback(
+                "fastagent_program_threads_max",
+                "Threads of the program executor.",
+                lambda: program_executor.max_workers,
+            )
+            registry.callback(
+                "fastagent_program_queue_depth",
+                "Calls waiting for a thread of the program executor.",
+                lambda: program_executor.waiting,
+            )
+            registry.callback(
+                "fastagent_program_rejected_total",
+                "Calls rejected because the program executor was saturated.",
+                lambda: program_executor.rejected,
+                kind="counter",
+            )
+
+        registry.callback(
+            "fastagent_stream_events_total",
+            "Events sent by the stream endpoints.",
+            lambda: event_streamer.events,
+            kind="counter",
+        )
+        registry.callback(
+            "fastagent_stream_writes_total",
+            "Writes of the stream endpoints, each write holds one or more events.",
+            lambda: event_streamer.writes,
+            kind="counter",
+        )
+        registry.callback(
+            "fastagent_stream_slow_consumers_total",
+            "Streams closed because the client did not keep up.",
+            lambda: event_streamer.slow_consumers,
+            kind="counter",
+        )
+
+        self._register_websocket_metrics()
+        self._register_conversation_metrics()
+
+        if self.configuration.server.get_workers() > 1:
+            directory = Path(
+                self.configuration.server.metrics_dir
+                or tempfile.mkdtemp(prefix="fastagent-metrics-")
+            )
+            directory.mkdir(parents=True, exist_ok=True)
+            for path in directory.glob("*.json"):
+                path.unlink()
+
+            registry.directory = directory
 
     def startup_lifespan(self: "FastAgentServer") -> None:
         """Startup the lifespan of the application."""
@@ -146,14 +557,71 @@ class FastAgentServer:
             port=self.configuration.storage.port,
         )
 
+        # Each worker process runs its own lifespan and owns its own pool
+        pool_size = get_pool_size(
+            max_connections=self.configuration.storage.max_connections,
+            workers=self.configuration.server.get_workers(),
+        )
+
         async def startup() -> None:
             """Startup the application."""
             self._logger.info("Starting application")
 
             if self.configuration.storage.database == "postgresql":
-                self._api.async_pool = await init_database(dsn)
+                storage = self.configuration.storage
+                self._api.async_pool = await init_database(
+                    dsn,
+                    max_size=pool_size,
+                    min_size=storage.pool_min_size,
+                    max_inactive_connection_lifetime=(
+                        storage.max_inactive_connection_lifetime
+                    ),
+                    statement_cache_size=storage.statement_cache_size,
+                    command_timeout=storage.command_timeout,
+                    max_queries=storage.max_queries,
+                    session_parameters=storage.session_parameters,
+                )
                 self._logger.info("Connection to database established")
 
+                if self.configuration.server.metrics:
+                    self._register_pool_metrics(self._api.async_pool)
+                    self._api.async_pool = InstrumentedPool(self._api.async_pool)
+
+                if self._checkpointer is not None:
+                    self._checkpointer.pool = self._api.async_pool
+
+                if storage.conversations:
+                    conversation_recorder.start(self._api.async_pool)
+
+            if self.configuration.security.authentication:
+                password_executor.start()
+                # Hashed before the first login with an unknown email
+                await asyncio.to_thread(dummy_password_hash)
+
+            self._reaper_tasks = []
+            security = self.configuration.security
+            if security.authentication and security.token_reaper_interval > 0:
+                self._start_reaper(
+                    "tokens",
+                    lambda pool: reap_expired_tokens(
+                        pool, security.token_reaper_batch_size
+                    ),
+                    security.token_reaper_interval,
+                )
+            if self.configuration.cache.enabled and self.configuration.cache.postgresql:
+                self._start_reaper(
+                    "cached responses",
+                    reap_expired_responses,
+                    self.configuration.cache.ttl,
+                )
+
+            if registry.directory is not None:
+                self._metrics_task = asyncio.create_task(
+                    registry.run_snapshot_writer(
+                        self.configuration.server.metrics_interval
+                    )
+                )
+
         return startup
 
     def shutdown_lifespan(self: "FastAgentServer") -> None:
@@ -161,14 +629,148 @@ class FastAgentServer:
 
         async def shutdown() -> None:
             """Shutdown the application."""
+            password_executor.shutdown()
+            program_executor.shutdown()
+
+            for task in self._reaper_tasks:
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+
+            if registry.directory is not None:
+                self._metrics_task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await self._metrics_task
+                await asyncio.to_thread(registry.retire, registry.snapshot())
+
             if self.configuration.storage.database == "postgresql":
+                # The buffered messages are written before the pool is closed
+                if self.configuration.storage.conversations:
+                    await conversation_recorder.stop()
                 await self._api.async_pool.close()
                 self._logger.info("Connection to database closed")
 
             self._logger.info("Shutting down server")
+            shutdown_logger()
 
         return shutdown
 
+    def _start_reaper(
+        self: "FastAgentServer",
+        name: str,
+        reap: Callable[[Pool], Awaitable[int]],
+        interval: float,
+    ) -> None:
+        """Start a task periodically deleting expired rows until cancelled.
+
+        Every worker runs the reapers, the first run is delayed by a random fraction
+        of the interval to spread them over time.
+
+        Args:
+            name: The name of the deleted rows, used in the logs.
+            reap: The function deleting the expired rows and returning their number.
+            interval: The time in seconds between two runs.
+        """
+
+        async def run() -> None:
+            await asyncio.sleep(random.uniform(0, interval))  # noqa: S311
+
+            while True:
+                try:
+                    deleted = await reap(self._api.async_pool)
+                except (OSError, PostgresError):
+                    self._logger.exception("Failed to delete the expired %s", name)
+                else:
+                    self._logger.info("Deleted %d expired %s", deleted, name)
+
+                await asyncio.sleep(interval)
+
+        self._reaper_tasks.append(asyncio.create_task(run()))
+
+    def _register_websocket_metrics(self: "FastAgentServer") -> None:
+        """Register the metrics of the WebSocket sessions, served with langchain."""
+        if self.configuration.project.framework != "langchain":
+            return
+
+        from fastagent.integrations.langchain import AgentSession  # noqa: PLC0415
+
+        registry.callback(
+            "fastagent_websocket_connections",
+            "Open WebSocket connections.",
+            lambda: AgentSession.connections,
+        )
+        registry.callback(
+            "fastagent_websocket_runs",
+            "Runs in progress on the WebSocket connections.",
+            lambda: AgentSession.runs,
+        )
+
+    def _register_conversation_metrics(self: "FastAgentServer") -> None:
+        """Register the metrics of the conversation recorder, when enabled."""
+        if not self.configuration.storage.conversations:
+            return
+
+        registry.callback(
+            "fastagent_conversation_messages_total",
+            "Conversation messages recorded.",
+            lambda: conversation_recorder.recorded,
+            kind="counter",
+        )
+        registry.callback(
+            "fastagent_conversation_messages_dropped_total",
+            "Conversation messages dropped, the buffer was full or a write failed.",
+            lambda: conversation_recorder.dropped,
+            kind="counter",
+        )
+        registry.callback(
+            "fastagent_conversation_write_errors_total",
+            "Failed writes of conversation messages.",
+            lambda: conversation_recorder.errors,
+            kind="counter",
+        )
+        registry.callback(
+            "fastagent_conversation_messages_pending",
+            "Conversation messages waiting to be written.",
+            lambda: conversation_recorder.pending,
+        )
+
+    @staticmethod
+    def _register_pool_metrics(pool: Pool) -> None:
+        """Register the gauges of the database pool.
+
+        Args:
+            pool: The database pool of the worker.
+        """
+        registry.callback(
+            "fastagent_db_pool_size",
+            "Number of connections opened by the pools.",
+            pool.get_size,
+        )
+        registry.callback(
+            "fastagent_db_pool_idle",
+            "Number of idle connections in the pools.",
+            pool.get_idle_size,
+        )
+        registry.callback(
+            "fastagent_db_pool_max_size",
+            "Maximum number of connections of the pools.",
+            pool.get_max_size,
+        )
+
     def serve(self: "FastAgentServer") -> None:
-        """Serve the application."""
+        """Serve the application.
+
+        The API is configured in the main process, workers must be forked so that
+        they inherit it instead of importing a blank application. The agent and the
+        preloaded objects are shared with the workers through copy-on-write.
+        """
+        if sys.platform != "win32":
+            multiprocessing.set_start_method("fork", force=True)
+
+            # The objects loaded so far are moved out of the collected generations,
+            # the collector of the workers would otherwise write to their pages and
+            # copy the memory shared with the main process
+            gc.collect()
+            gc.freeze()
+
         self._server.serve()
@@ -0,0 +1,88 @@
+"""Tests of the admission control of the agent endpoints."""
+
+import asyncio
+
+import pytest
+
+from fastagent.internal.admission import AdmissionRejectedError, ConcurrencyLimiter
+
+
+def test_full_queue_rejects_right_away() -> None:
+    """Requests beyond the slots and the queue are rejected without waiting."""
+    limiter = ConcurrencyLimiter(1, max_queue=0)
+
+    async def main() -> None:
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejectedError, match="Too many"):
+            await limiter.acquire()
+
+    asyncio.run(main())
+
+    assert limiter.active == 1
+    assert limiter.rejected == 1
+
+
+def test_released_slot_goes_to_the_oldest_waiter() -> None:
+    """The waiting requests are admitted in order."""
+    limiter = ConcurrencyLimiter(1, max_queue=2)
+    admitted = []
+
+    async def request(name: str) -> None:
+        await limiter.acquire()
+        admitted.append(name)
+
+    async def main() -> None:
+        await limiter.acquire()
+        waiters = [asyncio.ensure_future(request(name)) for name in "ab"]
+        await asyncio.sleep(0)
+        assert limiter.waiting == 2
+
+        limiter.release()
+        await asyncio.sleep(0)
+        assert admitted == ["a"]
+
+        limiter.release()
+        await asyncio.gather(*waiters)
+
+    asyncio.run(main())
+
+    assert admitted == ["a", "b"]
+    assert limiter.active == 1
+    assert limiter.waiting == 0
+
+
+def test_wait_times_out() -> None:
+    """A request waiting longer than the queue timeout is rejected."""
+    limiter = ConcurrencyLimiter(1, max_queue=1, queue_timeout=0.01)
+
+    async def main() -> None:
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejectedError, match="Timed out"):
+            await limiter.acquire()
+
+    asyncio.run(main())
+
+    assert limiter.waiting == 0
+    assert limiter.rejected == 1
+
+
+def test_cancelled_waiter_does_not_leak_a_slot() -> None:
+    """A waiter cancelled after being handed a slot gives it back."""
+    limiter = ConcurrencyLimiter(1, max_queue=1)
+
+    async def main() -> None:
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+
+        limiter.release()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        assert limiter.active == 0
+        await limiter.acquire()
+
+    asyncio.run(main())
+
+    assert limiter.active == 1
@@ -0,0 +1,112 @@
+"""Tests of the streamed batch of the agent router."""
+
+import asyncio
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.runnables import RunnableLambda
+
+from fastagent.integrations.langchain import create_langchain_router
+
+
+class _Doubler:
+    """Double the values, the smaller values taking longer."""
+
+    def __init__(self) -> None:
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, value: int) -> int:
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(0.01 * (10 - value))
+            if value == 0:
+                msg = "zero"
+                raise ValueError(msg)
+            return value * 2
+        finally:
+            self.running -= 1
+
+
+def _client(doubler: _Doubler | None = None, batch_concurrency: int = 8) -> TestClient:
+    """Create a client of a router serving the doubler."""
+    app = FastAPI()
+    app.include_router(
+        create_langchain_router(
+            RunnableLambda(doubler or _Doubler()), batch_concurrency=batch_concurrency
+        )
+    )
+    return TestClient(app)
+
+
+def test_results_are_sent_as_they_complete() -> None:
+    """Each line carries the index of its input, the fastest first."""
+    response = _client().post("/v1/agents/batch/stream", json={"inputs": [1, 5, 9]})
+
+    results = [json.loads(line) for line in response.iter_lines()]
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [(result["index"], result["output"]) for result in results] == [
+        (2, 18),
+        (1, 10),
+        (0, 2),
+    ]
+
+
+def test_failed_items_do_not_fail_the_batch() -> None:
+    """Invalid and failing items yield an error result."""
+    response = _client().post("/v1/agents/batch/stream", json={"inputs": [0, "x", 3]})
+
+    results = {
+        result["index"]: result for result in map(json.loads, response.iter_lines())
+    }
+
+    assert results[0]["error"]["status_code"] == 500
+    assert results[1]["error"]["status_code"] == 422
+    assert results[2]["output"] == 6
+
+
+def test_concurrency_is_bounded() -> None:
+    """The clients can lower the concurrency, but not raise it."""
+    doubler = _Doubler()
+    client = _client(doubler, batch_concurrency=2)
+
+    for query, expected in (
+        ("", 2),
+        ("?max_concurrency=1", 1),
+        ("?max_concurrency=5", 2),
+    ):
+        doubler.max_running = 0
+        response = client.post(
+            f"/v1/agents/batch/stream{query}", json={"inputs": [1, 2, 3, 4]}
+        )
+        assert len(list(response.iter_lines())) == 4
+        assert doubler.max_running == expected
+
+
+def test_event_stream() -> None:
+    """The results are sent as server sent events when the client accepts them."""
+    response = _client().post(
+        "/v1/agents/batch/stream",
+        json={"inputs": [1]},
+        headers={"Accept": "text/event-stream"},
+    )
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "event: data" in response.text
+    assert "event: end" in response.text
+
+
+def test_invalid_configs_are_rejected() -> None:
+    """A null config, or a config per input of the wrong length, is rejected."""
+    client = _client()
+
+    for body in (
+        {"inputs": [1], "config": None},
+        {"inputs": [1, 2], "config": [{}]},
+        {"inputs": 1},
+    ):
+        response = client.post("/v1/agents/batch/stream", json=body)
+        assert response.status_code == 422
@@ -0,0 +1,106 @@
+"""Tests of the coalescing of identical concurrent executions."""
+
+import asyncio
+
+import pytest
+
+from fastagent.internal.coalescing import Coalescer
+
+
+def test_concurrent_calls_share_one_execution() -> None:
+    """The calls with the same key arriving during the execution share its result."""
+    coalescer = Coalescer()
+    calls = 0
+
+    async def execute() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    async def main() -> list[tuple[int, bool]]:
+        return await asyncio.gather(*(coalescer.run(b"key", execute) for _ in range(3)))
+
+    results = asyncio.run(main())
+
+    assert results == [(1, False), (1, True), (1, True)]
+    assert coalescer.executions == 1
+    assert coalescer.coalesced == 2
+    assert coalescer.in_flight() == 0
+
+
+def test_different_keys_and_later_calls_execute_again() -> None:
+    """Only identical concurrent calls are coalesced."""
+    coalescer = Coalescer()
+    calls = 0
+
+    async def execute() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        return calls
+
+    async def main() -> None:
+        await asyncio.gather(coalescer.run(b"a", execute), coalescer.run(b"b", execute))
+        await coalescer.run(b"a", execute)
+
+    asyncio.run(main())
+
+    assert coalescer.executions == 3
+    assert coalescer.coalesced == 0
+
+
+def test_errors_are_raised_to_every_caller() -> None:
+    """A failed execution fails all the calls waiting for it."""
+    coalescer = Coalescer()
+
+    async def execute() -> None:
+        await asyncio.sleep(0)
+        msg = "failed"
+        raise ValueError(msg)
+
+    async def main() -> list[BaseException]:
+        return await asyncio.gather(
+            *(coalescer.run(b"key", execute) for _ in range(2)),
+            return_exceptions=True,
+        )
+
+    errors = asyncio.run(main())
+
+    assert all(isinstance(error, ValueError) for error in errors)
+
+
+def test_cancelled_caller_does_not_cancel_a_shared_execution() -> None:
+    """The execution goes on for the other callers, and stops once none waits."""
+    coalescer = Coalescer()
+    started = 0
+    finished = 0
+
+    async def execute() -> str:
+        nonlocal started, finished
+        started += 1
+        await asyncio.sleep(0.01)
+        finished += 1
+        return "done"
+
+    async def main() -> None:
+        first = asyncio.ensure_future(coalescer.run(b"key", execute))
+        second = asyncio.ensure_future(coalescer.run(b"key", execute))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        assert await second == ("done", True)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        # Nobody waits anymore, the execution is cancelled
+        alone = asyncio.ensure_future(coalescer.run(b"other", execute))
+        await asyncio.sleep(0)
+        alone.cancel()
+        await asyncio.sleep(0.02)
+
+    asyncio.run(main())
+
+    assert started == 2
+    assert finished == 1
+    assert coalescer.in_flight() == 0
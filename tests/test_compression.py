@@ -0,0 +1,109 @@
+"""Tests of the compression of the responses."""
+
+import asyncio
+import gzip
+
+import pytest
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.types import ASGIApp, Message
+
+from fastagent.internal.server import CompressionMiddleware
+from fastagent.internal.server.middlewares import _negotiate_encoding
+
+BODY = b"fastagent " * 200
+
+
+def _request(app: ASGIApp, accept_encoding: str) -> tuple[dict[str, str], bytes]:
+    """Send a request through the middleware and collect its response."""
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "query_string": b"",
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    }
+    messages: list[Message] = []
+    requests = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive() -> Message:
+        if requests:
+            return requests.pop()
+        # The client stays connected until the response is sent
+        await asyncio.Event().wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+
+    asyncio.run(CompressionMiddleware(app)(scope, receive, send))
+
+    headers = {name.decode(): value.decode() for name, value in messages[0]["headers"]}
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return headers, body
+
+
+def test_negotiate_encoding() -> None:
+    """The supported encoding with the highest quality is selected."""
+    encodings = ("zstd", "gzip")
+
+    assert _negotiate_encoding("gzip, zstd", encodings) == "zstd"
+    assert _negotiate_encoding("zstd;q=0.5, gzip", encodings) == "gzip"
+    assert _negotiate_encoding("zstd;q=0, gzip;q=0.1", encodings) == "gzip"
+    assert _negotiate_encoding("*", encodings) == "zstd"
+    assert _negotiate_encoding("GZIP;q=bad, br", encodings) is None
+    assert _negotiate_encoding("identity", encodings) is None
+    assert _negotiate_encoding("", encodings) is None
+
+
+def test_compresses_with_gzip() -> None:
+    """The body is compressed and advertised with its encoding."""
+    headers, body = _request(PlainTextResponse(BODY.decode()), "gzip")
+
+    assert headers["content-encoding"] == "gzip"
+    assert headers["content-length"] == str(len(body))
+    assert headers["vary"] == "Accept-Encoding"
+    assert gzip.decompress(body) == BODY
+
+
+def test_prefers_zstandard() -> None:
+    """Zstandard is selected when both the client and the server support it."""
+    zstandard = pytest.importorskip("zstandard")
+
+    headers, body = _request(PlainTextResponse(BODY.decode()), "gzip, zstd")
+
+    assert headers["content-encoding"] == "zstd"
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(body) == BODY
+
+
+def test_small_responses_are_not_compressed() -> None:
+    """A body under the minimum size is sent as is, but varies on the encoding."""
+    headers, body = _request(PlainTextResponse("small"), "gzip")
+
+    assert "content-encoding" not in headers
+    assert headers["vary"] == "Accept-Encoding"
+    assert body == b"small"
+
+
+def test_encoded_and_event_stream_responses_are_untouched() -> None:
+    """Already encoded bodies and server sent events pass through."""
+    encoded = Response(BODY, headers={"Content-Encoding": "br"})
+    headers, body = _request(encoded, "gzip")
+    assert headers["content-encoding"] == "br"
+    assert body == BODY
+
+    events = StreamingResponse(iter([BODY]), media_type="text/event-stream")
+    headers, body = _request(events, "gzip")
+    assert "content-encoding" not in headers
+    assert body == BODY
+
+
+def test_streamed_chunks_are_flushed() -> None:
+    """Each chunk of a streamed response can be decoded as soon as it is received."""
+    chunks = [b"first chunk ", b"second chunk"]
+    app = StreamingResponse(iter(chunks), headers={"Content-Length": "24"})
+
+    headers, body = _request(app, "gzip")
+
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    assert gzip.decompress(body) == b"".join(chunks)
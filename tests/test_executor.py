@@ -0,0 +1,110 @@
+"""Tests of the bounded executor of the synchronous agents."""
+
+import asyncio
+import contextvars
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from fastagent.integrations.dspy import create_dspy_router
+from fastagent.internal.executor import ExecutorBusyError, ProgramExecutor
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def test_runs_on_the_pool_with_the_caller_context() -> None:
+    """The function runs on a thread of the pool and sees the context variables."""
+    executor = ProgramExecutor(max_workers=1, max_pending=0)
+
+    def call() -> tuple[str, str | None]:
+        return threading.current_thread().name, request_id.get()
+
+    async def main() -> tuple[str, str | None]:
+        request_id.set("abc")
+        return await executor.run(call)
+
+    try:
+        name, value = asyncio.run(main())
+    finally:
+        executor.shutdown()
+
+    assert name.startswith("fastagent-program")
+    assert value == "abc"
+
+
+def test_keyword_arguments_may_be_named_func() -> None:
+    """The function is positional only, any keyword is passed to it."""
+    executor = ProgramExecutor(max_workers=1, max_pending=0)
+
+    def call(**kwargs: object) -> dict[str, object]:
+        return kwargs
+
+    try:
+        assert asyncio.run(executor.run(call, func=1)) == {"func": 1}
+    finally:
+        executor.shutdown()
+
+
+def test_rejects_calls_beyond_the_limit() -> None:
+    """Calls beyond the threads and the pending limit are rejected."""
+    executor = ProgramExecutor(max_workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def main() -> None:
+        running = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert (executor.busy, executor.waiting) == (1, 1)
+
+        with pytest.raises(ExecutorBusyError):
+            await executor.run(release.wait)
+
+        release.set()
+        await asyncio.gather(*running)
+        await asyncio.sleep(0)
+
+        # The slots are released once the calls are done
+        assert executor.in_flight == 0
+        assert await executor.run(lambda: 1) == 1
+
+    try:
+        asyncio.run(main())
+    finally:
+        release.set()
+        executor.shutdown()
+
+    assert executor.rejected == 1
+
+
+def test_router_returns_503_when_busy() -> None:
+    """A saturated executor answers with a 503 and a Retry-After header."""
+    executor = ProgramExecutor(max_workers=1, max_pending=0)
+    app = FastAPI()
+    app.include_router(create_dspy_router(lambda **kwargs: kwargs, executor=executor))
+    client = TestClient(app)
+
+    # The only thread is running a call
+    executor.in_flight = 1
+    response = client.post("/v1/agents/invoke", json={"input": {}})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert executor.rejected == 1
+
+
+def test_router_binds_the_inputs() -> None:
+    """The inputs are the keyword arguments of the program, even `func`."""
+    executor = ProgramExecutor(max_workers=2, max_pending=0)
+    app = FastAPI()
+    app.include_router(create_dspy_router(lambda **kwargs: kwargs, executor=executor))
+    client = TestClient(app)
+
+    try:
+        invoke = client.post("/v1/agents/invoke", json={"input": {"func": "a"}})
+        batch = client.post("/v1/agents/batch", json={"inputs": [{"x": 1}, {"x": 2}]})
+    finally:
+        executor.shutdown()
+
+    assert invoke.json() == {"output": {"func": "a"}}
+    assert batch.json() == {"output": [{"x": 1}, {"x": 2}]}
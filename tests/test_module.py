@@ -0,0 +1,57 @@
+"""Tests of the loading of the agents from their import string."""
+
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from fastagent.internal.module import ModuleLoader
+
+
+@pytest.fixture
+def project(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Path]:
+    """Create an agent package in a project directory."""
+    package = tmp_path / "loader_agent"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "tools.py").write_text("class Tools:\n    name = 'tools'\n")
+    (package / "main.py").write_text("from .tools import Tools\nagent = object()\n")
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    monkeypatch.setattr(ModuleLoader, "_cache", {})
+    yield tmp_path
+
+    for name in [name for name in sys.modules if name.startswith("loader_agent")]:
+        del sys.modules[name]
+
+
+@pytest.mark.usefixtures("project")
+def test_loads_from_the_project_directory() -> None:
+    """The package is imported from the current directory, with relative imports."""
+    module = ModuleLoader.load_from_string("loader_agent.main")
+
+    assert module is sys.modules["loader_agent.main"]
+    assert ModuleLoader.load_from_string("loader_agent.main:agent") is module.agent
+    assert ModuleLoader.load_from_string("loader_agent.main:Tools.name") == "tools"
+
+
+@pytest.mark.usefixtures("project")
+def test_objects_are_cached() -> None:
+    """The objects are cached by import string."""
+    agent = ModuleLoader.load_from_string("loader_agent.main:agent")
+    module = sys.modules["loader_agent.main"]
+    module.agent = object()
+
+    assert ModuleLoader.load_from_string("loader_agent.main:agent") is agent
+    assert "loader_agent.main:agent" in ModuleLoader._cache  # noqa: SLF001
+
+
+@pytest.mark.usefixtures("project")
+def test_missing_attribute_raises_an_import_error() -> None:
+    """A missing attribute is an import error, which is not cached."""
+    with pytest.raises(ImportError, match="no attribute missing"):
+        ModuleLoader.load_from_string("loader_agent.main:missing")
+
+    assert "loader_agent.main:missing" not in ModuleLoader._cache  # noqa: SLF001
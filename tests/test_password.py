@@ -0,0 +1,66 @@
+"""Tests of the password hashing and of its bounded executor."""
+
+import asyncio
+import threading
+
+import pytest
+
+from fastagent.internal.security.password import (
+    PasswordExecutor,
+    PasswordExecutorBusyError,
+    dummy_password_hash,
+    hash_password,
+    verify_password,
+)
+
+
+def test_verify_password() -> None:
+    """A hash only matches its own password."""
+    password_hash = hash_password("correct horse")
+
+    assert verify_password("correct horse", password_hash)
+    assert not verify_password("wrong horse", password_hash)
+
+
+def test_dummy_password_hash_is_computed_once() -> None:
+    """The dummy hash is cached and matches no usual password."""
+    assert dummy_password_hash() is dummy_password_hash()
+    assert not verify_password("", dummy_password_hash())
+
+
+def test_executor_runs_the_operations_off_the_loop() -> None:
+    """The operations run on the threads of the executor."""
+    executor = PasswordExecutor(max_workers=1, max_pending=0)
+
+    async def main() -> str:
+        return await executor.run(lambda: threading.current_thread().name)
+
+    try:
+        assert asyncio.run(main()).startswith("fastagent-password")
+    finally:
+        executor.shutdown()
+
+
+def test_executor_rejects_operations_beyond_the_limit() -> None:
+    """Operations beyond the workers and the pending limit are rejected."""
+    executor = PasswordExecutor(max_workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def main() -> None:
+        running = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        with pytest.raises(PasswordExecutorBusyError):
+            await executor.run(release.wait)
+
+        release.set()
+        await asyncio.gather(*running)
+
+        # The slots are released once the operations are done
+        assert await executor.run(lambda: 1) == 1
+
+    try:
+        asyncio.run(main())
+    finally:
+        release.set()
+        executor.shutdown()
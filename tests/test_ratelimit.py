@@ -0,0 +1,107 @@
+"""Tests of the token bucket rate limiting."""
+
+import multiprocessing
+from types import SimpleNamespace
+
+import pytest
+
+from fastagent.internal import ratelimit
+from fastagent.internal.ratelimit import (
+    MemoryStore,
+    RateLimiter,
+    SharedMemoryStore,
+    Store,
+)
+from fastagent.internal.server import rate_limit_key
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    """Control the monotonic clock of the stores."""
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=[MemoryStore, SharedMemoryStore])
+def store(request: pytest.FixtureRequest) -> Store:
+    """Create each store."""
+    return request.param()
+
+
+def test_burst_then_refill(store: Store, clock: list[float]) -> None:
+    """A bucket allows `burst` requests, then one per `1 / rate` seconds."""
+    assert [store.take("client", 2.0, 3) for _ in range(3)] == [None] * 3
+    assert store.take("client", 2.0, 3) == pytest.approx(0.5)
+
+    clock[0] += 0.5
+    assert store.take("client", 2.0, 3) is None
+    assert store.take("client", 2.0, 3) == pytest.approx(0.5)
+
+
+def test_refill_is_capped_at_the_burst(store: Store, clock: list[float]) -> None:
+    """An idle client does not accumulate more than `burst` tokens."""
+    store.take("client", 1.0, 2)
+
+    clock[0] += 60
+    assert [store.take("client", 1.0, 2) for _ in range(3)] == [None, None, 1.0]
+
+
+@pytest.mark.usefixtures("clock")
+def test_buckets_are_per_key(store: Store) -> None:
+    """The clients do not share their buckets."""
+    assert store.take("first", 1.0, 1) is None
+    assert store.take("first", 1.0, 1) is not None
+    assert store.take("second", 1.0, 1) is None
+
+
+def test_memory_store_evicts_the_oldest_bucket() -> None:
+    """A full shard drops its oldest bucket, which starts full again."""
+    store = MemoryStore(max_keys=1, shards=1)
+    store.take("first", 1e-6, 1)
+    store.take("second", 1e-6, 1)
+
+    assert store.take("first", 1e-6, 1) is None
+
+
+def _take(store: SharedMemoryStore, results: multiprocessing.Queue) -> None:
+    """Take a token in a forked worker."""
+    results.put(store.take("client", 1e-6, 1))
+
+
+def test_shared_memory_store_holds_across_processes() -> None:
+    """The bucket emptied by a forked worker is empty for the parent."""
+    context = multiprocessing.get_context("fork")
+    store = SharedMemoryStore(slots=16, locks=2)
+    results = context.Queue()
+
+    worker = context.Process(target=_take, args=(store, results))
+    worker.start()
+    worker.join()
+
+    assert results.get(timeout=5) is None
+    assert store.take("client", 1e-6, 1) is not None
+
+
+def test_rate_limiter_applies_the_limit_of_the_path_prefix() -> None:
+    """Only the paths of a limited group take a token."""
+    limiter = RateLimiter(MemoryStore(), {"/v1/agents": (1e-6, 1)})
+
+    assert limiter.check("/v1/agents/invoke", "ip:1") is None
+    assert limiter.check("/v1/agents/stream", "ip:1") is not None
+    assert limiter.check("/v1/agents/invoke", "ip:2") is None
+    assert limiter.check("/v1/healthcheck", "ip:1") is None
+    assert limiter.rejected == 1
+
+
+def test_rate_limit_key() -> None:
+    """Authenticated users are limited per user, anonymous clients per address."""
+    user = SimpleNamespace(user=SimpleNamespace(id=7))
+    anonymous = SimpleNamespace(user=SimpleNamespace(id=0))
+    client = ("10.0.0.1", 1234)
+
+    assert rate_limit_key({"state": {"context": user}, "client": client}) == "user:7"
+    assert rate_limit_key({"state": {"context": anonymous}, "client": client}) == (
+        "ip:10.0.0.1"
+    )
+    assert rate_limit_key({"client": None}) == "ip:"
@@ -0,0 +1,77 @@
+"""Tests of the cache of the invoke responses."""
+
+import asyncio
+
+import pytest
+
+from fastagent.internal.data import responses
+from fastagent.internal.data.responses import ResponseCache, cache_key
+
+
+def test_cache_key_ignores_the_tracing_fields() -> None:
+    """Tags, metadata and the order of the fields do not change the key."""
+    key = cache_key({"input": {"a": 1, "b": 2}, "config": {"tags": ["x"]}})
+
+    assert key == cache_key({"input": {"b": 2, "a": 1}, "config": {"metadata": {}}})
+    assert key == cache_key({"input": {"a": 1, "b": 2}})
+
+
+def test_cache_key_covers_the_output_fields() -> None:
+    """The input, the configurable config, the kwargs and the user change the key."""
+    key = cache_key({"input": "hi"})
+
+    assert key != cache_key({"input": "hello"})
+    assert key != cache_key({"input": "hi", "config": {"configurable": {"k": 1}}})
+    assert key != cache_key({"input": "hi", "kwargs": {"k": 1}})
+    assert key != cache_key({"input": "hi"}, user_id=1)
+    assert cache_key({"input": "hi"}, user_id=1) != cache_key({"input": "hi"}, 2)
+
+
+def test_cache_key_uses_the_config_of_the_modifier() -> None:
+    """The config derived from the request replaces the config of the body."""
+    payload = {"input": "hi", "config": {"configurable": {"tenant": "a"}}}
+
+    first = cache_key(payload, config={"configurable": {"tenant": "a"}})
+    second = cache_key(payload, config={"configurable": {"tenant": "b"}})
+
+    assert first == cache_key(payload)
+    assert first != second
+    # The values set by a modifier are not always JSON
+    assert cache_key(payload, config={"configurable": {"tenant": object}})
+
+
+def test_memory_tier_expires_the_entries(monkeypatch: pytest.MonkeyPatch) -> None:
+    """An entry is served until its TTL."""
+    now = [1000.0]
+    monkeypatch.setattr(responses.time, "monotonic", lambda: now[0])
+    cache = ResponseCache(ttl=10.0)
+
+    async def main() -> None:
+        assert await cache.set(b"key", b"body")
+        assert await cache.get(b"key") == (b"body", "memory")
+
+        now[0] += 11
+        assert await cache.get(b"key") is None
+
+    asyncio.run(main())
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_memory_tier_is_bounded() -> None:
+    """Large responses are not cached, the least recently used are evicted."""
+    cache = ResponseCache(max_entries=2, max_entry_bytes=4)
+
+    async def main() -> None:
+        assert not await cache.set(b"large", b"12345")
+        await cache.set(b"first", b"1")
+        await cache.set(b"second", b"2")
+        await cache.get(b"first")
+        await cache.set(b"third", b"3")
+
+        assert await cache.get(b"large") is None
+        assert await cache.get(b"second") is None
+        assert await cache.get(b"first") is not None
+        assert await cache.get(b"third") is not None
+
+    asyncio.run(main())
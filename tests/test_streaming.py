@@ -0,0 +1,60 @@
+"""Tests of the buffering of the streamed responses."""
+
+import asyncio
+from collections.abc import AsyncIterator
+
+from fastagent.internal.streaming import SLOW_CONSUMER_EVENT, EventStreamer
+
+
+async def _burst(count: int) -> AsyncIterator[bytes]:
+    """Produce the events without ever yielding to the loop."""
+    for i in range(count):
+        yield b"%d;" % i
+
+
+async def _read(streamer: EventStreamer, events: AsyncIterator[bytes]) -> bytes:
+    """Read a whole stream without waiting between the writes."""
+    return b"".join([chunk async for chunk in streamer.stream(events)])
+
+
+def test_burst_larger_than_the_buffer_does_not_close_a_fast_client() -> None:
+    """A burst filling the buffer before the response runs is not a slow client."""
+    streamer = EventStreamer(buffer_size=4, slow_consumer="close")
+
+    body = asyncio.run(_read(streamer, _burst(20)))
+
+    assert body == b"".join(b"%d;" % i for i in range(20))
+    assert streamer.slow_consumers == 0
+
+
+def test_slow_client_gets_the_queued_events_then_the_error() -> None:
+    """The events queued before a slow client is detected are not dropped."""
+    streamer = EventStreamer(
+        buffer_size=4, slow_consumer="close", slow_consumer_timeout=0.05
+    )
+
+    async def read_slowly() -> list[bytes]:
+        chunks = []
+        async for chunk in streamer.stream(_burst(20)):
+            chunks.append(chunk)
+            await asyncio.sleep(0.2)
+        return chunks
+
+    chunks = asyncio.run(read_slowly())
+
+    assert chunks[-1] == SLOW_CONSUMER_EVENT
+    body = b"".join(chunks[:-1])
+    # The events queued before the timeout are all sent, in order
+    assert body == b"".join(b"%d;" % i for i in range(body.count(b";")))
+    assert body.count(b";") >= 4
+    assert streamer.slow_consumers == 1
+
+
+def test_wait_policy_sends_every_event() -> None:
+    """The agent waits for the client with the `wait` policy."""
+    streamer = EventStreamer(buffer_size=2, slow_consumer="wait")
+
+    body = asyncio.run(_read(streamer, _burst(50)))
+
+    assert body.count(b";") == 50
+    assert streamer.slow_consumers == 0
@@ -0,0 +1,119 @@
+"""Tests of the cache of the authentication tokens."""
+
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from fastagent.internal.data import cache
+from fastagent.internal.data.cache import TokenCache
+from fastagent.internal.data.users import UserModel
+
+
+def _user(user_id: int) -> UserModel:
+    """Create a user."""
+    return UserModel(
+        id=user_id,
+        created_at=datetime.now(UTC),
+        name="user",
+        email=f"user{user_id}@example.com",
+        password_hash=b"",
+        version=1,
+    )
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    """Control the monotonic clock of the cache."""
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_valid_token_is_cached_until_the_ttl(clock: list[float]) -> None:
+    """A token expiring after the TTL of the cache is cached for the TTL."""
+    tokens = TokenCache(ttl=60.0)
+    tokens.set(b"token", _user(1), datetime.now(UTC) + timedelta(hours=1))
+
+    clock[0] += 59
+    entry = tokens.get(b"token")
+    assert entry is not None
+    assert entry.user.id == 1
+
+    clock[0] += 2
+    assert tokens.get(b"token") is None
+    assert tokens.stats() == {"hits": 1, "misses": 1, "size": 0}
+
+
+def test_ttl_is_capped_at_the_token_expiry(clock: list[float]) -> None:
+    """A token expiring before the TTL of the cache is not served once expired."""
+    tokens = TokenCache(ttl=60.0)
+    tokens.set(b"token", _user(1), datetime.now(UTC) + timedelta(seconds=10))
+
+    clock[0] += 9
+    assert tokens.get(b"token") is not None
+
+    clock[0] += 2
+    assert tokens.get(b"token") is None
+
+
+def test_expired_token_is_not_cached() -> None:
+    """A token already expired is never cached."""
+    tokens = TokenCache()
+    tokens.set(b"token", _user(1), datetime.now(UTC) - timedelta(seconds=1))
+
+    assert tokens.get(b"token") is None
+
+
+def test_invalid_token_is_cached_for_the_negative_ttl(clock: list[float]) -> None:
+    """An invalid token is cached without a user, for a shorter time."""
+    tokens = TokenCache(ttl=60.0, negative_ttl=5.0)
+    tokens.set_invalid(b"token")
+
+    entry = tokens.get(b"token")
+    assert entry is not None
+    assert entry.user is None
+
+    clock[0] += 6
+    assert tokens.get(b"token") is None
+
+
+def test_negative_caching_can_be_disabled() -> None:
+    """Invalid tokens are not cached without a negative TTL."""
+    tokens = TokenCache(negative_ttl=0)
+    tokens.set_invalid(b"token")
+
+    assert tokens.get(b"token") is None
+
+
+def test_invalidate_user_removes_only_their_tokens() -> None:
+    """The tokens of the other users stay cached."""
+    tokens = TokenCache()
+    expiry = datetime.now(UTC) + timedelta(hours=1)
+    tokens.set(b"first", _user(1), expiry)
+    tokens.set(b"second", _user(1), expiry)
+    tokens.set(b"other", _user(2), expiry)
+
+    tokens.invalidate_user(1)
+
+    assert tokens.get(b"first") is None
+    assert tokens.get(b"second") is None
+    assert tokens.get(b"other") is not None
+
+
+def test_least_recently_used_token_is_evicted() -> None:
+    """The cache is bounded, a read refreshes an entry."""
+    tokens = TokenCache(max_size=2)
+    expiry = datetime.now(UTC) + timedelta(hours=1)
+    tokens.set(b"first", _user(1), expiry)
+    tokens.set(b"second", _user(2), expiry)
+    tokens.get(b"first")
+
+    tokens.set(b"third", _user(3), expiry)
+
+    assert tokens.get(b"second") is None
+    assert tokens.get(b"first") is not None
+    assert tokens.get(b"third") is not None
+
+    # The evicted token is no longer tracked for its user
+    tokens.invalidate_user(2)
+    assert tokens.stats()["size"] == 2
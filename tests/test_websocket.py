@@ -0,0 +1,134 @@
+"""Tests of the runs multiplexed over a WebSocket connection."""
+
+import asyncio
+from collections.abc import AsyncIterator
+from typing import Any
+
+from fastapi import FastAPI, HTTPException, Request, status
+from fastapi.testclient import TestClient
+from langchain_core.runnables import RunnableGenerator
+from starlette.testclient import WebSocketTestSession
+
+from fastagent.integrations.langchain import create_langchain_router
+from fastagent.internal.admission import ConcurrencyLimiter
+from fastagent.internal.ratelimit import MemoryStore, RateLimiter
+
+
+async def _count(inputs: AsyncIterator[int]) -> AsyncIterator[int]:
+    """Count up to the input, forever for a negative input."""
+    async for value in inputs:
+        i = 0
+        while value < 0 or i < value:
+            i += 1
+            yield i
+            await asyncio.sleep(0.01 if value < 0 else 0)
+
+
+async def _modifier(config: dict[str, Any], request: Request) -> dict[str, Any]:
+    """Reject the runs of a forbidden tenant."""
+    if request.query_params.get("tenant") == "forbidden":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    return config
+
+
+def _client(**kwargs: object) -> TestClient:
+    """Create a client of a router serving the counter."""
+    app = FastAPI()
+    app.include_router(
+        create_langchain_router(
+            RunnableGenerator(_count), per_req_config_modifier=_modifier, **kwargs
+        )
+    )
+    return TestClient(app)
+
+
+def _receive_until(websocket: WebSocketTestSession, kind: str) -> list[dict[str, Any]]:
+    """Receive the messages until one of the kind."""
+    messages = [websocket.receive_json()]
+    while messages[-1]["type"] != kind:
+        messages.append(websocket.receive_json())
+    return messages
+
+
+def test_run_streams_its_chunks() -> None:
+    """The chunks of a run are sent with its id, followed by its end."""
+    with _client().websocket_connect("/v1/agents/ws") as websocket:
+        websocket.send_json({"type": "run", "id": "a", "input": 3})
+        messages = _receive_until(websocket, "end")
+
+    assert [message["data"] for message in messages[:-1]] == [1, 2, 3]
+    assert all(message["id"] == "a" for message in messages)
+
+
+def test_run_is_cancelled_in_band() -> None:
+    """A cancelled run stops while the connection stays open."""
+    with _client().websocket_connect("/v1/agents/ws") as websocket:
+        websocket.send_json({"type": "run", "id": "a", "input": -1})
+        websocket.receive_json()
+        websocket.send_json({"type": "cancel", "id": "a"})
+        assert _receive_until(websocket, "cancelled")[-1]["id"] == "a"
+
+        websocket.send_json({"type": "run", "id": "b", "input": 1})
+        assert _receive_until(websocket, "end")[-1]["id"] == "b"
+
+
+def test_invalid_messages_get_an_error() -> None:
+    """Invalid messages, duplicated and unknown runs get an error."""
+    with _client().websocket_connect("/v1/agents/ws") as websocket:
+        websocket.send_text("not json")
+        assert websocket.receive_json()["status_code"] == 422
+
+        websocket.send_json({"type": "run", "id": "a", "input": -1})
+        websocket.send_json({"type": "run", "id": "a", "input": 1})
+        assert _receive_until(websocket, "error")[-1]["status_code"] == 409
+
+        websocket.send_json({"type": "cancel", "id": "b"})
+        assert _receive_until(websocket, "error")[-1]["status_code"] == 404
+
+
+def test_modifier_rejects_the_runs() -> None:
+    """An HTTP error of the config modifier fails the run, not the connection."""
+    client = _client()
+
+    with client.websocket_connect("/v1/agents/ws?tenant=forbidden") as websocket:
+        for run_id in "ab":
+            websocket.send_json({"type": "run", "id": run_id, "input": 1})
+            error = websocket.receive_json()
+            assert (error["id"], error["status_code"]) == (run_id, 403)
+
+
+def test_runs_beyond_the_connection_limit_are_rejected() -> None:
+    """A connection has at most `websocket_max_runs` runs in progress."""
+    with _client(websocket_max_runs=1).websocket_connect("/v1/agents/ws") as websocket:
+        websocket.send_json({"type": "run", "id": "a", "input": -1})
+        websocket.send_json({"type": "run", "id": "b", "input": 1})
+        error = _receive_until(websocket, "error")[-1]
+
+    assert (error["id"], error["status_code"]) == ("b", 429)
+
+
+def test_runs_take_a_slot_of_the_limiter() -> None:
+    """A run is rejected when the concurrency limiter is full."""
+    client = _client(websocket_limiter=ConcurrencyLimiter(1, max_queue=0))
+
+    with client.websocket_connect("/v1/agents/ws") as websocket:
+        websocket.send_json({"type": "run", "id": "a", "input": -1})
+        websocket.receive_json()
+        websocket.send_json({"type": "run", "id": "b", "input": 1})
+        error = _receive_until(websocket, "error")[-1]
+
+    assert (error["id"], error["status_code"]) == ("b", 503)
+
+
+def test_runs_take_a_token_of_the_rate_limiter() -> None:
+    """A run is rejected once the bucket of the client is empty."""
+    limiter = RateLimiter(MemoryStore(), {"/v1/agents/ws": (1e-6, 1)})
+
+    with _client(rate_limiter=limiter).websocket_connect("/v1/agents/ws") as websocket:
+        websocket.send_json({"type": "run", "id": "a", "input": 1})
+        _receive_until(websocket, "end")
+        websocket.send_json({"type": "run", "id": "b", "input": 1})
+        error = websocket.receive_json()
+
+    assert (error["id"], error["status_code"]) == ("b", 429)
+    assert error["detail"]["retry_after"] > 0